@@ -5,16 +5,24 @@ import sys
 import configparser
 import logging
 import signal
+import time
 from abc import abstractmethod
 
 import bluetooth
 
+from eies_protocol import tracing
+from connection import Backoff, ServiceCache, DEFAULT_INITIAL_DELAY, DEFAULT_MAX_DELAY
+from framing import FrameDecoder, FramingError
+
 
 class Listener(object):
 
     def __init__(self, loglevel=logging.DEBUG):
         self.server_uuid = None
         self.server_name = None
+        self.reconnect_initial_delay = DEFAULT_INITIAL_DELAY
+        self.reconnect_max_delay = DEFAULT_MAX_DELAY
+        self.service_cache = ServiceCache()
 
         # Initialize logger
         logging.basicConfig(
@@ -33,7 +41,7 @@ class Listener(object):
     def payload(self, data):
         """
         do something after you got a message
-        :data: the data to do something with
+        :data: the data to do something with, one complete message
         :return:
         """
         self.logger.debug(f"Received data: {data}")
@@ -44,41 +52,95 @@ class Listener(object):
 
     def listen(self):
         """
-        listen on the connection
+        listen on the connection, reconnecting with backoff whenever the link drops
         :return:
         """
-        try:
-            search_server = bluetooth.find_service(uuid=self.server_uuid, name=self.server_name)
-
-            if len(search_server) == 0:
-                self.logger.info(f"Couldn't find bluetooth server {self.server_name}")
-                sys.exit(0)
-            elif len(search_server) > 1:
-                self.logger.error(f"Found more than one bluetooth server {search_server}")
-                sys.exit(1)
-
-            port = search_server[0]['port']
-            name = search_server[0]['name']
-            host = search_server[0]['host']
-
-            self.logger.info(f"Listening on {port}:{name}:{host}")
-
-            self.payload_setup()
-
+        self.payload_setup()
+        backoff = Backoff(self.reconnect_initial_delay, self.reconnect_max_delay)
+        while True:
+            sock = None
+            try:
+                sock = self.connect()
+                backoff.reset()
+                self.receive(sock)
+                self.logger.warning("BT connection closed by server")
+            except bluetooth.BluetoothError as e:
+                self.logger.error(f"Bluetooth connection error: {e}")
+            except FramingError as e:
+                # the next frame boundary is unknown, a new connection starts with a clean stream
+                self.logger.error(f"Dropping the connection, the stream is out of sync: {e}")
+            except Exception as e:
+                self.logger.exception(f"Unexpected error: {e}")
+            finally:
+                if sock is not None:
+                    sock.close()
+            delay = backoff.next_delay()
+            self.logger.info(f"Reconnecting in {delay:.2f}s (attempt {backoff.attempts})")
+            time.sleep(delay)
+
+    def connect(self):
+        """
+        Connect to the server, using the cached address of the last discovery if there is one.
+        :return: the connected socket
+        """
+        address = self.service_cache.address
+        if address is not None:
             sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
+            try:
+                sock.connect(address)
+                self.logger.info(f"BT Connected to cached {address}. Listening ...")
+                return sock
+            except bluetooth.BluetoothError as e:
+                sock.close()
+                self.logger.info(f"Cached address {address} failed ({e}), searching for the server")
+                self.service_cache.invalidate()
+
+        search_server = bluetooth.find_service(uuid=self.server_uuid, name=self.server_name)
+
+        if len(search_server) == 0:
+            raise bluetooth.BluetoothError(f"Couldn't find bluetooth server {self.server_name}")
+        elif len(search_server) > 1:
+            self.logger.error(f"Found more than one bluetooth server {search_server}")
+            sys.exit(1)
+
+        port = search_server[0]['port']
+        name = search_server[0]['name']
+        host = search_server[0]['host']
+
+        self.logger.info(f"Listening on {port}:{name}:{host}")
+
+        sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
+        try:
             sock.connect((host, port))
-            self.logger.info("BT Connected. Listening ...")
-
-
-            while True:
-                data = sock.recv(1024)
-                if data:
-                    self.logger.info(f"Data received: {data}")
-                    self.payload(data)
-        except bluetooth.BluetoothError as e:
-            self.logger.error(f"Bluetooth connection error: {e}")
-        except Exception as e:
-            self.logger.exception(f"Unexpected error: {e}")
+        except bluetooth.BluetoothError:
+            sock.close()
+            raise
+        self.service_cache.store(host, port)
+        self.logger.info("BT Connected. Listening ...")
+        return sock
+
+    def receive(self, sock):
+        """
+        Hand the received messages to payload until the server closes the connection.
+        :param sock: the connected socket
+        :raises FramingError: if the stream is out of sync, after handing over the messages before the bad frame
+        """
+        # the stream splits and merges writes, messages are reassembled from length prefixed frames
+        decoder = FrameDecoder()
+        while True:
+            data = sock.recv(1024)
+            if not data:
+                return
+            try:
+                frames, out_of_sync = decoder.feed(data), None
+            except FramingError as e:
+                frames, out_of_sync = e.payloads, e
+            for frame in frames:
+                frame = tracing.stamp_json(frame, "bt_receive")
+                self.logger.info(f"Data received: {frame}")
+                self.payload(frame)
+            if out_of_sync is not None:
+                raise out_of_sync
 
     def read_config(self, cfg: str):
         """
@@ -91,6 +153,11 @@ class Listener(object):
 
         self.server_uuid = config["Connect"]["uuid"]
         self.server_name = config["Connect"]["name"]
+        self.reconnect_initial_delay = config.getint(
+            "Connect", "reconnect_initial_delay_ms", fallback=int(DEFAULT_INITIAL_DELAY * 1000)) / 1000
+        self.reconnect_max_delay = config.getint(
+            "Connect", "reconnect_max_delay_ms", fallback=int(DEFAULT_MAX_DELAY * 1000)) / 1000
+        self.service_cache = ServiceCache(config.get("Connect", "service_cache", fallback=None))
 
         self.logger.info("Configuration loaded successfully")
 
@@ -1,14 +1,29 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import json
 import logging
 import signal
 import sys
 import configparser
+import threading
+import time
 
 from flask import Flask, request, jsonify
 import bluetooth
 
+from eies_protocol import timeline, tracing, wireprotocol
+from connection import Backoff, DEFAULT_REPLAY_AGE
+from bt_writer import DEFAULT_COALESCE_WINDOW, DEFAULT_MAX_QUEUE
+from fanout import Fanout, parse_groups
+from framing import encode_frames, DEFAULT_MAX_FRAME_SIZE
+
+SERVING_MODES = ("development", "production")
+WIRE_FORMATS = ("json", "binary")
+DEFAULT_THREADS = 8
+DEFAULT_SEND_TIMEOUT = 1.0  # seconds
+ACCEPT_BACKLOG = 8  # clients waiting to be accepted
+
 
 class BluetoothServer(object):
     def __init__(self):
@@ -17,9 +32,16 @@ class BluetoothServer(object):
         self.server_port = None
         self.server_uuid = None
         self.server_name = "Not Set"
+        self.send_queue_size = DEFAULT_MAX_QUEUE
+        self.coalesce_window = DEFAULT_COALESCE_WINDOW
+        self.mode = "development"
+        self.threads = DEFAULT_THREADS
+        self.replay_max_age = DEFAULT_REPLAY_AGE
+        self.wire_format = "json"
+        self.send_timeout = DEFAULT_SEND_TIMEOUT
+        self.groups = {}
         # These we need for the connection
         self.server_sock = None
-        self.client_sock = None
 
         # Initialize logger
         logging.basicConfig(
@@ -37,6 +59,15 @@ class BluetoothServer(object):
         # Initialize Flask app
         self.app = Flask(__name__)
         self.app.add_url_rule('/control', 'control', self.control, methods=['POST'])
+        self.app.add_url_rule('/control/batch', 'control_batch', self.control_batch, methods=['POST'])
+        self.app.add_url_rule('/timeline', 'timeline', self.upload_timeline, methods=['POST'])
+        self.app.add_url_rule('/timeline/start', 'timeline_start', self.start_timeline, methods=['POST'])
+        self.app.add_url_rule('/timeline/cancel', 'timeline_cancel', self.cancel_timeline, methods=['POST'])
+
+        # every client has its own writer, the only one using its socket, handlers just enqueue
+        self.clients = Fanout(self.groups, encode=self._frames, max_queue=self.send_queue_size,
+                              coalesce_window=self.coalesce_window, replay_max_age=self.replay_max_age,
+                              send_timeout=self.send_timeout, link_errors=(bluetooth.BluetoothError, OSError))
 
     def read_config(self):
         """
@@ -49,44 +80,170 @@ class BluetoothServer(object):
         self.server_port = int(config["Server"]["port"])
         self.server_uuid = config["Connect"]["uuid"]
         self.server_name = config["Connect"]["name"]
+        self.send_queue_size = config.getint("Server", "send_queue_size", fallback=DEFAULT_MAX_QUEUE)
+        self.coalesce_window = config.getint("Server", "coalesce_window_ms",
+                                             fallback=int(DEFAULT_COALESCE_WINDOW * 1000)) / 1000
+        self.mode = config.get("Server", "mode", fallback=self.mode)
+        self.threads = config.getint("Server", "threads", fallback=DEFAULT_THREADS)
+        self.replay_max_age = config.getint("Server", "replay_max_age_ms",
+                                            fallback=int(DEFAULT_REPLAY_AGE * 1000)) / 1000
+        self.wire_format = config.get("Server", "wire_format", fallback=self.wire_format)
+        self.send_timeout = config.getint("Server", "send_timeout_ms",
+                                          fallback=int(DEFAULT_SEND_TIMEOUT * 1000)) / 1000
+        if config.has_section("Groups"):
+            self.groups = parse_groups(config["Groups"])
+        if self.wire_format not in WIRE_FORMATS:
+            raise ValueError(f"Unknown wire format {self.wire_format}, expected one of {WIRE_FORMATS}")
+        if self.mode not in SERVING_MODES:
+            raise ValueError(f"Unknown serving mode {self.mode}, expected one of {SERVING_MODES}")
 
         self.logger.info("Configuration loaded successfully")
 
-    def send_data(self, data):
+    def _frames(self, messages) -> bytes:
         """
-        Send data over Bluetooth serial connection.
+        Encode several messages as length prefixed frames for one write over the Bluetooth serial connection.
+        Called by the writer thread of each client just before the write.
         """
-        try:
-            self.logger.info(f"Sending data: {data}")
-            self.client_sock.sendall(data.encode('utf-8'))
-        except bluetooth.BluetoothError as e:
-            self.logger.error(f"BluetoothError: {e}")
+        stamped = [tracing.stamp_json(data, "bt_send") for data in messages]
+        self.logger.info(f"Sending data: {stamped}")
+        return encode_frames(self._encode(data) for data in stamped)
+
+    def _encode(self, data: str) -> bytes:
+        """Encode a message for the link, cues are sent as binary records if configured."""
+        if self.wire_format == "binary":
+            return wireprotocol.compact(data)
+        return data.encode('utf-8')
 
     def control(self):
         """
         REST endpoint to receive control data and send over Bluetooth.
-        Expected JSON format: { "LED": "some_data" }
+        Expected JSON format: { "LED": "some_data", "group": "room1" }
+        An optional "trace" (an id or true) traces the JSON encoded message through the pipeline.
+        The optional group (see [Groups] of serverconfig.ini) selects the clients, all clients without it.
         """
         try:
             data = request.get_json()
-            if "LED" in data:
-                self.send_data(data["LED"])
-                return jsonify({"status": "success", "message": "Data sent"}), 200
+            if "LED" in data and self.clients.has_group(data.get("group")):
+                return self._submit([(self._prepare(data), 0, data.get("group"))])
             else:
                 return jsonify({"status": "error", "message": "Invalid input"}), 400
         except Exception as e:
             self.logger.exception("Error handling request")
             return jsonify({"status": "error", "message": str(e)}), 500
 
+    def control_batch(self):
+        """
+        REST endpoint to receive several commands at once and queue them for sending over Bluetooth.
+        Expected JSON format: { "commands": [ { "LED": "some_data", "offset": 250, "group": "room1" }, ... ] }
+        where the optional offset is the delay in milliseconds before the command is sent
+        and the optional group selects the clients like for /control.
+        Responds with 503 if no client has room for its commands in its send queue.
+        """
+        try:
+            data = request.get_json()
+            commands = data.get("commands") if isinstance(data, dict) else None
+            if not isinstance(commands, list) or not all(self._valid_command(command) for command in commands):
+                return jsonify({"status": "error", "message": "Invalid input"}), 400
+            return self._submit([(self._prepare(command), command.get("offset", 0) / 1000, command.get("group"))
+                                 for command in commands])
+        except Exception as e:
+            self.logger.exception("Error handling request")
+            return jsonify({"status": "error", "message": str(e)}), 500
+
+    def upload_timeline(self):
+        """
+        REST endpoint to upload the timeline of a whole show in one transfer, the clients compile it
+        and play it locally once started (see timeline.py).
+        Expected JSON format: { "name": "show", "cues": [ { "offset": 0, "action": "draw", "emotion": "fear" }, ... ],
+        "group": "room1" } where offset is in milliseconds after the start and group is optional.
+        """
+        try:
+            data = request.get_json()
+            if not isinstance(data, dict) or not self.clients.has_group(data.get("group")):
+                return jsonify({"status": "error", "message": "Invalid input"}), 400
+            message = {"action": "timeline", "name": data.get("name"), "cues": data.get("cues")}
+            try:
+                timeline.parse(message)
+            except ValueError as e:
+                return jsonify({"status": "error", "message": str(e)}), 400
+            encoded = json.dumps(message)
+            if len(encoded.encode("utf-8")) > DEFAULT_MAX_FRAME_SIZE:
+                return jsonify({"status": "error", "message": "Timeline exceeds the frame size of the link"}), 413
+            return self._submit([(encoded, 0, data.get("group"))])
+        except Exception as e:
+            self.logger.exception("Error handling request")
+            return jsonify({"status": "error", "message": str(e)}), 500
+
+    def start_timeline(self):
+        """
+        REST endpoint to start an uploaded timeline.
+        Expected JSON format: { "name": "show", "at": 1767225600.0, "group": "room1" } where the optional
+        at (unix time in seconds) or delay (milliseconds) schedules the start, it starts right away without.
+        """
+        return self._show_command("start", ("name",) + wireprotocol.SCHEDULE_KEYS)
+
+    def cancel_timeline(self):
+        """
+        REST endpoint to stop the running show.
+        Expected JSON format: { "group": "room1" } where group is optional.
+        """
+        return self._show_command("cancel", ())
+
+    def _show_command(self, action, keys):
+        try:
+            data = request.get_json(silent=True) or {}
+            if not isinstance(data, dict) or not self.clients.has_group(data.get("group")) \
+                    or (action == "start" and not isinstance(data.get("name"), str)):
+                return jsonify({"status": "error", "message": "Invalid input"}), 400
+            message = dict({key: data[key] for key in keys if key in data}, action=action)
+            return self._submit([(json.dumps(message), 0, data.get("group"))])
+        except Exception as e:
+            self.logger.exception("Error handling request")
+            return jsonify({"status": "error", "message": str(e)}), 500
+
+    def _submit(self, messages):
+        """
+        Queue (message, delay, group) tuples for their clients.
+        A client whose queue is full misses the messages, the request only fails if all clients do.
+        """
+        accepted, addressed = self.clients.submit(messages)
+        if addressed and not accepted:
+            self.logger.warning(f"Send queues full: {self.clients.stats}")
+            return jsonify({"status": "error", "message": "Send queue full, retry later"}), 503, {"Retry-After": "1"}
+        return jsonify({"status": "success", "message": f"{len(messages)} commands queued",
+                        "clients": accepted, "skipped": addressed - accepted}), 202
+
+    def _valid_command(self, command) -> bool:
+        offset = command.get("offset", 0) if isinstance(command, dict) else None
+        return isinstance(command, dict) and isinstance(command.get("LED"), str) \
+            and isinstance(offset, (int, float)) and not isinstance(offset, bool) and offset >= 0 \
+            and self.clients.has_group(command.get("group"))
+
+    @staticmethod
+    def _prepare(command) -> str:
+        """Return the message of a command, started as trace if requested."""
+        led = command["LED"]
+        if command.get("trace"):
+            trace_id = command["trace"] if isinstance(command["trace"], str) else None
+            led = json.dumps(tracing.start(json.loads(led), trace_id))
+        return led
+
     def run(self):
         """
-        Start the Flask server using configuration settings.
+        Start the REST server using configuration settings.
+        In production mode the app is served by waitress with a pool of handler threads,
+        all in this process as it owns the Bluetooth connections.
         """
         self.logger.info("Starting Bluetooth server")
+        self.clients.start()
         self.connect_bt()
-        self.logger.info(f"Starting REST server on {self.host}:{self.server_port}")
-        # deactivate reloader as this opens a second BT connection
-        self.app.run(host=self.host, port=self.server_port, debug=True, use_reloader=False)
+        self.logger.info(f"Starting REST server on {self.host}:{self.server_port} ({self.mode})")
+        if self.mode == "production":
+            from waitress import serve
+            serve(self.app, host=self.host, port=self.server_port, threads=self.threads)
+        else:
+            # deactivate reloader as this opens a second BT connection
+            self.app.run(host=self.host, port=self.server_port, debug=True, use_reloader=False)
 
     def terminate(self, signum, frame):
         """
@@ -97,9 +254,13 @@ class BluetoothServer(object):
         sys.exit(0)
 
     def connect_bt(self):
+        """
+        Advertise the service and accept clients in the background,
+        a client that connects again replaces its previous connection.
+        """
         self.server_sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
         self.server_sock.bind(("", bluetooth.PORT_ANY))
-        self.server_sock.listen(1) # advertise needs a listen on the socket else bluetooth error
+        self.server_sock.listen(ACCEPT_BACKLOG) # advertise needs a listen on the socket else bluetooth error
         port = self.server_sock.getsockname()[1]
 
         bluetooth.advertise_service(self.server_sock, self.server_name, service_id=self.server_uuid,
@@ -108,16 +269,29 @@ class BluetoothServer(object):
                                     )
         self.logger.info(f"Waiting for connection on RFCOMM channel {port}")
 
-        self.client_sock, client_info = self.server_sock.accept()
-        self.logger.info(f"Accepted connection from {client_info}")
+        threading.Thread(target=self._accept_clients, daemon=True).start()
+
+    def _accept_clients(self):
+        backoff = Backoff()
+        while True:
+            try:
+                client_sock, client_info = self.server_sock.accept()
+            except bluetooth.BluetoothError as e:
+                delay = backoff.next_delay()
+                self.logger.error(f"Accepting failed: {e}, retrying in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            backoff.reset()
+            self.logger.info(f"Accepted connection from {client_info}")
+            self.clients.connect(client_info[0], client_sock)
 
-def __del__(self):
-    if self.client_sock:
-        self.logger.info("closing client connection")
-        self.client_sock.close()
-    if self.server_sock:
-        self.logger.info("closing server")
-        self.server_sock.close()
+    def __del__(self):
+        if getattr(self, "clients", None):
+            self.logger.info("closing client connections")
+            self.clients.close(timeout=1.0)
+        if self.server_sock:
+            self.logger.info("closing server")
+            self.server_sock.close()
 
 if __name__ == '__main__':
     bt_server = BluetoothServer()
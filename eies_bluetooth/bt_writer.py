@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_MAX_QUEUE = 256
+DEFAULT_COALESCE_WINDOW = 0.005  # seconds
+
+
+class BluetoothWriter:
+    """
+    Single owner of the Bluetooth connection, everything that is sent goes through its thread.
+    Producers (the HTTP handlers) only hand their messages to a queue and return, they never wait for the link.
+    Messages can be scheduled with a delay, all messages that are due within the coalesce window
+    are handed to the send function together, so they go out in a single write.
+    """
+
+    def __init__(self, send: Callable[[List[str]], None], max_queue: int = DEFAULT_MAX_QUEUE,
+                 coalesce_window: float = DEFAULT_COALESCE_WINDOW):
+        """
+        :param send: sends a list of messages in one write, only ever called from the writer thread
+        :param max_queue: maximum number of queued messages, more are rejected
+        :param coalesce_window: seconds to wait for more messages before writing
+        """
+        self.send = send
+        self.max_queue = max_queue
+        self.coalesce_window = coalesce_window
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.sent = 0
+        self.failed = 0
+        self.writes = 0
+        self.rejected = 0
+
+        self._inbox: "queue.SimpleQueue[Optional[List[Tuple[float, str]]]]" = queue.SimpleQueue()
+        self._queued = 0  # messages submitted but not yet sent
+        self._queued_lock = threading.Lock()
+        self._scheduled: List[Tuple[float, int, str]] = []  # heap of (due, sequence, message), writer thread only
+        self._sequence = itertools.count()
+        self._running = False
+        self._worker: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the writer thread."""
+        if self._running:
+            return
+        self._running = True
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the writer thread, queued messages are dropped."""
+        self._running = False
+        self._inbox.put(None)  # wake up the writer
+        if self._worker:
+            self._worker.join(timeout)
+            self._worker = None
+
+    def submit(self, messages: Iterable[Tuple[str, float]]) -> bool:
+        """
+        Queue messages, either all or none of them.
+        :param messages: (message, delay in seconds) tuples
+        :return: False if the queue has no room for all messages
+        """
+        now = time.monotonic()
+        batch = [(now + max(0.0, delay), message) for message, delay in messages]
+        with self._queued_lock:
+            if self._queued + len(batch) > self.max_queue:
+                self.rejected += len(batch)
+                return False
+            self._queued += len(batch)
+        self._inbox.put(batch)
+        return True
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of messages waiting to be sent."""
+        return self._queued
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queue_depth": self.queue_depth,
+            "sent": self.sent,
+            "failed": self.failed,
+            "writes": self.writes,
+            "rejected": self.rejected,
+        }
+
+    def _receive(self, timeout: Optional[float]) -> bool:
+        """
+        Move submitted messages from the inbox to the schedule.
+        :param timeout: seconds to wait for the first submission, None waits forever
+        :return: False if nothing arrived in time
+        """
+        try:
+            batch = self._inbox.get(timeout=timeout) if timeout is None or timeout > 0 else self._inbox.get_nowait()
+        except queue.Empty:
+            return False
+        if batch is not None:
+            for due, message in batch:
+                heapq.heappush(self._scheduled, (due, next(self._sequence), message))
+        return True
+
+    def _next_batch(self) -> List[str]:
+        """Wait for the next due message, then collect everything due within the coalesce window."""
+        while self._running:
+            now = time.monotonic()
+            if self._scheduled and self._scheduled[0][0] <= now:
+                break
+            self._receive(self._scheduled[0][0] - now if self._scheduled else None)
+        if not self._running:
+            return []
+        deadline = time.monotonic() + self.coalesce_window
+        while self._running and len(self._scheduled) < self.max_queue:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._receive(remaining):
+                break
+        batch = []
+        while self._scheduled and self._scheduled[0][0] <= deadline:
+            batch.append(heapq.heappop(self._scheduled)[2])
+        with self._queued_lock:
+            self._queued -= len(batch)
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self.send(batch)
+                self.sent += len(batch)
+            except Exception as error:
+                self.failed += len(batch)
+                self.logger.error(f"Error sending {len(batch)} messages: {error}")
+            self.writes += 1
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers to keep the Bluetooth link alive: reconnect backoff, the cached service address
+and the buffer of messages that could not be sent while the link was down.
+"""
+import collections
+import json
+import logging
+import os
+import threading
+import time
+from typing import Deque, List, Optional, Tuple
+
+DEFAULT_INITIAL_DELAY = 0.05  # seconds
+DEFAULT_MAX_DELAY = 5.0  # seconds
+DEFAULT_REPLAY_AGE = 1.0  # seconds
+DEFAULT_REPLAY_SIZE = 256
+
+
+class Backoff:
+    """
+    Exponentially growing delays between reconnect attempts, reset after a successful connect.
+    """
+
+    def __init__(self, initial: float = DEFAULT_INITIAL_DELAY, maximum: float = DEFAULT_MAX_DELAY,
+                 factor: float = 2.0):
+        """
+        :param initial: seconds to wait before the first retry
+        :param maximum: upper bound of the delay in seconds
+        :param factor: growth of the delay per failed attempt
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        """Return the delay before the next attempt and count the attempt."""
+        delay = min(self.maximum, self.initial * self.factor ** self.attempts)
+        self.attempts += 1
+        return delay
+
+    def reset(self):
+        self.attempts = 0
+
+
+class ServiceCache:
+    """
+    Remembers the (host, port) of the last discovered server, so reconnects and restarts
+    can skip the SDP lookup, which takes seconds.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        :param path: file to keep the address across restarts, only kept in memory if None
+        """
+        self.path = path
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._address: Optional[Tuple[str, int]] = None
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as cache_file:
+                    host, port = json.load(cache_file)
+                self._address = (str(host), int(port))
+            except (OSError, ValueError, TypeError) as e:
+                self.logger.warning(f"Ignoring unreadable service cache {path}: {e}")
+
+    @property
+    def address(self) -> Optional[Tuple[str, int]]:
+        return self._address
+
+    def store(self, host: str, port: int):
+        self._address = (host, port)
+        if self.path:
+            try:
+                with open(self.path, "w", encoding="utf-8") as cache_file:
+                    json.dump([host, port], cache_file)
+            except OSError as e:
+                self.logger.warning(f"Could not write service cache {self.path}: {e}")
+
+    def invalidate(self):
+        """Forget the address, e.g. after connecting to it failed."""
+        self._address = None
+        if self.path and os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                self.logger.warning(f"Could not remove service cache {self.path}: {e}")
+
+
+class ReplayBuffer:
+    """
+    Keeps messages that could not be sent while the link is down.
+    Only messages younger than max_age are replayed, older cues are stale by then.
+    """
+
+    def __init__(self, max_age: float = DEFAULT_REPLAY_AGE, max_size: int = DEFAULT_REPLAY_SIZE):
+        """
+        :param max_age: seconds a message stays eligible for replay
+        :param max_size: maximum number of buffered messages, the oldest ones are dropped
+        """
+        self.max_age = max_age
+        self._messages: Deque[Tuple[float, str]] = collections.deque(maxlen=max_size)
+        self._lock = threading.Lock()
+
+    def extend(self, messages: List[str]):
+        now = time.monotonic()
+        with self._lock:
+            self._messages.extend((now, message) for message in messages)
+
+    def drain(self) -> List[str]:
+        """Remove and return all messages that are still young enough, in the order they were added."""
+        oldest = time.monotonic() - self.max_age
+        with self._lock:
+            messages = [message for added, message in self._messages if added >= oldest]
+            self._messages.clear()
+        return messages
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._messages)
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Fan-out of the messages of one server to many Bluetooth clients.
+Every client has its own writer thread, send queue and replay buffer, so a slow or dead client
+only ever delays and loses its own messages.
+"""
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from bt_writer import BluetoothWriter, DEFAULT_COALESCE_WINDOW, DEFAULT_MAX_QUEUE
+from connection import ReplayBuffer, DEFAULT_REPLAY_AGE
+
+ALL_CLIENTS = "all"
+
+
+def parse_groups(section: Dict[str, str]) -> Dict[str, List[str]]:
+    """
+    Read the client groups of a config section, each option is a comma separated list of client addresses.
+    :raises ValueError: for a group named ALL_CLIENTS, which always means every client
+    """
+    groups = {}
+    for name, addresses in section.items():
+        if name == ALL_CLIENTS:
+            raise ValueError(f"The group {ALL_CLIENTS} can not be configured, it contains every client")
+        groups[name] = [address.strip().upper() for address in addresses.split(",") if address.strip()]
+    return groups
+
+
+class ClientLink:
+    """
+    Connection to one client, known by its address, that outlives disconnects of the client.
+    Messages are sent by its own writer thread, while the client is disconnected they are buffered for replay.
+    """
+
+    def __init__(self, address: str, encode: Callable[[List[str]], bytes], max_queue: int = DEFAULT_MAX_QUEUE,
+                 coalesce_window: float = DEFAULT_COALESCE_WINDOW, replay_max_age: float = DEFAULT_REPLAY_AGE,
+                 send_timeout: Optional[float] = None, link_errors: Tuple[type, ...] = (OSError,)):
+        """
+        :param address: Bluetooth address of the client
+        :param encode: turns a list of messages into the bytes of one write
+        :param max_queue: maximum number of messages queued for the client, more are rejected
+        :param coalesce_window: seconds to wait for more messages before writing
+        :param replay_max_age: seconds a message stays eligible for replay after a reconnect
+        :param send_timeout: seconds a write may block before the client counts as dead, None blocks forever
+        :param link_errors: errors of the socket that disconnect the client
+        """
+        self.address = address
+        self.encode = encode
+        self.send_timeout = send_timeout
+        self.link_errors = link_errors
+        self.logger = logging.getLogger(f"{self.__class__.__name__} {address}")
+        self.sock: Any = None
+        self.replay = ReplayBuffer(replay_max_age, max_queue)
+        self.writer = BluetoothWriter(self._send, max_queue=max_queue, coalesce_window=coalesce_window)
+        self._lock = threading.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self.sock is not None
+
+    def start(self):
+        self.writer.start()
+
+    def attach(self, sock):
+        """Use the socket of a (re)connected client and replay what it missed."""
+        if self.send_timeout is not None:
+            sock.settimeout(self.send_timeout)
+        with self._lock:
+            previous, self.sock = self.sock, sock
+        if previous is not None:
+            previous.close()
+        self._replay()
+
+    def submit(self, messages: List[Tuple[str, float]]) -> bool:
+        """Queue (message, delay in seconds) tuples for the client, False if its queue has no room."""
+        return self.writer.submit(messages)
+
+    def close(self, timeout: Optional[float] = None):
+        self.writer.stop(timeout)
+        with self._lock:
+            sock, self.sock = self.sock, None
+        if sock is not None:
+            sock.close()
+
+    def _send(self, messages: List[str]):
+        """Called by the writer thread, messages are buffered while the client is disconnected."""
+        sock = self.sock
+        if sock is None:
+            self.replay.extend(messages)
+            if self.sock is not None:
+                # the client connected meanwhile
+                self._replay()
+            return
+        try:
+            sock.sendall(self.encode(messages))
+        except self.link_errors as e:
+            self.logger.error(f"Sending failed: {e}, buffering {len(messages)} messages")
+            self.replay.extend(messages)
+            with self._lock:
+                disconnected = self.sock is sock
+                if disconnected:
+                    self.sock = None
+            if disconnected:
+                sock.close()
+            else:
+                # the client reconnected meanwhile
+                self._replay()
+
+    def _replay(self):
+        messages = self.replay.drain()
+        if messages:
+            self.logger.info(f"Replaying {len(messages)} buffered messages")
+            self.writer.submit((message, 0) for message in messages)
+
+
+class Fanout:
+    """
+    Tracks the clients of the server and hands each message to the clients of its group.
+    Clients of configured groups are known from the start, so messages to them are buffered until they connect.
+    """
+
+    def __init__(self, groups: Optional[Dict[str, List[str]]] = None, **link_options):
+        """
+        :param groups: client addresses per group name, see parse_groups
+        :param link_options: passed on to every ClientLink, at least encode
+        """
+        self.groups = {name: [address.upper() for address in addresses] for name, addresses in (groups or {}).items()}
+        self.link_options = link_options
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._links: Dict[str, ClientLink] = {}
+        self._lock = threading.Lock()
+        self._started = False
+        # messages to all clients while no client is known yet, handed to the first one
+        self.unaddressed = ReplayBuffer(link_options.get("replay_max_age", DEFAULT_REPLAY_AGE),
+                                        link_options.get("max_queue", DEFAULT_MAX_QUEUE))
+        for addresses in self.groups.values():
+            for address in addresses:
+                self._link(address)
+
+    def start(self):
+        """Start the writer threads of the known clients and of all clients that connect later."""
+        with self._lock:
+            self._started = True
+            links = list(self._links.values())
+        for link in links:
+            link.start()
+
+    def close(self, timeout: Optional[float] = None):
+        with self._lock:
+            links = list(self._links.values())
+        for link in links:
+            link.close(timeout)
+
+    def connect(self, address: str, sock) -> ClientLink:
+        """Attach the socket of a client that connected, a reconnect replaces its previous socket."""
+        link = self._link(address.upper())
+        link.attach(sock)
+        messages = self.unaddressed.drain()
+        if messages:
+            self.logger.info(f"Handing {len(messages)} buffered messages to {link.address}")
+            link.submit([(message, 0) for message in messages])
+        return link
+
+    def has_group(self, group: Optional[str]) -> bool:
+        return group is None or group == ALL_CLIENTS or group in self.groups
+
+    def clients(self, group: Optional[str] = None) -> List[ClientLink]:
+        """
+        Return the clients of the group, all known clients for None or ALL_CLIENTS.
+        :raises KeyError: for an unknown group
+        """
+        with self._lock:
+            if group is None or group == ALL_CLIENTS:
+                return list(self._links.values())
+            return [self._links[address] for address in self.groups[group]]
+
+    def submit(self, messages: Iterable[Tuple[str, float, Optional[str]]]) -> Tuple[int, int]:
+        """
+        Queue messages for the clients of their group. Each client takes either all or none of its messages,
+        a client with a full queue does not keep the others from getting theirs.
+        :param messages: (message, delay in seconds, group) tuples, group None is all clients
+        :return: (number of clients that took their messages, number of clients addressed)
+        :raises KeyError: for an unknown group
+        """
+        per_client: Dict[ClientLink, List[Tuple[str, float]]] = {}
+        unaddressed = []
+        for message, delay, group in messages:
+            clients = self.clients(group)
+            if not clients and group in (None, ALL_CLIENTS):
+                unaddressed.append(message)
+            for client in clients:
+                per_client.setdefault(client, []).append((message, delay))
+        if unaddressed:
+            self.logger.warning(f"No client connected, buffering {len(unaddressed)} messages")
+            self.unaddressed.extend(unaddressed)
+        accepted = 0
+        for client, client_messages in per_client.items():
+            if client.submit(client_messages):
+                accepted += 1
+            else:
+                self.logger.warning(f"Send queue of {client.address} full, dropping {len(client_messages)} messages")
+        return accepted, len(per_client)
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {link.address: dict(link.writer.stats, connected=link.connected, replay=len(link.replay))
+                for link in self.clients()}
+
+    def _link(self, address: str) -> ClientLink:
+        with self._lock:
+            link = self._links.get(address)
+            if link is None:
+                link = self._links[address] = ClientLink(address, **self.link_options)
+                if self._started:
+                    link.start()
+            return link
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import struct
+from typing import Iterable, List
+
+# every frame starts with the length of its payload as 4 byte unsigned int (big endian)
+HEADER = struct.Struct(">I")
+DEFAULT_MAX_FRAME_SIZE = 1024 * 1024
+
+
+class FramingError(ValueError):
+    """Raised for frames that can not be valid, the stream is out of sync."""
+
+    def __init__(self, message: str, payloads: Iterable[bytes] = ()):
+        """
+        :param payloads: frames completed before the invalid one, they are valid and still have to be handled
+        """
+        super().__init__(message)
+        self.payloads = list(payloads)
+
+
+def encode_frame(payload: bytes) -> bytes:
+    """
+    Prefix the payload with its length.
+    :param payload: message bytes
+    :return: frame bytes
+    """
+    return HEADER.pack(len(payload)) + payload
+
+
+def encode_frames(payloads: Iterable[bytes]) -> bytes:
+    """
+    Pack several payloads into one buffer, so they can go out in a single write.
+    :param payloads: message bytes
+    :return: frame bytes
+    """
+    return b"".join(encode_frame(payload) for payload in payloads)
+
+
+class FrameDecoder:
+    """
+    Reassembles frames from a stream that splits and merges writes arbitrarily.
+    """
+
+    def __init__(self, max_frame_size: int = DEFAULT_MAX_FRAME_SIZE):
+        """
+        :param max_frame_size: larger frames are rejected as the stream is most likely out of sync
+        """
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """
+        Add received data and return all frames that are complete now.
+        :param data: received bytes
+        :return: payloads of the completed frames
+        :raises FramingError: on a frame larger than max_frame_size, the data from its header on is dropped,
+                              the frames completed before it are in FramingError.payloads
+        """
+        self._buffer += data
+        payloads = []
+        offset = 0
+        while len(self._buffer) - offset >= HEADER.size:
+            length, = HEADER.unpack_from(self._buffer, offset)
+            if length > self.max_frame_size:
+                self._buffer.clear()
+                raise FramingError(f"Frame of {length} bytes exceeds {self.max_frame_size} bytes", payloads)
+            end = offset + HEADER.size + length
+            if end > len(self._buffer):
+                break
+            payloads.append(bytes(self._buffer[offset + HEADER.size:end]))
+            offset = end
+        del self._buffer[:offset]
+        return payloads
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered bytes of incomplete frames."""
+        return len(self._buffer)
@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+from bt_writer import BluetoothWriter
+
+
+class SendStub:
+    def __init__(self):
+        self.batches = []
+        self.sent = threading.Event()
+
+    def __call__(self, messages):
+        self.batches.append(list(messages))
+        self.sent.set()
+
+
+def wait_for_sent(writer, amount, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while writer.stats["sent"] < amount and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return writer.stats["sent"]
+
+
+@pytest.fixture
+def send():
+    return SendStub()
+
+
+@pytest.fixture
+def writer(send):
+    writer = BluetoothWriter(send, max_queue=4, coalesce_window=0.02)
+    yield writer
+    writer.stop(timeout=1.0)
+
+
+def test_coalesces_due_messages_into_one_write(writer, send):
+    assert writer.submit([("a", 0), ("b", 0), ("c", 0)])
+    writer.start()
+
+    assert wait_for_sent(writer, 3) == 3
+    assert send.batches == [["a", "b", "c"]]
+    assert writer.stats["writes"] == 1
+
+
+def test_sends_in_order_of_offset(writer, send):
+    writer.start()
+    assert writer.submit([("late", 0.15), ("early", 0), ("later", 0.3)])
+
+    assert wait_for_sent(writer, 3) == 3
+    assert [message for batch in send.batches for message in batch] == ["early", "late", "later"]
+    assert len(send.batches) == 3
+
+
+def test_rejects_batch_exceeding_queue(writer, send):
+    assert writer.submit([("a", 10), ("b", 10), ("c", 10)])
+    assert not writer.submit([("d", 0), ("e", 0)])
+
+    assert writer.queue_depth == 3
+    assert writer.stats["rejected"] == 2
+
+
+def test_keeps_running_after_send_error(send):
+    calls = []
+
+    def broken_send(messages):
+        calls.append(messages)
+        if len(calls) == 1:
+            raise OSError("link down")
+
+    writer = BluetoothWriter(broken_send, coalesce_window=0)
+    writer.start()
+    try:
+        writer.submit([("a", 0)])
+        deadline = time.monotonic() + 2.0
+        while not writer.stats["failed"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        writer.submit([("b", 0)])
+        assert wait_for_sent(writer, 1) == 1
+    finally:
+        writer.stop(timeout=1.0)
+    assert calls == [["a"], ["b"]]
+    assert writer.stats["failed"] == 1  # the failed write is not counted as sent
+
+
+def test_concurrent_producers_share_one_sender(send):
+    threads = []
+    writer = BluetoothWriter(lambda messages: threads.append(threading.get_ident()) or send(messages),
+                             max_queue=1000, coalesce_window=0.001)
+    writer.start()
+
+    def produce(name):
+        for index in range(50):
+            assert writer.submit([(f"{name}-{index}", 0)])
+
+    producers = [threading.Thread(target=produce, args=(name,)) for name in range(8)]
+    try:
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+        assert wait_for_sent(writer, 400) == 400
+    finally:
+        writer.stop(timeout=1.0)
+
+    assert len(set(threads)) == 1
+    received = [message for batch in send.batches for message in batch]
+    for name in range(8):
+        assert [message for message in received if message.startswith(f"{name}-")] == \
+               [f"{name}-{index}" for index in range(50)]
+    assert writer.queue_depth == 0
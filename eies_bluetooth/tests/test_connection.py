@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+from connection import Backoff, ReplayBuffer, ServiceCache
+
+
+def test_backoff_grows_to_maximum_and_resets():
+    backoff = Backoff(initial=0.05, maximum=0.3, factor=2)
+
+    assert [backoff.next_delay() for _ in range(5)] == pytest.approx([0.05, 0.1, 0.2, 0.3, 0.3])
+    backoff.reset()
+    assert backoff.next_delay() == pytest.approx(0.05)
+
+
+def test_service_cache_survives_restart(tmp_path):
+    path = str(tmp_path / "service.json")
+    ServiceCache(path).store("AA:BB:CC:DD:EE:FF", 3)
+
+    cache = ServiceCache(path)
+    assert cache.address == ("AA:BB:CC:DD:EE:FF", 3)
+
+    cache.invalidate()
+    assert cache.address is None
+    assert ServiceCache(path).address is None
+
+
+def test_service_cache_ignores_broken_file(tmp_path):
+    path = tmp_path / "service.json"
+    path.write_text("not json")
+
+    assert ServiceCache(str(path)).address is None
+
+
+def test_replay_drops_stale_messages(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    buffer = ReplayBuffer(max_age=1.0)
+
+    buffer.extend(["stale"])
+    now[0] += 0.8
+    buffer.extend(["fresh", "fresher"])
+    now[0] += 0.5
+
+    assert buffer.drain() == ["fresh", "fresher"]
+    assert len(buffer) == 0
+    assert buffer.drain() == []
+
+
+def test_replay_keeps_newest_when_full():
+    buffer = ReplayBuffer(max_size=2)
+    buffer.extend(["a", "b", "c"])
+
+    assert buffer.drain() == ["b", "c"]
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from fanout import Fanout, parse_groups
+
+
+class SocketStub:
+    def __init__(self, block=None, error=None):
+        self.written = []
+        self.closed = False
+        self.timeout = None
+        self.block = block
+        self.error = error
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def sendall(self, data):
+        if self.block is not None:
+            self.block.wait(2.0)
+        if self.error is not None:
+            raise self.error
+        self.written.append(data)
+
+    def close(self):
+        self.closed = True
+
+    def messages(self):
+        return [message for data in self.written for message in data.decode().split("|")]
+
+
+def encode(messages):
+    return "|".join(messages).encode()
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+@pytest.fixture
+def fanout():
+    fanout = Fanout({"panels": ["aa:01", "AA:02"], "speakers": ["AA:03"]}, encode=encode, max_queue=2,
+                    coalesce_window=0, send_timeout=0.5)
+    fanout.start()
+    yield fanout
+    fanout.close(timeout=1.0)
+
+
+def test_parse_groups():
+    assert parse_groups({"panels": "aa:01, AA:02,", "empty": ""}) == {"panels": ["AA:01", "AA:02"], "empty": []}
+    with pytest.raises(ValueError):
+        parse_groups({"all": "AA:01"})
+
+
+def test_messages_go_to_their_group(fanout):
+    sockets = {address: SocketStub() for address in ("AA:01", "AA:02", "AA:03")}
+    for address, sock in sockets.items():
+        fanout.connect(address, sock)
+
+    assert fanout.submit([("cue", 0, "panels"), ("sound", 0, "speakers"), ("everyone", 0, "all")]) == (3, 3)
+
+    assert wait_until(lambda: sum(len(sock.messages()) for sock in sockets.values()) == 6)
+    assert sockets["AA:01"].messages() == ["cue", "everyone"]
+    assert sockets["AA:02"].messages() == ["cue", "everyone"]
+    assert sockets["AA:03"].messages() == ["sound", "everyone"]
+    assert sockets["AA:01"].timeout == 0.5
+    with pytest.raises(KeyError):
+        fanout.submit([("cue", 0, "lights")])
+
+
+def test_slow_client_does_not_stall_the_others(fanout):
+    unblock = threading.Event()
+    slow, fast = SocketStub(block=unblock), SocketStub()
+    fanout.connect("AA:01", slow)
+    fanout.connect("AA:02", fast)
+    try:
+        for index in range(4):
+            fanout.submit([(f"cue {index}", 0, "panels")])
+            assert wait_until(lambda: len(fast.messages()) == index + 1)
+
+        # the queue of the slow client filled up, it misses messages while the fast one got all
+        assert fanout.clients("panels")[0].writer.stats["rejected"] > 0
+        assert fanout.submit([("late", 0, "panels")])[1] == 2
+    finally:
+        unblock.set()
+
+
+def test_dead_client_is_disconnected_and_replayed_on_reconnect(fanout):
+    dead, alive = SocketStub(error=OSError("timed out")), SocketStub()
+    link = fanout.connect("AA:01", dead)
+    fanout.connect("AA:02", alive)
+
+    fanout.submit([("cue", 0, "panels")])
+
+    assert wait_until(lambda: not link.connected)
+    assert dead.closed
+    assert alive.messages() == ["cue"]
+    reconnected = SocketStub()
+    fanout.connect("aa:01", reconnected)
+    assert wait_until(lambda: reconnected.messages() == ["cue"])
+
+
+def test_known_clients_get_their_messages_once_connected(fanout):
+    fanout.submit([("cue", 0, "speakers")])
+    assert wait_until(lambda: len(fanout.clients("speakers")[0].replay) == 1)
+
+    sock = SocketStub()
+    fanout.connect("AA:03", sock)
+
+    assert wait_until(lambda: sock.messages() == ["cue"])
+
+
+def test_messages_before_any_client_go_to_the_first_one():
+    fanout = Fanout(encode=encode, coalesce_window=0)
+    fanout.start()
+    try:
+        assert fanout.submit([("cue", 0, None)]) == (0, 0)
+        sock = SocketStub()
+        fanout.connect("AA:01", sock)
+
+        assert wait_until(lambda: sock.messages() == ["cue"])
+        assert list(fanout.stats) == ["AA:01"]
+    finally:
+        fanout.close(timeout=1.0)
@@ -0,0 +1,49 @@
+import pytest
+
+from framing import FrameDecoder, FramingError, encode_frame, encode_frames
+
+
+def test_roundtrip_in_one_write():
+    messages = [b'{"action": "draw", "emotion": "fear"}', b"", b"\x01\x02\x03"]
+    decoder = FrameDecoder()
+
+    assert decoder.feed(encode_frames(messages)) == messages
+    assert decoder.pending == 0
+
+
+def test_reassembles_split_writes():
+    message = b'{"action": "play", "emotion": "anger", "duration": 10}'
+    stream = encode_frame(message) * 2
+    decoder = FrameDecoder()
+
+    received = []
+    for position in range(0, len(stream), 3):
+        received += decoder.feed(stream[position:position + 3])
+
+    assert received == [message, message]
+
+
+def test_incomplete_frame_is_kept():
+    decoder = FrameDecoder()
+
+    assert decoder.feed(encode_frame(b"complete") + encode_frame(b"incomplete")[:-2]) == [b"complete"]
+    assert decoder.pending == 4 + len(b"incomplete") - 2
+    assert decoder.feed(b"te") == [b"incomplete"]
+
+
+def test_oversized_frame():
+    decoder = FrameDecoder(max_frame_size=8)
+
+    with pytest.raises(FramingError):
+        decoder.feed(encode_frame(b"way too long"))
+    assert decoder.pending == 0
+
+
+def test_frames_before_oversized_frame_are_kept():
+    decoder = FrameDecoder(max_frame_size=8)
+
+    with pytest.raises(FramingError) as error:
+        decoder.feed(encode_frames([b"first", b"second", b"way too long", b"lost"]))
+
+    assert error.value.payloads == [b"first", b"second"]
+    assert decoder.pending == 0
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import threading
+from typing import Iterator
+
+from pydub import AudioSegment
+from pydub.utils import ratio_to_db
+
+DEFAULT_PERIOD = 50  # ms
+SILENCE_GAIN = -120  # dB, the same floor pydub uses for fading
+
+
+class LoopingStream:
+    """
+    Streams a sound looped seamlessly to a given duration, one period at a time.
+    Fade-in and fade-out are applied as gain envelope on each period while streaming,
+    so neither memory nor the time to the first sample depend on the duration.
+    """
+
+    def __init__(self, sound: AudioSegment, duration: int, fade_time: int, period: int = DEFAULT_PERIOD):
+        """
+        :param sound: the source that is looped
+        :param duration: duration of the stream in milliseconds
+        :param fade_time: fade in and fade out time in milliseconds
+        :param period: length of the streamed chunks in milliseconds
+        """
+        if len(sound) == 0:
+            raise ValueError("Can not loop an empty sound")
+        self.sound = sound
+        self.duration = duration
+        self.fade_time = min(fade_time, duration // 2)
+        self.period = period
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """End the stream after the current period."""
+        self._stopped.set()
+
+    def __iter__(self) -> Iterator[AudioSegment]:
+        position = 0
+        while position < self.duration and not self._stopped.is_set():
+            length = min(self.period, self._next_breakpoint(position) - position)
+            yield self._envelope(self._slice(position, length), position, position + length)
+            position += length
+
+    def _next_breakpoint(self, position: int) -> int:
+        """The envelope is linear between breakpoints, periods must not span them."""
+        for breakpoint in (self.fade_time, self.duration - self.fade_time, self.duration):
+            if breakpoint > position:
+                return breakpoint
+        return self.duration
+
+    def _slice(self, position: int, length: int) -> AudioSegment:
+        offset = position % len(self.sound)
+        chunk = self.sound[offset:offset + length]
+        while len(chunk) < length:  # wrap around the end of the loop
+            chunk += self.sound[:length - len(chunk)]
+        return chunk
+
+    def _gain(self, position: int) -> float:
+        if self.fade_time <= 0:
+            return 1.0
+        return max(0.0, min(1.0, position / self.fade_time, (self.duration - position) / self.fade_time))
+
+    def _envelope(self, chunk: AudioSegment, start: int, end: int) -> AudioSegment:
+        from_gain, to_gain = self._gain(start), self._gain(end)
+        if from_gain == to_gain == 1.0:
+            return chunk
+        return chunk.fade(from_gain=self._to_db(from_gain), to_gain=self._to_db(to_gain), start=0, end=len(chunk))
+
+    @staticmethod
+    def _to_db(gain: float) -> float:
+        return max(SILENCE_GAIN, ratio_to_db(gain)) if gain > 0 else SILENCE_GAIN
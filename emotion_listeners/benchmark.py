@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Load test of the renderers: a synthetic or recorded cue stream is published over ZMQ into the
+LED panel and sound listeners, which draw on the emulated matrix and play into a stand-in sink.
+Reports throughput, latency percentiles, CPU and RSS and compares them against a saved baseline.
+"""
+import argparse
+import json
+import logging
+import random
+import resource
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import zmq
+
+from eies_protocol import tracing, wireprotocol
+from eies_protocol.emotions import Emotion
+from eventloop import EventLoop
+
+Cue = Tuple[float, Dict[str, Any]]  # (seconds since the start, message)
+
+RENDERERS = ("led", "sound")
+SCENARIOS = ("steady", "bursts", "replay")
+# metrics compared against the baseline, True if larger is better
+COMPARED = {"throughput_per_s": True, "latency_p50_ms": False, "latency_p95_ms": False,
+            "latency_p99_ms": False, "cpu_percent": False, "max_rss_kb": False}
+DEFAULT_TOLERANCE = 10.0  # percent
+
+
+def random_cue(rng: random.Random, renderers: Iterable[str]) -> Dict[str, Any]:
+    emotion = rng.choice(list(Emotion)).value
+    if rng.choice(list(renderers)) == "led":
+        return {"action": "draw", "emotion": emotion, "transition": rng.choice((0, 250, 500))}
+    return {"action": "play", "emotion": emotion, "duration": rng.randint(1, 5), "fade_time": 200}
+
+
+def steady(rate: float, duration: float, renderers: Iterable[str] = RENDERERS, seed: int = 0) -> Iterator[Cue]:
+    """Cues at a constant rate per second."""
+    rng = random.Random(seed)
+    for index in range(int(rate * duration)):
+        yield index / rate, random_cue(rng, renderers)
+
+
+def bursts(rate: float, duration: float, burst_size: int = 10, renderers: Iterable[str] = RENDERERS,
+           seed: int = 0) -> Iterator[Cue]:
+    """
+    Bursts of cues with Poisson distributed arrivals, on average rate cues per second.
+    Cues within a burst are 1ms apart.
+    """
+    rng = random.Random(seed)
+    at = rng.expovariate(rate / burst_size)
+    while at < duration:
+        for index in range(burst_size):
+            yield at + index / 1000, random_cue(rng, renderers)
+        at += rng.expovariate(rate / burst_size)
+
+
+def replay(lines: Iterable[str]) -> Iterator[Cue]:
+    """
+    Replay recorded cues, JSON lines of {"at": seconds since the start, "message": {...}}.
+    """
+    for line in lines:
+        if line.strip():
+            record = json.loads(line)
+            yield float(record["at"]), record["message"]
+
+
+class SinkStandIn:
+    """Audio sink that consumes chunks as fast as they come instead of playing them."""
+
+    def __init__(self):
+        self.played_ms = 0
+
+    def write(self, chunk):
+        self.played_ms += len(chunk)
+
+    def close(self):
+        pass
+
+
+def create_renderer(name: str, address: str, context: zmq.Context):
+    """Create a renderer with stand-ins for the hardware, imported on demand like in renderers.py."""
+    if name == "led":
+        from ledpanelemotioncontroller import LEDPanelEmotionController
+        return LEDPanelEmotionController(address, context=context, matrix_backend="emulator")
+    from playbackengine import PlaybackEngine
+    from soundservercontroller import SoundListenerController
+    return SoundListenerController(address, playback=PlaybackEngine(sink=SinkStandIn()), context=context)
+
+
+def publish(socket: zmq.Socket, cues: Iterable[Cue], encoding: str) -> int:
+    """
+    Publish the cues at their time like led_panel_client_bt.py does.
+    JSON cues are traced to measure their latency, binary cues can not carry a trace.
+    :return: number of published cues
+    """
+    sequences: Dict[bytes, int] = {}
+    started = time.monotonic()
+    published = 0
+    for at, message in cues:
+        delay = started + at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if encoding == "json":
+            data = json.dumps(tracing.start(dict(message), hop="zmq_publish")).encode("utf-8")
+        else:
+            data = wireprotocol.encode(message)
+        topic = wireprotocol.topic(data)
+        sequence = sequences[topic] = sequences.get(topic, 0) + 1
+        socket.send_multipart([topic, wireprotocol.SEQUENCE.pack(sequence), data])
+        published += 1
+    return published
+
+
+def summarize(name: str, snapshot: Dict[str, Dict], elapsed: float) -> Dict[str, Any]:
+    """Condense the metrics snapshot of a renderer."""
+    stages = snapshot["stages"]
+    latency = stages.get("hop total", {})
+    messages = snapshot["counters"].get("messages", 0)
+    return {
+        "renderer": name,
+        "messages": messages,
+        "throughput_per_s": round(messages / elapsed, 2) if elapsed else 0.0,
+        "latency_p50_ms": latency.get("p50_ms"),
+        "latency_p95_ms": latency.get("p95_ms"),
+        "latency_p99_ms": latency.get("p99_ms"),
+        "counters": snapshot["counters"],
+        "stages": {stage: summary for stage, summary in stages.items() if not stage.startswith("hop ")},
+    }
+
+
+def run(cues: Iterable[Cue], renderers: Iterable[str] = RENDERERS, encoding: str = "json",
+        address: str = "tcp://127.0.0.1", settle: float = 0.5) -> Dict[str, Any]:
+    """
+    Drive the renderers with the cues and measure them.
+    :param cues: the cue stream, see steady, bursts and replay
+    :param renderers: names of the renderers to run
+    :param encoding: json (traced, with latencies) or binary
+    :param address: interface to publish on, a random port is used
+    :param settle: seconds to wait for subscriptions before and for processing after publishing
+    :return: results per renderer and for the process
+    """
+    context = zmq.Context()
+    publisher = context.socket(zmq.PUB)
+    port = publisher.bind_to_random_port(address)
+    loop = EventLoop(context)
+    listeners = {}
+    for name in renderers:
+        listener = create_renderer(name, f"{address}:{port}", context)
+        listener.metrics_interval = 0
+        listener.start(loop)
+        listeners[name] = listener
+    loop.start()
+    try:
+        time.sleep(settle)  # let the subscriptions reach the publisher
+        for listener in listeners.values():
+            listener.metrics.snapshot(reset=True)
+        usage_before = resource.getrusage(resource.RUSAGE_SELF)
+        started = time.monotonic()
+        published = publish(publisher, cues, encoding)
+        time.sleep(settle)
+        elapsed = time.monotonic() - started
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        results = {name: summarize(name, listener.metrics.snapshot(), elapsed) for name, listener in listeners.items()}
+    finally:
+        loop.stop(timeout=5.0)
+        publisher.close(linger=0)
+        context.term()
+    cpu = usage.ru_utime - usage_before.ru_utime + usage.ru_stime - usage_before.ru_stime
+    return {
+        "published": published,
+        "elapsed_s": round(elapsed, 3),
+        "cpu_percent": round(cpu / elapsed * 100, 1),
+        "max_rss_kb": usage.ru_maxrss,
+        "renderers": results,
+    }
+
+
+def flatten(results: Dict[str, Any]) -> Dict[str, float]:
+    """The compared metrics as {"led.throughput_per_s": ..., "cpu_percent": ...}."""
+    values = {key: results[key] for key in COMPARED if results.get(key) is not None}
+    for name, renderer in results["renderers"].items():
+        values.update({f"{name}.{key}": renderer[key] for key in COMPARED if renderer.get(key) is not None})
+    return values
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any],
+            tolerance: float = DEFAULT_TOLERANCE) -> List[Tuple[str, float, float, float, bool]]:
+    """
+    Compare the results against the baseline.
+    :param tolerance: percent a metric may get worse before it counts as regression
+    :return: (metric, baseline, current, change in percent, regressed) for every metric in both
+    """
+    current, previous = flatten(results), flatten(baseline)
+    rows = []
+    for metric in sorted(set(current) & set(previous)):
+        before, after = previous[metric], current[metric]
+        change = (after - before) / before * 100 if before else 0.0
+        larger_is_better = COMPARED[metric.rsplit(".", 1)[-1]]
+        regressed = (-change if larger_is_better else change) > tolerance
+        rows.append((metric, before, after, round(change, 1), regressed))
+    return rows
+
+
+def report(results: Dict[str, Any], comparison: Optional[List[Tuple]] = None) -> str:
+    lines = [f"published {results['published']} cues in {results['elapsed_s']}s, "
+             f"cpu {results['cpu_percent']}%, max rss {results['max_rss_kb']} kB"]
+    for name, renderer in results["renderers"].items():
+        lines.append(f"{name:<6} {renderer['messages']:>6} msgs {renderer['throughput_per_s']:>9.1f}/s  "
+                     f"latency p50 {renderer['latency_p50_ms']} p95 {renderer['latency_p95_ms']} "
+                     f"p99 {renderer['latency_p99_ms']} ms  {renderer['counters']}")
+    if comparison:
+        lines.append(f"{'metric':<28}{'baseline':>12}{'current':>12}{'change':>9}")
+        for metric, before, after, change, regressed in comparison:
+            lines.append(f"{metric:<28}{before:>12}{after:>12}{change:>8}%" + ("  REGRESSION" if regressed else ""))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the renderers with a synthetic or recorded cue stream.")
+    parser.add_argument("scenario", choices=SCENARIOS)
+    parser.add_argument("--rate", type=float, default=50, help="cues per second (steady, bursts)")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of cues (steady, bursts)")
+    parser.add_argument("--burst-size", type=int, default=10, help="cues per burst (bursts)")
+    parser.add_argument("--recording", help="JSON lines of recorded cues (replay)")
+    parser.add_argument("--renderers", nargs="+", choices=RENDERERS, default=list(RENDERERS))
+    parser.add_argument("--encoding", choices=("json", "binary"), default="json",
+                        help="binary cues are not traced, no latencies are measured then")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results as baseline to this file")
+    parser.add_argument("--baseline", help="compare against the results in this file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="percent a metric may get worse before it fails the comparison")
+    parser.add_argument("--loglevel", default="WARNING", help="log level of the renderers")
+    args = parser.parse_args(argv)
+    # configured before the renderers are created, so their per message logging does not distort the results
+    logging.basicConfig(level=args.loglevel)
+
+    if args.scenario == "steady":
+        cues = steady(args.rate, args.duration, args.renderers, args.seed)
+    elif args.scenario == "bursts":
+        cues = bursts(args.rate, args.duration, args.burst_size, args.renderers, args.seed)
+    else:
+        if not args.recording:
+            parser.error("replay needs --recording")
+        with open(args.recording, encoding="utf-8") as recording:
+            cues = list(replay(recording))
+
+    results = run(cues, args.renderers, args.encoding)
+    comparison = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline:
+            comparison = compare(results, json.load(baseline), args.tolerance)
+    print(report(results, comparison))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as baseline:
+            json.dump(results, baseline, indent=2, sort_keys=True)
+    return 1 if comparison and any(row[-1] for row in comparison) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Audio rendering on NumPy arrays of (frames, channels) samples.
+Every step works on one array in place where it can, instead of the full buffer copy
+each pydub transform (apply_gain, fade_in, fade_out, *, slicing) makes.
+"""
+from typing import Optional
+
+import numpy as np
+from pydub import AudioSegment
+
+SAMPLE_WIDTH = 2  # bytes, rendered sounds are 16 bit
+FULL_SCALE = np.iinfo(np.int16).max
+_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+
+def samples(sound: AudioSegment) -> np.ndarray:
+    """Return the samples of the sound as (frames, channels) array, a read-only view of its data."""
+    if sound.sample_width not in _DTYPES:
+        sound = sound.set_sample_width(4)  # 24 bit has no NumPy type
+    return np.frombuffer(sound.raw_data, dtype=_DTYPES[sound.sample_width]).reshape(-1, sound.channels)
+
+
+def segment(data: np.ndarray, frame_rate: int) -> AudioSegment:
+    """Wrap 16 bit (frames, channels) samples into an AudioSegment."""
+    return AudioSegment(data=data.astype(np.int16, copy=False).tobytes(), sample_width=SAMPLE_WIDTH,
+                        frame_rate=frame_rate, channels=data.shape[1])
+
+
+def normalize_peak(data: np.ndarray) -> np.ndarray:
+    """
+    Scale the samples in place, so the loudest one is at full scale of 16 bit samples.
+    :param data: float32 samples
+    """
+    peak = np.max(np.abs(data)) if data.size else 0
+    if peak > 0:
+        data *= FULL_SCALE / peak
+    return data
+
+
+def resample(data: np.ndarray, from_rate: int, to_rate: int) -> np.ndarray:
+    """
+    Resample by linear interpolation, good enough for the emotion sounds and only done once per source.
+    :param data: float32 samples
+    :return: the samples at to_rate, data itself if the rates match
+    """
+    if from_rate == to_rate or not len(data):
+        return data
+    frames = max(1, round(len(data) * to_rate / from_rate))
+    positions = np.arange(frames, dtype=np.float64) * (from_rate / to_rate)
+    original = np.arange(len(data), dtype=np.float64)
+    resampled = np.empty((frames, data.shape[1]), dtype=np.float32)
+    for channel in range(data.shape[1]):
+        resampled[:, channel] = np.interp(positions, original, data[:, channel])
+    return resampled
+
+
+def prepare(sound: AudioSegment, frame_rate: Optional[int] = None) -> AudioSegment:
+    """
+    Peak normalize a decoded sound as 16 bit samples, resampled to the frame rate of the device if given.
+    """
+    data = normalize_peak(samples(sound).astype(np.float32))
+    rate = frame_rate or sound.frame_rate
+    data = resample(data, sound.frame_rate, rate)
+    return segment(np.rint(data, out=data), rate)
+
+
+def tile(data: np.ndarray, frames: int) -> np.ndarray:
+    """Loop the samples seamlessly into a new array of the given number of frames."""
+    if not len(data):
+        raise ValueError("Can not loop an empty sound")
+    return np.resize(data, (frames, data.shape[1]))
+
+
+def fade(data: np.ndarray, fade_frames: int) -> np.ndarray:
+    """
+    Apply a linear fade in and fade out envelope in place, only the faded frames are touched.
+    The fades are shortened to half of the sound if it is too short for them.
+    """
+    fade_frames = min(fade_frames, len(data) // 2)
+    if fade_frames <= 0:
+        return data
+    ramp = np.linspace(0.0, 1.0, fade_frames, endpoint=False, dtype=np.float32)[:, np.newaxis]
+    head, tail = data[:fade_frames], data[len(data) - fade_frames:]
+    np.multiply(head, ramp, out=head, casting="unsafe")
+    np.multiply(tail, ramp[::-1], out=tail, casting="unsafe")
+    return data
+
+
+def render(sound: AudioSegment, duration: int, fade_time: int) -> AudioSegment:
+    """
+    Loop a prepared 16 bit sound to the duration and fade it in and out.
+    :param duration: duration in milliseconds
+    :param fade_time: fade in and fade out time in milliseconds
+    """
+    frames = sound.frame_rate * duration // 1000
+    data = fade(tile(samples(sound), frames), sound.frame_rate * fade_time // 1000)
+    return segment(data, sound.frame_rate)
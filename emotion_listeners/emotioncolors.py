@@ -1,4 +1,4 @@
-from emotions import Emotion
+from eies_protocol.emotions import Emotion
 
 
 class EmotionColors:
@@ -1,6 +1,6 @@
 import os.path
 
-from emotions import Emotion
+from eies_protocol.emotions import Emotion
 
 class EmotionSounds:
 
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import zmq
+
+
+class Timer:
+    """
+    Handle of a callback scheduled on the event loop.
+    """
+
+    def __init__(self, when: float, callback: Callable[..., Any], args: tuple):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """Do not run the callback, if it did not run yet."""
+        self.cancelled = True
+
+
+class EventLoop:
+    """
+    Runs several ZMQ listeners on one context in a single thread driven by a zmq.Poller.
+    Timers run their callbacks on the same thread, so callbacks and message handling never race.
+    """
+
+    def __init__(self, context: Optional[zmq.Context] = None):
+        """
+        :param context: ZMQ context shared by the listeners, the global instance if not given
+        """
+        self.context = context if context is not None else zmq.Context.instance()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._poller = zmq.Poller()
+        self._listeners: Dict[zmq.Socket, Any] = {}
+        self._timers: List[tuple] = []  # heap of (when, sequence, Timer)
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # other threads wake up the poller through an inproc socket pair
+        address = f"inproc://eventloop-{id(self)}"
+        self._wake_receiver = self.context.socket(zmq.PAIR)
+        self._wake_receiver.bind(address)
+        self._wake_sender = self.context.socket(zmq.PAIR)
+        self._wake_sender.connect(address)
+        self._poller.register(self._wake_receiver, zmq.POLLIN)
+
+    def add(self, listener):
+        """
+        Poll the socket of the listener and hand its messages to listener.handle_message.
+        Call before the loop runs or from the loop thread.
+        """
+        self._listeners[listener.socket] = listener
+        self._poller.register(listener.socket, zmq.POLLIN)
+
+    @property
+    def listeners(self) -> List[Any]:
+        return list(self._listeners.values())
+
+    def call_at(self, when: float, callback: Callable[..., Any], *args) -> Timer:
+        """
+        Run the callback on the loop thread at the given time, can be called from any thread.
+        :param when: time.monotonic() timestamp
+        :return: handle to cancel the timer
+        """
+        timer = Timer(when, callback, args)
+        with self._lock:
+            heapq.heappush(self._timers, (when, next(self._sequence), timer))
+        self._wake()
+        return timer
+
+    def call_later(self, delay: float, callback: Callable[..., Any], *args) -> Timer:
+        """Run the callback on the loop thread after delay seconds."""
+        return self.call_at(time.monotonic() + delay, callback, *args)
+
+    def run(self):
+        """
+        Handle messages and timers until stop is called, then close all listeners.
+        """
+        try:
+            while not self._stopped.is_set():
+                timeout = self._run_due_timers()
+                events = dict(self._poller.poll(timeout))
+                if self._wake_receiver in events:
+                    while self._wake_receiver.poll(0):
+                        self._wake_receiver.recv()
+                for socket, listener in list(self._listeners.items()):
+                    if socket in events:
+                        listener.handle_message()
+        finally:
+            self._close()
+
+    def start(self):
+        """Run the loop in a separate thread."""
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Stop the loop after the current message or timer, can be called from any thread.
+        :param timeout: seconds to wait for the loop thread, if it was started with start
+        """
+        self._stopped.set()
+        self._wake()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _wake(self):
+        with self._lock:
+            try:
+                self._wake_sender.send(b"", zmq.NOBLOCK)
+            except zmq.ZMQError:
+                pass  # already woken up or closed
+
+    def _run_due_timers(self) -> Optional[int]:
+        """
+        Run the callbacks of all due timers.
+        :return: milliseconds until the next timer is due, None if there is none
+        """
+        while True:
+            with self._lock:
+                if not self._timers:
+                    return None
+                when, _, timer = self._timers[0]
+                delay = when - time.monotonic()
+                if delay > 0:
+                    return max(1, int(delay * 1000 + 0.999))
+                heapq.heappop(self._timers)
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception as error:
+                self.logger.error(f"Error in timer {timer.callback}: {error}")
+
+    def _close(self):
+        for socket, listener in self._listeners.items():
+            self._poller.unregister(socket)
+            try:
+                listener.close()
+            except Exception as error:
+                self.logger.error(f"Error closing {listener.__class__.__name__}: {error}")
+        self._listeners.clear()
+        with self._lock:
+            self._timers.clear()
+            self._wake_sender.close(linger=0)
+        self._poller.unregister(self._wake_receiver)
+        self._wake_receiver.close(linger=0)
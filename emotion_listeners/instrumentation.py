@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+# bucket bounds in seconds, growing by 25% from 10us up to ~30s
+BUCKET_BOUNDS: List[float] = [1e-5 * 1.25 ** i for i in range(68)]
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies with exponential buckets.
+    Recording is a bisect and an increment, percentiles are read with a relative error below 25%.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        """Return the upper bound of the bucket holding the given percentile in seconds."""
+        if self.count == 0:
+            return 0.0
+        rank = percent / 100 * self.count
+        seen = 0
+        for index, amount in enumerate(self.buckets):
+            seen += amount
+            if seen >= rank and amount:
+                return BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """Count, mean, max and percentiles, the times in milliseconds."""
+        summary = {"count": self.count,
+                   "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+                   "max_ms": round(self.max * 1000, 3)}
+        for percent in PERCENTILES:
+            summary[f"p{percent}_ms"] = round(self.percentile(percent) * 1000, 3)
+        return summary
+
+
+class Instrumentation:
+    """
+    Collects per stage latency histograms and counters of a listener.
+    A snapshot contains the rates of the counters (e.g. frames per second) since the last reset.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, LatencyHistogram] = {}
+        self._counters: Dict[str, int] = {}
+        self._since = time.monotonic()
+
+    def record(self, stage: str, seconds: float):
+        """Record the latency of a stage."""
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = LatencyHistogram()
+            histogram.record(seconds)
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """Record the time spent in the with block as latency of the stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def count(self, counter: str, amount: int = 1):
+        """Increment a counter."""
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def snapshot(self, reset: bool = False) -> Dict[str, Dict]:
+        """
+        Return the summaries of all stages and the counters with their rate per second.
+        :param reset: start over after taking the snapshot
+        """
+        with self._lock:
+            elapsed = max(time.monotonic() - self._since, 1e-9)
+            snapshot = {
+                "interval_s": round(elapsed, 3),
+                "stages": {stage: histogram.summary() for stage, histogram in self._stages.items()},
+                "counters": dict(self._counters),
+                "rates": {counter: round(amount / elapsed, 2) for counter, amount in self._counters.items()},
+            }
+            if reset:
+                self._stages.clear()
+                self._counters.clear()
+                self._since = time.monotonic()
+        return snapshot
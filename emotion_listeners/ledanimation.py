@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import math
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from eies_protocol.emotions import Emotion
+from emotioncolors import EmotionColors
+
+DEFAULT_TRANSITION_TIME = 500  # ms
+DEFAULT_BREATHING_PERIOD = 4.0  # seconds for one breath
+DEFAULT_BREATHING_DEPTH = 0.5  # brightness drops by this share at the bottom of a breath
+
+# low intensity emotions pulse slowly instead of being shown static
+BREATHING_EMOTIONS = frozenset({Emotion.FEAR, Emotion.SADNESS})
+
+RGBA = Tuple[int, int, int, int]
+
+
+def linear(progress: float) -> float:
+    return progress
+
+
+def ease_in_out(progress: float) -> float:
+    return 0.5 - math.cos(math.pi * progress) / 2
+
+
+EASINGS: Dict[str, Callable[[float], float]] = {
+    "linear": linear,
+    "ease_in_out": ease_in_out,
+}
+
+
+def check_transition_time(transition_time: Any):
+    """
+    :param transition_time: transition time of a message in milliseconds, None for the default
+    :raises ValueError: if it is not a non-negative int
+    """
+    if transition_time is not None and (not isinstance(transition_time, int) or isinstance(transition_time, bool)
+                                        or transition_time < 0):
+        raise ValueError(f"Invalid transition: {transition_time!r} is not a non-negative int of milliseconds")
+
+
+class EmotionAnimator:
+    """
+    Interpolates color and brightness from the shown state to the target emotion.
+    Setting a new target is cheap and thread safe, the render loop asks for the frame at a given time.
+    """
+
+    def __init__(self, transition_time: int = DEFAULT_TRANSITION_TIME, easing: str = "ease_in_out",
+                 breathing_period: float = DEFAULT_BREATHING_PERIOD,
+                 breathing_depth: float = DEFAULT_BREATHING_DEPTH):
+        """
+        :param transition_time: default transition time in milliseconds
+        :param easing: default easing curve, one of EASINGS
+        :param breathing_period: period of the breathing pulse in seconds
+        :param breathing_depth: share of the brightness the breathing pulse takes away
+        """
+        self.transition_time = transition_time
+        self.easing = EASINGS[easing]
+        self.breathing_period = breathing_period
+        self.breathing_depth = breathing_depth
+
+        self._lock = threading.Lock()
+        self._target: Optional[Emotion] = None
+        self._start_rgba: RGBA = (0, 0, 0, 0)
+        self._started = 0.0
+        self._duration = 0.0
+        self._curve = self.easing
+
+    @property
+    def target(self) -> Optional[Emotion]:
+        return self._target
+
+    def set_target(self, emotion: Emotion, now: float, transition_time: Optional[int] = None,
+                   easing: Optional[str] = None):
+        """
+        Start a transition from the current state to the emotion.
+        :param emotion: target Emotion
+        :param now: current time in seconds (monotonic)
+        :param transition_time: transition time in milliseconds, defaults to the animator's
+        :param easing: easing curve, defaults to the animator's
+        :raises KeyError: for an unknown easing
+        :raises ValueError: for an invalid transition time, see check_transition_time
+        """
+        curve = EASINGS[easing] if easing is not None else self.easing
+        check_transition_time(transition_time)
+        duration = (self.transition_time if transition_time is None else transition_time) / 1000
+        with self._lock:
+            if self._target is None:
+                duration = 0.0  # nothing shown yet, appear at once
+            else:
+                self._start_rgba = self._rgba(now)
+            self._target = emotion
+            self._started = now
+            self._duration = duration
+            self._curve = curve
+
+    def frame(self, now: float) -> Tuple[Optional[RGBA], Optional[Emotion]]:
+        """
+        Return the state to show at the given time.
+        :param now: current time in seconds (monotonic)
+        :return: (rgba, None) for an animated frame, (None, emotion) if the prerendered emotion
+                 is shown as is, or (None, None) if there is nothing to show
+        """
+        with self._lock:
+            if self._target is None:
+                return None, None
+            if self.is_static(now):
+                return None, self._target
+            return self._rgba(now), None
+
+    def is_static(self, now: float) -> bool:
+        """True if the target emotion is reached and does not breathe."""
+        return now - self._started >= self._duration and self._target not in BREATHING_EMOTIONS
+
+    def _rgba(self, now: float) -> RGBA:
+        red, green, blue, brightness = EmotionColors.color_provider(self._target)
+        elapsed = now - self._started
+        if elapsed < self._duration:
+            progress = self._curve(elapsed / self._duration)
+            red, green, blue, brightness = (round(start + (end - start) * progress) for start, end in
+                                            zip(self._start_rgba, (red, green, blue, brightness)))
+        if self._target in BREATHING_EMOTIONS:
+            breath = (1 - math.cos(2 * math.pi * elapsed / self.breathing_period)) / 2
+            brightness = round(brightness * (1 - self.breathing_depth * breath))
+        return red, green, blue, brightness
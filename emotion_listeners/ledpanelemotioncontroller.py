@@ -1,18 +1,30 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import math
+import queue
+import threading
 import time
-from typing import Dict, Any
-from emotions import Emotion
+from functools import partial
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import zmq
+from PIL import Image
+
+from eies_protocol import tracing
+from eies_protocol.emotions import Emotion
 from emotioncolors import EmotionColors
-from rgbmatrix import RGBMatrix, RGBMatrixOptions
+from ledanimation import EASINGS, EmotionAnimator, RGBA, DEFAULT_TRANSITION_TIME, check_transition_time
+from matrixbackends import MAX_PWM_BITS, create_matrix
+from panellayout import DEFAULT_MARGINS, PanelLayout, Zone, border_area, border_mask, parse_dimension
 
+from eventloop import EventLoop
 from zmq_server_controllers import BaseZMQListener
 
 DEFAULT_ZMQ_ADDRESS = "tcp://localhost:5555"
 DEFAULT_BRIGHTNESS = 100
 DEFAULT_MATRIX_ROWS = 64
 DEFAULT_MATRIX_COLS = 64
+DEFAULT_FPS = 60
 
 
 class LEDPanelEmotionController(BaseZMQListener):
@@ -20,26 +32,78 @@ class LEDPanelEmotionController(BaseZMQListener):
     Derived class for handling LED panel-related payloads via ZMQ listener.
     """
 
-    def __init__(self, address: str = DEFAULT_ZMQ_ADDRESS):
-        super().__init__(address)
-        self.matrix = self.initialize_led_matrix()
+    SUBSCRIPTIONS = ("led.", "show.")
+    # only the current emotion matters, a backlog of draw messages would just replay old emotions
+    CONFLATE = True
+    # configure messages change settings step by step and scheduled cues and shows form a timeline,
+    # none of them may be dropped
+    UNCONFLATED = ("led.configure", "led.draw.scheduled", "show.")
+
+    # boolean mask of the drawable border, rebuilt whenever canvas_dimensions change
+    _border_mask: Optional[np.ndarray] = None
+    _border_mask_key: Optional[Tuple] = None
+    # one prerendered canvas per emotion, rebuilt whenever canvas_dimensions change
+    _frames: Optional[Dict[Emotion, Any]] = None
+    _frames_key: Optional[Tuple] = None
+    _displayed_emotion: Optional[Emotion] = None
+    # second canvas for animated frames, the other one is self.canvas
+    _back_canvas: Any = None
+    # trace of the latest draw message, finished once its first frame is shown
+    _pending_trace: Optional[Dict[str, Any]] = None
+    # zones of a panel wall each showing their own emotion, None for a single panel with one drawable area
+    layout: Optional[PanelLayout] = None
+    _zone_animators: Optional[Dict[str, EmotionAnimator]] = None
+    _zones_shown: Optional[Dict[str, Optional[Emotion]]] = None
+    # percent all colors are scaled with, changed by configure messages
+    brightness_scale: int = 100
+    # configurations prepared by process, applied by the render thread between two frames
+    _pending_configs: Optional[queue.SimpleQueue] = None
+    # layout including the configured but not yet applied zone margins, only used by process
+    _configured_layout: Optional[PanelLayout] = None
+
+    def __init__(self, address: str = DEFAULT_ZMQ_ADDRESS, fps: int = DEFAULT_FPS,
+                 transition_time: int = DEFAULT_TRANSITION_TIME, easing: str = "ease_in_out",
+                 context: Optional[zmq.Context] = None, matrix_backend: str = "hardware",
+                 layout: Optional[PanelLayout] = None, trace_log: Optional[str] = None,
+                 conflate: Optional[bool] = None, rcvhwm: Optional[int] = None):
+        """
+        :param address: ZMQ listen address
+        :param fps: frames per second of the render loop while animating
+        :param transition_time: default transition time between emotions in milliseconds
+        :param easing: default easing curve of the transitions, see ledanimation.EASINGS
+        :param context: ZMQ context shared with other listeners
+        :param matrix_backend: the panel ("hardware") or an in-memory "emulator", see matrixbackends
+        :param layout: wall of chained/parallel panels split into zones, draw messages then address a "zone"
+        :param trace_log: file the traces of traced messages are appended to, see tracereport.py
+        :param conflate: override CONFLATE
+        :param rcvhwm: override RCVHWM
+        """
+        super().__init__(address, trace_log=trace_log, context=context, conflate=conflate, rcvhwm=rcvhwm)
+        self.layout = layout
+        self.matrix = self.initialize_led_matrix(matrix_backend, layout)
         self.canvas = self.matrix.CreateFrameCanvas()
-        self.canvas_dimensions = self.calculate_drawable_area("25%", "10%", "10%", "10%")
+        self.fps = fps
+        self.animator = EmotionAnimator(transition_time=transition_time, easing=easing)
+        if layout is None:
+            self.canvas_dimensions = self.calculate_drawable_area(*DEFAULT_MARGINS)
+            self.build_frame_cache()
+        else:
+            # zones are composed into one frame, the combinations of emotions can not be prerendered
+            layout.labels()
+            self._zone_animators = {zone.name: EmotionAnimator(transition_time=transition_time, easing=easing)
+                                    for zone in layout.zones}
+            self._zones_shown = {}
+        self._pending_configs = queue.SimpleQueue()
+        self._rendering = False
+        self._target_changed = threading.Event()
 
     @staticmethod
-    def initialize_led_matrix() -> RGBMatrix:
-        """Configure and return the LED matrix."""
-        options = RGBMatrixOptions()
-        options.hardware_mapping = "regular"
-        options.rows = DEFAULT_MATRIX_ROWS
-        options.cols = DEFAULT_MATRIX_COLS
-        options.chain_length = 1
-        options.parallel = 1
-        options.pwm_bits = 11
-        options.brightness = DEFAULT_BRIGHTNESS
-        options.led_rgb_sequence = "RGB"
-        options.scan_mode = 1
-        return RGBMatrix(options=options)
+    def initialize_led_matrix(backend: str = "hardware", layout: Optional[PanelLayout] = None):
+        """Configure and return the LED matrix of the given backend, sized for the layout."""
+        if layout is None:
+            return create_matrix(backend, DEFAULT_MATRIX_ROWS, DEFAULT_MATRIX_COLS, DEFAULT_BRIGHTNESS)
+        return create_matrix(backend, layout.rows, layout.cols, DEFAULT_BRIGHTNESS,
+                             chain_length=layout.chain_length, parallel=layout.parallel)
 
     def calculate_drawable_area(self, top="50%", bottom="50%", left="50%", right="50%") -> Dict[str, Dict[str, int]]:
         """
@@ -50,50 +114,302 @@ class LEDPanelEmotionController(BaseZMQListener):
         left_px = self._parse_dimension(left, self.canvas_width)
         right_px = self._parse_dimension(right, self.canvas_width)
         self._validate_dimensions(top_px, bottom_px, left_px, right_px)
-        return {
-            'top': {'x_start': 0, 'x_end': self.canvas_width, 'y_start': 0, 'y_end': top_px},
-            'bottom': {'x_start': 0, 'x_end': self.canvas_width, 'y_start': self.canvas_height - bottom_px,
-                       'y_end': self.canvas_height},
-            'left': {'x_start': 0, 'x_end': left_px, 'y_start': top_px, 'y_end': self.canvas_height - bottom_px},
-            'right': {'x_start': self.canvas_width - right_px, 'x_end': self.canvas_width, 'y_start': top_px,
-                      'y_end': self.canvas_height - bottom_px},
-        }
+        return border_area(self.canvas_width, self.canvas_height, top_px, bottom_px, left_px, right_px)
 
     @staticmethod
     def _parse_dimension(dimension: str, max_value: int) -> int:
         """Convert dimension string (e.g., '10%' or '25px') into pixel value."""
-        if dimension.endswith("px"):
-            return int(dimension[:-2])
-        elif dimension.endswith("%"):
-            return math.ceil(float(dimension[:-1]) / 100 * max_value)
-        else:
-            raise ValueError(f"Invalid dimension format: {dimension}")
+        return parse_dimension(dimension, max_value)
 
     def _validate_dimensions(self, top_px: int, bottom_px: int, left_px: int, right_px: int):
         """Ensure the drawable area dimensions are within valid bounds."""
         if top_px + bottom_px > self.canvas_height or left_px + right_px > self.canvas_width:
             raise ValueError("Invalid dimensions: excluded areas exceed the max dimensions.")
 
+    def start(self, loop: Optional[EventLoop] = None):
+        """
+        Start the render loop in a separate thread and the ZMQ listener.
+        :param loop: shared event loop of the listener, see BaseZMQListener.start
+        """
+        self._rendering = True
+        threading.Thread(target=self._render_loop, daemon=True).start()
+        super().start(loop)
+
+    def close(self):
+        self.stop_rendering()
+        super().close()
+
+    def stop_rendering(self):
+        """Stop the render loop after the current frame."""
+        self._rendering = False
+        self._target_changed.set()
+
     def process(self, message: Dict[str, Any]):
-        """Process LED panel-related payloads."""
+        """
+        Process LED panel-related payloads, the render loop picks up the new target.
+        Expected payload format: {"action": "draw", "emotion": "...", "transition": 500, "easing": "linear"}
+        where transition (ms) and easing are optional. With a layout the optional "zone" selects the zone
+        to draw in, all zones are drawn without it.
+        """
         if message.get("action") == "draw":
+            animators = self._animators_of(message.get("zone"))
+            if animators is None:
+                self.logger.debug(f"Invalid zone: {message.get('zone')}")
+                return
+            # validate everything before any animator changes, a wall must not switch only some zones
             try:
                 emotion = Emotion(message.get("emotion"))
-                self.logger.info(f"Drawing emotion: {emotion}")
-                self._draw_on_led(emotion)
+                check_transition_time(message.get("transition"))
+                if message.get("easing") is not None and message["easing"] not in EASINGS:
+                    raise KeyError(message["easing"])
             except ValueError as e:
-                self.logger.debug(f"Invalid emotion: {e}")
+                self.logger.debug(f"Invalid draw: {e}")
+                return
+            except KeyError as e:
+                self.logger.debug(f"Invalid easing: {e}")
+                return
+            self.logger.info(f"Drawing emotion: {emotion}")
+            self._set_targets(animators, emotion, message.get("transition"), message.get("easing"),
+                              tracing.defer(message))
+        elif message.get("action") == "configure":
+            try:
+                self._pending_configs.put(self._prepare_config(message))
+                self.logger.info(f"Configuring: {message}")
+                self._target_changed.set()
+            except (ValueError, KeyError) as e:
+                self.logger.debug(f"Invalid configuration: {e}")
+
+    def compile_cue(self, cue: Dict[str, Any]) -> Callable[[], None]:
+        """Resolve the emotion, zone, transition and easing of a draw cue of a timeline up front."""
+        if cue.get("action") != "draw":
+            return super().compile_cue(cue)
+        animators = self._animators_of(cue.get("zone"))
+        if animators is None:
+            raise ValueError(f"Invalid zone: {cue.get('zone')}")
+        if cue.get("easing") is not None and cue["easing"] not in EASINGS:
+            raise ValueError(f"Invalid easing: {cue['easing']}")
+        check_transition_time(cue.get("transition"))
+        return partial(self._set_targets, animators, Emotion(cue.get("emotion")), cue.get("transition"),
+                       cue.get("easing"))
+
+    def _set_targets(self, animators: List[EmotionAnimator], emotion: Emotion, transition: Optional[int],
+                     easing: Optional[str], trace: Optional[Dict[str, Any]] = None):
+        """Start the transition of the animators to the emotion, the render loop picks up the new target."""
+        now = time.monotonic()
+        for animator in animators:
+            animator.set_target(emotion, now, transition_time=transition, easing=easing)
+        self._pending_trace = trace
+        self._target_changed.set()
+
+    def _prepare_config(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Validate a configure message and precompute what it changes, so the render thread only swaps it in.
+        Expected payload format: {"action": "configure", "margins": ["25%", "10%", "10%", "10%"],
+        "pwm_bits": 11, "brightness": 100} where all settings are optional, margins are top, bottom, left, right
+        (see calculate_drawable_area), brightness scales all colors in percent.
+        With a layout the margins change the zone given by "zone", all zones without it.
+        :raises ValueError: on invalid settings
+        :raises KeyError: on an unknown zone
+        """
+        config: Dict[str, Any] = {}
+        pwm_bits = message.get("pwm_bits")
+        if pwm_bits is not None:
+            if not isinstance(pwm_bits, int) or isinstance(pwm_bits, bool) or not 1 <= pwm_bits <= MAX_PWM_BITS:
+                raise ValueError(f"pwm_bits {pwm_bits!r} is not within 1 and {MAX_PWM_BITS}")
+            config["pwm_bits"] = pwm_bits
+        brightness = message.get("brightness")
+        if brightness is not None:
+            if not isinstance(brightness, int) or isinstance(brightness, bool) or not 0 <= brightness <= 100:
+                raise ValueError(f"brightness {brightness!r} is not within 0 and 100")
+            config["brightness"] = brightness
+        margins = message.get("margins")
+        if margins is not None:
+            if not isinstance(margins, list) or len(margins) != 4 or not all(isinstance(m, str) for m in margins):
+                raise ValueError(f"margins {margins!r} are not four dimensions (top, bottom, left, right)")
+            if self.layout is None:
+                dimensions = self.calculate_drawable_area(*margins)
+                config["canvas_dimensions"] = dimensions
+                config["border_mask"] = border_mask(dimensions, self.canvas_width, self.canvas_height)
+            else:
+                config["layout"] = self._configured_layout = self._with_margins(margins, message.get("zone"))
+        return config
+
+    def _with_margins(self, margins: List[str], zone: Optional[str]) -> PanelLayout:
+        """Return a copy of the (configured) layout with new margins of the zone, of all zones if None."""
+        layout = self._configured_layout or self.layout
+        if zone is not None:
+            layout.zone(zone)
+        zones = [Zone(z.name, z.x, z.y, z.width, z.height, margins if zone in (None, z.name) else z.margins)
+                 for z in layout.zones]
+        configured = PanelLayout(layout.rows, layout.cols, layout.chain_length, layout.parallel, zones)
+        configured.labels()
+        return configured
+
+    def _apply_pending_configs(self):
+        """
+        Swap in the prepared configurations, called by the render thread between two frames.
+        Pending configurations are merged first, so the frames are rebuilt at most once.
+        """
+        config: Dict[str, Any] = {}
+        while True:
+            try:
+                config.update(self._pending_configs.get_nowait())
+            except queue.Empty:
+                break
+        if not config:
+            return
+        if "pwm_bits" in config:
+            self.matrix.pwmBits = config["pwm_bits"]
+        if "brightness" in config:
+            self.brightness_scale = config["brightness"]
+        if "canvas_dimensions" in config:
+            self.canvas_dimensions = config["canvas_dimensions"]
+            self._border_mask, self._border_mask_key = config["border_mask"], self._dimensions_key()
+        if "layout" in config:
+            self.layout = config["layout"]
+        if self.layout is not None:
+            self._zones_shown.clear()  # redraw all zones
+        elif "canvas_dimensions" in config or "brightness" in config:
+            self.build_frame_cache()
+        self.metrics.count("configured")
+        self.logger.info(f"Configuration applied: {sorted(config)}")
+
+    def _animators_of(self, zone: Optional[str]) -> Optional[List[EmotionAnimator]]:
+        """Return the animators a draw message addresses, None for an unknown zone."""
+        if self.layout is None:
+            return [self.animator] if zone is None else None
+        if zone is None:
+            return list(self._zone_animators.values())
+        animator = self._zone_animators.get(zone)
+        return [animator] if animator is not None else None
+
+    def _is_idle(self, now: float) -> bool:
+        """True if the shown frame is final until the next draw message."""
+        if self.layout is None:
+            return self.animator.is_static(now) and self.animator.target is self._displayed_emotion
+        return all(animator.is_static(now) and animator.target is self._zones_shown.get(name)
+                   for name, animator in self._zone_animators.items())
+
+    def _render_loop(self):
+        """
+        Render at a fixed rate while animating, sleep while a static emotion is shown.
+        """
+        interval = 1 / self.fps
+        next_frame = time.monotonic()
+        while self._rendering:
+            self._apply_pending_configs()
+            now = time.monotonic()
+            if self._is_idle(now):
+                if self._pending_trace is not None:  # the emotion was already shown
+                    trace, self._pending_trace = self._pending_trace, None
+                    self.finish_trace(trace, "rendered")
+                self._target_changed.wait()
+                self._target_changed.clear()
+                next_frame = time.monotonic()
+                continue
+            try:
+                self._render_frame(now)
+            except Exception as error:
+                self.logger.error(f"Error rendering frame: {error}")
+            next_frame += interval
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self.metrics.count("missed_vsync", int(-delay // interval) + 1)
+                next_frame = time.monotonic()  # running late, do not try to catch up
+
+    def _render_frame(self, now: float):
+        trace, self._pending_trace = self._pending_trace, None
+        if self.layout is not None:
+            self._draw_zones(now)
+        else:
+            rgba, emotion = self.animator.frame(now)
+            if emotion is not None:
+                self._draw_on_led(emotion)
+            elif rgba is not None:
+                self._draw_animation_frame(rgba)
+        if trace is not None:
+            self.finish_trace(trace, "rendered")
+
+    def _draw_zones(self, now: float):
+        """
+        Compose the state of every zone into one frame and write it to the spare canvas in a single call.
+        The brightness of each zone is applied to its color, as the canvas brightness is shared by all zones.
+        """
+        with self.metrics.measure("render"):
+            colors = []
+            for name, animator in self._zone_animators.items():
+                rgba, emotion = animator.frame(now)
+                if emotion is not None:
+                    rgba = EmotionColors.color_provider(emotion)
+                red, green, blue, brightness = rgba if rgba is not None else (0, 0, 0, 0)
+                brightness = brightness * self.brightness_scale // 100
+                colors.append((red * brightness // 100, green * brightness // 100, blue * brightness // 100))
+                self._zones_shown[name] = emotion
+            self.canvas.brightness = 100
+            self.canvas.SetImage(Image.fromarray(self.layout.compose(colors), "RGB"))
+        self._swap_in(self.canvas)
 
     def _draw_on_led(self, emotion: Emotion):
-        """Send emotion color to the canvas and refresh."""
-        rgba = EmotionColors.color_provider(emotion)
-        time.sleep(0.005)  # reduce brightness flicker
-        self._fill_canvas(*rgba)
-        self.canvas = self.matrix.SwapOnVSync(self.canvas)
-
-    def _fill_canvas(self, red: int, green: int, blue: int, brightness: int = DEFAULT_BRIGHTNESS):
-        """Fill the canvas with a given color."""
-        self.canvas.brightness = brightness
+        """Show the prerendered canvas of the emotion on the next refresh."""
+        if self._frames_key != self._dimensions_key():
+            self.build_frame_cache()
+        if emotion is not self._displayed_emotion:
+            self._swap_in(self._frames[emotion])
+            self._displayed_emotion = emotion
+
+    def _draw_animation_frame(self, rgba: RGBA):
+        """Draw an interpolated state on the spare canvas and show it on the next refresh."""
+        with self.metrics.measure("render"):
+            self._fill_canvas(*rgba)
+        self._swap_in(self.canvas)
+        self._displayed_emotion = None
+
+    def _swap_in(self, canvas):
+        """
+        Show the canvas on the next refresh.
+        The canvas coming back from the matrix becomes the spare canvas, unless it is a prerendered one.
+        """
+        with self.metrics.measure("swap"):
+            previous = self.matrix.SwapOnVSync(canvas)
+        self.metrics.count("frames")
+        prerendered = any(previous is frame for frame in (self._frames or {}).values())
+        if canvas is self.canvas:
+            if previous is not None and not prerendered:
+                self.canvas = previous
+            else:
+                self.canvas = self._back_canvas if self._back_canvas is not None else self.matrix.CreateFrameCanvas()
+                self._back_canvas = None
+        elif previous is not None and not prerendered and previous is not self.canvas:
+            self._back_canvas = previous
+
+    def build_frame_cache(self):
+        """
+        Render one offscreen canvas per emotion, so drawing an emotion is a swap on vsync.
+        Canvases of an earlier build are drawn again, as the matrix never frees created canvases,
+        the displayed one is replaced by the spare canvas to avoid drawing on screen.
+        """
+        frames = dict(self._frames or {})
+        for emotion in Emotion:
+            canvas = frames.get(emotion)
+            if canvas is None:
+                canvas = self.matrix.CreateFrameCanvas()
+            elif emotion is self._displayed_emotion:
+                canvas = self.canvas
+            canvas.Clear()
+            self._fill_canvas(*EmotionColors.color_provider(emotion), canvas=canvas)
+            frames[emotion] = canvas
+        replace_displayed = self._displayed_emotion is not None and self._frames is not None
+        self._frames, self._frames_key = frames, self._dimensions_key()
+        if replace_displayed:
+            self._swap_in(frames[self._displayed_emotion])
+
+    def _fill_canvas(self, red: int, green: int, blue: int, brightness: int = DEFAULT_BRIGHTNESS, canvas=None):
+        """Fill the canvas (defaults to the spare canvas) with a given color."""
+        canvas = canvas if canvas is not None else self.canvas
+        brightness = brightness * self.brightness_scale // 100
+        canvas.brightness = brightness
         if brightness <= 0:  # No need to draw if brightness is zero
             return
         # Check for complete fill condition
@@ -105,13 +421,28 @@ class LEDPanelEmotionController(BaseZMQListener):
                           f": Canvas height: {self.canvas_height}, canvas width: {self.canvas_width}")
         # we set our coords starting with 0 and running to the last drawable pixel, that why we need to compensate (+1)
         if total_fillable_height+1 >= self.canvas_height or total_fillable_width+1 >= self.canvas_width:
-            self.canvas.Fill(red, green, blue)
+            canvas.Fill(red, green, blue)
             return
-        # Partial area rendering
-        for side, dimensions in self.canvas_dimensions.items():
-            for x in range(dimensions['x_start'], dimensions['x_end'] + 1):
-                for y in range(dimensions['y_start'], dimensions['y_end'] + 1):
-                    self.canvas.SetPixel(x, y, red, green, blue)
+        # Partial area rendering, the whole frame is composed and written in one call
+        frame = np.zeros((self.canvas_height, self.canvas_width, 3), dtype=np.uint8)
+        frame[self.drawable_mask()] = (red, green, blue)
+        canvas.SetImage(Image.fromarray(frame, "RGB"))
+
+    def drawable_mask(self) -> np.ndarray:
+        """
+        Return a boolean mask (height x width) of the pixels covered by the drawable area.
+        The mask is computed once and reused as long as the canvas dimensions do not change.
+        """
+        key = self._dimensions_key()
+        if key != self._border_mask_key:
+            self._border_mask = border_mask(self.canvas_dimensions, self.canvas_width, self.canvas_height)
+            self._border_mask_key = key
+        return self._border_mask
+
+    def _dimensions_key(self) -> Tuple:
+        """Hashable snapshot of the canvas size and the drawable area."""
+        return (self.canvas_width, self.canvas_height) + \
+            tuple(tuple(dimensions.values()) for dimensions in self.canvas_dimensions.values())
 
     @property
     def canvas_width(self) -> int:
@@ -125,7 +456,16 @@ class LEDPanelEmotionController(BaseZMQListener):
 
 
 if __name__ == "__main__":
-    emotion_controller = LEDPanelEmotionController()
+    import argparse
+    parser = argparse.ArgumentParser(description="Show the emotions on the LED panel.")
+    parser.add_argument("--trace-log", help="file the traces of traced cues are appended to, see tracereport.py")
+    parser.add_argument("--conflate", action=argparse.BooleanOptionalAction,
+                        help="only process the newest pending draw (default: on)")
+    parser.add_argument("--rcvhwm", type=int, help="messages queued per publisher (default: ZMQ default)")
+    args = parser.parse_args()
+    emotion_controller = LEDPanelEmotionController(trace_log=args.trace_log, conflate=args.conflate,
+                                                   rcvhwm=args.rcvhwm)
     emotion_controller.start()
     # Keep the application running
     input("Press Enter to exit...\n")
+    emotion_controller.stop()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Backends of the LED matrix: the hardware panel (rgbmatrix bindings) and an in-memory emulator
+with the same interface, so the render path runs headless for profiling and tests.
+"""
+import os
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image
+
+BACKENDS = ("hardware", "emulator")
+# color depth of the PWM, fewer bits trade color depth for a higher refresh rate
+DEFAULT_PWM_BITS = 11
+MAX_PWM_BITS = 11
+
+
+def hardware_matrix(rows: int, cols: int, brightness: int, chain_length: int = 1, parallel: int = 1):
+    """Configure and return the LED matrix of the panels."""
+    # imported here, the bindings only build on the Raspberry Pi
+    from rgbmatrix import RGBMatrix, RGBMatrixOptions
+
+    options = RGBMatrixOptions()
+    options.hardware_mapping = "regular"
+    options.rows = rows
+    options.cols = cols
+    options.chain_length = chain_length
+    options.parallel = parallel
+    options.pwm_bits = DEFAULT_PWM_BITS
+    options.brightness = brightness
+    options.led_rgb_sequence = "RGB"
+    options.scan_mode = 1
+    return RGBMatrix(options=options)
+
+
+def create_matrix(backend: str, rows: int, cols: int, brightness: int, chain_length: int = 1, parallel: int = 1,
+                  **options):
+    """
+    Create the matrix of the given backend.
+    :param backend: one of BACKENDS
+    :param rows: pixel rows of one panel
+    :param cols: pixel columns of one panel
+    :param chain_length: panels per chain, side by side
+    :param parallel: parallel chains, below each other
+    :param options: passed on to the EmulatedMatrix
+    """
+    if backend == "hardware":
+        return hardware_matrix(rows, cols, brightness, chain_length, parallel)
+    if backend == "emulator":
+        return EmulatedMatrix(rows, cols, brightness, chain_length=chain_length, parallel=parallel, **options)
+    raise ValueError(f"Unknown matrix backend {backend}, expected one of {BACKENDS}")
+
+
+class EmulatedCanvas:
+    """
+    Frame canvas backed by a numpy framebuffer (height x width x RGB).
+    Like on the panel, brightness (percent) scales the colors that are drawn after setting it.
+    """
+
+    def __init__(self, width: int, height: int, brightness: int = 100):
+        self.width = width
+        self.height = height
+        self.brightness = brightness
+        self.pixels = np.zeros((height, width, 3), dtype=np.uint8)
+
+    def _scaled(self, red: int, green: int, blue: int) -> np.ndarray:
+        return (np.array((red, green, blue), dtype=np.uint16) * self.brightness // 100).astype(np.uint8)
+
+    def Clear(self):
+        self.pixels.fill(0)
+
+    def Fill(self, red: int, green: int, blue: int):
+        self.pixels[:] = self._scaled(red, green, blue)
+
+    def SetPixel(self, x: int, y: int, red: int, green: int, blue: int):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.pixels[y, x] = self._scaled(red, green, blue)
+
+    def SetImage(self, image: Image.Image, offset_x: int = 0, offset_y: int = 0, unsafe: bool = True):
+        """Draw the RGB image at the offset, clipped to the canvas."""
+        frame = np.asarray(image.convert("RGB"))
+        x_start, y_start = max(offset_x, 0), max(offset_y, 0)
+        x_end = min(offset_x + frame.shape[1], self.width)
+        y_end = min(offset_y + frame.shape[0], self.height)
+        if x_start >= x_end or y_start >= y_end:
+            return
+        region = frame[y_start - offset_y:y_end - offset_y, x_start - offset_x:x_end - offset_x]
+        if self.brightness != 100:
+            region = (region.astype(np.uint16) * self.brightness // 100).astype(np.uint8)
+        self.pixels[y_start:y_end, x_start:x_end] = region
+
+    def image(self) -> Image.Image:
+        return Image.fromarray(self.pixels, "RGB")
+
+
+class EmulatedMatrix:
+    """
+    In-memory LED matrix, swapping shows a canvas and returns the previously shown one like the panel.
+    Shown frames can be recorded and saved as PNG sequence or GIF.
+    """
+
+    def __init__(self, rows: int = 64, cols: int = 64, brightness: int = 100, chain_length: int = 1,
+                 parallel: int = 1, record: bool = False, max_frames: int = 1000):
+        """
+        :param rows: height of a panel in pixels
+        :param cols: width of a panel in pixels
+        :param brightness: brightness of the panels in percent
+        :param chain_length: chained panels, side by side
+        :param parallel: parallel chains, below each other
+        :param record: keep a copy of every shown frame
+        :param max_frames: maximum number of recorded frames, the oldest ones are dropped
+        """
+        self.height = rows * parallel
+        self.width = cols * chain_length
+        self.brightness = brightness
+        self.pwmBits = DEFAULT_PWM_BITS
+        self.record = record
+        self.max_frames = max_frames
+        self.frames: List[np.ndarray] = []
+        self.swaps = 0
+        self.displayed = self.CreateFrameCanvas()
+
+    def CreateFrameCanvas(self) -> EmulatedCanvas:
+        return EmulatedCanvas(self.width, self.height, self.brightness)
+
+    def SwapOnVSync(self, canvas: EmulatedCanvas, framerate_fraction: Optional[int] = None) -> EmulatedCanvas:
+        previous, self.displayed = self.displayed, canvas
+        self.swaps += 1
+        if self.record:
+            self.frames.append(canvas.pixels.copy())
+            if len(self.frames) > self.max_frames:
+                del self.frames[0]
+        return previous
+
+    def Clear(self):
+        self.displayed.Clear()
+
+    def save_png_sequence(self, directory: str, prefix: str = "frame") -> List[str]:
+        """
+        Save the recorded frames as numbered PNG files.
+        :return: paths of the written files
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for index, frame in enumerate(self.frames):
+            path = os.path.join(directory, f"{prefix}_{index:05d}.png")
+            Image.fromarray(frame, "RGB").save(path)
+            paths.append(path)
+        return paths
+
+    def save_gif(self, path: str, frame_time: int = 16):
+        """
+        Save the recorded frames as animated GIF.
+        :param frame_time: milliseconds each frame is shown
+        """
+        if not self.frames:
+            raise ValueError("No frames recorded")
+        images = [Image.fromarray(frame, "RGB") for frame in self.frames]
+        images[0].save(path, save_all=True, append_images=images[1:], duration=frame_time, loop=0)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Layout of a wall of chained and parallel LED panels, split into zones that show their own emotion.
+"""
+import json
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_MARGINS = ("25%", "10%", "10%", "10%")  # top, bottom, left, right
+
+
+def parse_dimension(dimension: str, max_value: int) -> int:
+    """Convert dimension string (e.g., '10%' or '25px') into pixel value."""
+    if dimension.endswith("px"):
+        return int(dimension[:-2])
+    elif dimension.endswith("%"):
+        return math.ceil(float(dimension[:-1]) / 100 * max_value)
+    else:
+        raise ValueError(f"Invalid dimension format: {dimension}")
+
+
+def border_area(width: int, height: int, top_px: int, bottom_px: int, left_px: int,
+                right_px: int) -> Dict[str, Dict[str, int]]:
+    """Rectangles ("top", "bottom", "left", "right") of the drawn border of a width x height area."""
+    return {
+        'top': {'x_start': 0, 'x_end': width, 'y_start': 0, 'y_end': top_px},
+        'bottom': {'x_start': 0, 'x_end': width, 'y_start': height - bottom_px, 'y_end': height},
+        'left': {'x_start': 0, 'x_end': left_px, 'y_start': top_px, 'y_end': height - bottom_px},
+        'right': {'x_start': width - right_px, 'x_end': width, 'y_start': top_px, 'y_end': height - bottom_px},
+    }
+
+
+def border_mask(area: Dict[str, Dict[str, int]], width: int, height: int) -> np.ndarray:
+    """Boolean mask (height x width) of the rectangles of a border_area, their end coordinates are drawn as well."""
+    mask = np.zeros((height, width), dtype=bool)
+    for dimensions in area.values():
+        mask[dimensions['y_start']:dimensions['y_end'] + 1, dimensions['x_start']:dimensions['x_end'] + 1] = True
+    return mask
+
+
+class Zone:
+    """
+    Rectangle of the wall in canvas pixels, its border (inside the margins) is drawn in the zone's emotion.
+    """
+
+    def __init__(self, name: str, x: int, y: int, width: int, height: int,
+                 margins: Sequence[str] = DEFAULT_MARGINS):
+        """
+        :param name: name used in draw messages ("zone")
+        :param x: left edge in canvas pixels
+        :param y: top edge in canvas pixels
+        :param width: width in pixels
+        :param height: height in pixels
+        :param margins: top, bottom, left, right width of the drawn border, in percent of the zone or pixels
+        """
+        self.name = name
+        self.x, self.y, self.width, self.height = x, y, width, height
+        self.margins = tuple(margins)
+
+    def mask(self) -> np.ndarray:
+        """Boolean mask (height x width) of the drawn border of the zone."""
+        top, bottom, left, right = self.margins
+        top_px, bottom_px = parse_dimension(top, self.height), parse_dimension(bottom, self.height)
+        left_px, right_px = parse_dimension(left, self.width), parse_dimension(right, self.width)
+        if top_px + bottom_px > self.height or left_px + right_px > self.width:
+            raise ValueError(f"Invalid dimensions of zone {self.name}: excluded areas exceed the max dimensions.")
+        area = border_area(self.width, self.height, top_px, bottom_px, left_px, right_px)
+        return border_mask(area, self.width, self.height)
+
+
+class PanelLayout:
+    """
+    Wall of chain_length panels side by side and parallel chains below each other, each panel rows x cols.
+    The zones are combined into one label map, so a frame of all zones is a single lookup and buffer write.
+    """
+
+    def __init__(self, rows: int = 64, cols: int = 64, chain_length: int = 1, parallel: int = 1,
+                 zones: Optional[List[Zone]] = None):
+        """
+        :param rows: pixel rows of one panel
+        :param cols: pixel columns of one panel
+        :param chain_length: panels per chain, side by side
+        :param parallel: parallel chains, below each other
+        :param zones: zones of the wall, by default one zone per panel
+        """
+        self.rows, self.cols = rows, cols
+        self.chain_length, self.parallel = chain_length, parallel
+        self.width, self.height = cols * chain_length, rows * parallel
+        self.zones = zones if zones is not None else self.panel_zones()
+        if not self.zones:
+            raise ValueError("A layout needs at least one zone")
+        if len({zone.name for zone in self.zones}) != len(self.zones):
+            raise ValueError("Zone names must be unique")
+        self._labels: Optional[np.ndarray] = None
+
+    def panel_zones(self, margins: Sequence[str] = DEFAULT_MARGINS) -> List[Zone]:
+        """One zone per panel, named panel_<parallel>_<chain>."""
+        return [Zone(f"panel_{row}_{column}", column * self.cols, row * self.rows, self.cols, self.rows, margins)
+                for row in range(self.parallel) for column in range(self.chain_length)]
+
+    def zone(self, name: str) -> Zone:
+        for zone in self.zones:
+            if zone.name == name:
+                return zone
+        raise KeyError(f"Unknown zone {name}")
+
+    def labels(self) -> np.ndarray:
+        """
+        Map (height x width) of the zone drawing each pixel, 1 for the first zone, 0 for undrawn pixels.
+        Computed once, later zones are drawn over earlier ones where they overlap.
+        """
+        if self._labels is None:
+            labels = np.zeros((self.height, self.width), dtype=np.uint16)
+            for index, zone in enumerate(self.zones, 1):
+                if zone.x < 0 or zone.y < 0 or zone.x + zone.width > self.width or zone.y + zone.height > self.height:
+                    raise ValueError(f"Zone {zone.name} exceeds the {self.width}x{self.height} canvas")
+                region = labels[zone.y:zone.y + zone.height, zone.x:zone.x + zone.width]
+                region[zone.mask()] = index
+            self._labels = labels
+        return self._labels
+
+    def compose(self, colors: Sequence[Tuple[int, int, int]]) -> np.ndarray:
+        """
+        Build the frame (height x width x RGB) showing each zone in its color.
+        :param colors: RGB color per zone, in the order of zones
+        """
+        palette = np.zeros((len(self.zones) + 1, 3), dtype=np.uint8)
+        palette[1:] = colors
+        return palette[self.labels()]
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "PanelLayout":
+        """
+        Create the layout from a dict, e.g. loaded from JSON:
+        {"rows": 64, "cols": 64, "chain_length": 2, "parallel": 1,
+         "zones": [{"name": "left", "x": 0, "y": 0, "width": 64, "height": 64, "margins": ["10%", ...]}]}
+        Without zones there is one zone per panel.
+        """
+        zones = config.get("zones")
+        return cls(rows=config.get("rows", 64), cols=config.get("cols", 64),
+                   chain_length=config.get("chain_length", 1), parallel=config.get("parallel", 1),
+                   zones=[Zone(**zone) for zone in zones] if zones is not None else None)
+
+    @classmethod
+    def load(cls, path: str) -> "PanelLayout":
+        with open(path, encoding="utf-8") as layout_file:
+            return cls.from_config(json.load(layout_file))
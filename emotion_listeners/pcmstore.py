@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Rendered sounds on disk, so a restarted sound listener maps them instead of decoding and rendering them again.
+Entries are named after the emotion, a hash of the content of its source file and the render parameters:
+
+    sounds/.cache/fear-<source hash>-<frame rate>-<duration>-<fade time>.pcm
+
+A changed source file gets new entries, the stale ones of its emotion are removed.
+Every entry is a header with the sample format and the raw PCM after it, which is memory mapped on load,
+so loading is nearly instant and the listeners on a device share the pages.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from typing import Optional, Sequence
+
+from pydub import AudioSegment
+
+MAGIC = b"EIESPCM1"
+HEADER = struct.Struct("<8sHHI")  # magic, sample width, channels, frame rate
+HEADER_SIZE = mmap.ALLOCATIONGRANULARITY  # the samples start at an offset mmap can map from
+DIGEST_LENGTH = 16  # hex digits of the source hash in the entry names
+
+_READ_SIZE = 1024 * 1024
+
+
+def file_digest(path: str) -> str:
+    """Return the sha256 hex digest of the content of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_READ_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:DIGEST_LENGTH]
+
+
+class PCMStore:
+    """
+    Directory of rendered sounds, shared by all processes using it.
+    Failing to read or write an entry is logged and never fails the sound, it is rendered in memory instead.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: directory of the entries, created on the first store
+        """
+        self.directory = directory
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def digest(self, path: str) -> Optional[str]:
+        """
+        Hash a source file.
+        :return: the digest, None if the file can not be read
+        """
+        try:
+            return file_digest(path)
+        except OSError as e:
+            self.logger.warning(f"Not caching {path} on disk: {e}")
+            return None
+
+    def path(self, name: str, digest: str, params: Sequence[int]) -> str:
+        return os.path.join(self.directory, "-".join([name, digest, *map(str, params)]) + ".pcm")
+
+    def load(self, name: str, digest: str, params: Sequence[int]) -> Optional[AudioSegment]:
+        """
+        Map an entry into memory.
+        :return: the sound, None if there is no valid entry
+        """
+        path = self.path(name, digest, params)
+        try:
+            with open(path, "rb") as f:
+                magic, sample_width, channels, frame_rate = HEADER.unpack(f.read(HEADER.size))
+                if magic != MAGIC:
+                    raise ValueError(f"unknown format {magic!r}")
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ, offset=HEADER_SIZE)
+            return AudioSegment(data=data, sample_width=sample_width, frame_rate=frame_rate, channels=channels)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error) as e:
+            self.logger.warning(f"Removing broken cache entry {path}: {e}")
+            self._remove(path)
+            return None
+
+    def store(self, name: str, digest: str, params: Sequence[int], sound: AudioSegment):
+        """
+        Write an entry, it replaces an existing one atomically so other processes never map half of it.
+        """
+        if not len(sound.raw_data):
+            return  # an empty file can not be mapped
+        path = self.path(name, digest, params)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    header = HEADER.pack(MAGIC, sound.sample_width, sound.channels, sound.frame_rate)
+                    f.write(header.ljust(HEADER_SIZE, b"\0"))
+                    f.write(sound.raw_data)
+                os.replace(temporary, path)
+            except BaseException:
+                self._remove(temporary)
+                raise
+        except OSError as e:
+            self.logger.warning(f"Could not write cache entry {path}: {e}")
+
+    def prune(self, name: str, digest: str):
+        """Remove the entries of name rendered from another version of its source file."""
+        prefix, current = f"{name}-", f"{name}-{digest}-"
+        try:
+            entries = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.startswith(prefix) and entry.endswith(".pcm") and not entry.startswith(current):
+                self.logger.info(f"Removing stale cache entry {entry}")
+                self._remove(os.path.join(self.directory, entry))
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from collections import deque
+from enum import Enum
+from typing import Callable, Dict, Iterable, Iterator, Optional, Union
+
+from pydub import AudioSegment
+
+DEFAULT_MAX_QUEUE = 4
+DEFAULT_CROSSFADE = 250  # ms
+DEFAULT_CHUNK_LENGTH = 50  # ms, granularity in which playback can be preempted
+
+Sound = Union[AudioSegment, Iterable[AudioSegment]]  # a rendered sound or a stream of chunks
+
+
+class PlaybackPolicy(Enum):
+    """
+    What happens to a new sound while another one is playing.
+    PREEMPT crossfades into the new sound and drops everything pending,
+    QUEUE plays it afterward (dropping the oldest pending sound if the queue is full),
+    DROP_NEWEST plays it afterward, but drops it if the queue is full.
+    """
+    PREEMPT = 'preempt'
+    QUEUE = 'queue'
+    DROP_NEWEST = 'drop_newest'
+
+
+class PyAudioSink:
+    """
+    Writes audio chunks to the sound device using pyaudio.
+    The stream is opened lazily and reopened if the sample format changes.
+    """
+
+    def __init__(self):
+        self._audio = None
+        self._stream = None
+        self._format = None
+
+    def write(self, chunk: AudioSegment):
+        sample_format = (chunk.sample_width, chunk.channels, chunk.frame_rate)
+        if sample_format != self._format:
+            self._open(*sample_format)
+        self._stream.write(chunk.raw_data)
+
+    def _open(self, sample_width: int, channels: int, frame_rate: int):
+        import pyaudio
+
+        self.close()
+        self._audio = pyaudio.PyAudio()
+        self._stream = self._audio.open(format=self._audio.get_format_from_width(sample_width),
+                                        channels=channels, rate=frame_rate, output=True)
+        self._format = (sample_width, channels, frame_rate)
+
+    def close(self):
+        if self._stream:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+        if self._audio:
+            self._audio.terminate()
+            self._audio = None
+        self._format = None
+
+
+class PlaybackEngine:
+    """
+    Single voice audio playback.
+    One worker thread owns the sound device and plays the submitted sounds chunk by chunk,
+    pending sounds wait in a bounded queue that is handled according to the PlaybackPolicy.
+    """
+
+    def __init__(self, sink=None, policy: PlaybackPolicy = PlaybackPolicy.PREEMPT,
+                 max_queue: int = DEFAULT_MAX_QUEUE, crossfade: int = DEFAULT_CROSSFADE,
+                 chunk_length: int = DEFAULT_CHUNK_LENGTH):
+        """
+        :param sink: audio output with a write(chunk) method, defaults to a PyAudioSink
+        :param policy: PlaybackPolicy for sounds arriving while another one plays
+        :param max_queue: maximum number of pending sounds
+        :param crossfade: crossfade time in milliseconds when preempting
+        :param chunk_length: length of the chunks written to the sink in milliseconds
+        """
+        self.sink = sink if sink is not None else PyAudioSink()
+        self.policy = policy
+        self.max_queue = max_queue
+        self.crossfade = crossfade
+        self.chunk_length = chunk_length
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.played = 0
+        self.errors = 0
+        self.dropped = 0
+        self.preempted = 0
+
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._preempt = False
+        self._skip = False
+        self._running = False
+        self._worker: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the playback worker."""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the playback after the current chunk and release the sound device."""
+        with self._condition:
+            self._running = False
+            self._pending.clear()
+            self._condition.notify_all()
+        if self._worker:
+            self._worker.join(timeout)
+            self._worker = None
+        self.sink.close()
+
+    def stop_current(self):
+        """Fade out the sound that is playing right now, pending sounds are kept."""
+        with self._condition:
+            self._skip = True
+
+    def submit(self, render: Callable[[], Sound]) -> bool:
+        """
+        Hand a sound over to the playback.
+        The sound is rendered by the worker, so the caller does not wait for it.
+        :param render: callable returning the AudioSegment or a stream of AudioSegment chunks to play
+        :return: False if the sound was dropped
+        """
+        with self._condition:
+            if self.policy is PlaybackPolicy.PREEMPT:
+                self.dropped += len(self._pending)
+                self._pending.clear()
+                self._preempt = True
+            elif len(self._pending) >= self.max_queue:
+                self.dropped += 1
+                if self.policy is PlaybackPolicy.DROP_NEWEST:
+                    return False
+                self._pending.popleft()
+            self._pending.append(render)
+            self._condition.notify()
+            return True
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of sounds waiting to be played."""
+        with self._condition:
+            return len(self._pending)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Return the counters of the playback."""
+        with self._condition:
+            return {
+                "queue_depth": len(self._pending),
+                "played": self.played,
+                "errors": self.errors,
+                "dropped": self.dropped,
+                "preempted": self.preempted,
+            }
+
+    def _next(self, block: bool) -> Optional[Callable[[], Sound]]:
+        with self._condition:
+            while block and self._running and not self._pending:
+                self._condition.wait()
+            self._preempt = False
+            self._skip = False
+            if not self._running or not self._pending:
+                return None
+            return self._pending.popleft()
+
+    def _run(self):
+        render = self._next(block=True)
+        while render is not None:
+            try:
+                self._play(render)
+                self.played += 1
+            except Exception as error:
+                self.errors += 1
+                self.logger.error(f"Error playing sound: {error}")
+            render = self._next(block=True)
+
+    def _play(self, render: Callable[[], Sound]):
+        chunks = self._chunks(render)
+        while self._running:
+            if self._skip:
+                self._skip = False
+                chunks = self._crossfade_chunks(chunks, iter(()))
+            if self._preempt:
+                preempting = self._next(block=False)
+                if preempting is not None:
+                    self.preempted += 1
+                    chunks = self._crossfade_chunks(chunks, self._chunks(preempting))
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+            self.sink.write(chunk)
+
+    def _chunks(self, render: Callable[[], Sound]) -> Iterator[AudioSegment]:
+        sound = render()
+        if isinstance(sound, AudioSegment):
+            return self._segment_chunks(sound, self.chunk_length)
+        return iter(sound)
+
+    @staticmethod
+    def _segment_chunks(sound: AudioSegment, chunk_length: int) -> Iterator[AudioSegment]:
+        for start in range(0, len(sound), chunk_length):
+            yield sound[start:start + chunk_length]
+
+    def _crossfade_chunks(self, old: Iterator[AudioSegment],
+                          new: Iterator[AudioSegment]) -> Iterator[AudioSegment]:
+        """Fade out the rest of the old chunks while fading in the new ones."""
+        tail = self._take(old, self.crossfade)
+        head = self._take(new, self.crossfade)
+        if tail is None:
+            mixed = head
+        elif head is None:
+            mixed = tail.fade_out(len(tail))
+        else:
+            length = min(len(tail), len(head))
+            mixed = tail[:length].fade_out(length).overlay(head[:length].fade_in(length)) + head[length:]
+        if mixed is not None:
+            yield from self._segment_chunks(mixed, self.chunk_length)
+        yield from new
+
+    @staticmethod
+    def _take(chunks: Iterable[AudioSegment], length: int) -> Optional[AudioSegment]:
+        """Concatenate chunks until they cover at least length milliseconds."""
+        taken = None
+        for chunk in chunks:
+            taken = chunk if taken is None else taken + chunk
+            if len(taken) >= length:
+                break
+        return taken
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Runs several renderers in one process, all listeners share one ZMQ context and one event loop thread.
+"""
+import argparse
+import signal
+import sys
+from typing import Optional
+
+import zmq
+
+from eventloop import EventLoop
+from matrixbackends import BACKENDS
+from panellayout import PanelLayout
+
+RENDERERS = ("led", "sound")
+
+
+def create(name: str, address: str, context: zmq.Context, matrix_backend: str = "hardware",
+           layout: Optional[PanelLayout] = None, trace_log: Optional[str] = None, conflate: Optional[bool] = None,
+           rcvhwm: Optional[int] = None):
+    # imported on demand, the LED panel needs the rgbmatrix bindings and the sound pyaudio
+    if name == "led":
+        from ledpanelemotioncontroller import LEDPanelEmotionController
+        return LEDPanelEmotionController(address, context=context, matrix_backend=matrix_backend, layout=layout,
+                                         trace_log=trace_log, conflate=conflate, rcvhwm=rcvhwm)
+    from soundservercontroller import SoundListenerController
+    return SoundListenerController(address, context=context, trace_log=trace_log, conflate=conflate, rcvhwm=rcvhwm)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the emotion renderers in a single process.")
+    # no choices, argparse checks a list default against them and rejects it
+    parser.add_argument("renderers", nargs="*", help=f"renderers to run, of {', '.join(RENDERERS)} (default: all)")
+    parser.add_argument("--address", default="tcp://localhost:5555", help="ZMQ address of the publisher")
+    parser.add_argument("--matrix", choices=BACKENDS, default="hardware",
+                        help="LED panel or the in-memory emulator for headless runs")
+    parser.add_argument("--layout", help="JSON file of a panel wall with zones, see panellayout.PanelLayout")
+    parser.add_argument("--trace-log", help="file the traces of traced cues are appended to, see tracereport.py")
+    parser.add_argument("--conflate", action=argparse.BooleanOptionalAction,
+                        help="only process the newest pending message per topic (default: per renderer, see CONFLATE)")
+    parser.add_argument("--rcvhwm", type=int, help="messages queued per publisher (default: per renderer, see RCVHWM)")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.renderers if name not in RENDERERS]
+    if unknown:
+        parser.error(f"invalid renderer: {', '.join(unknown)} (choose from {', '.join(RENDERERS)})")
+    args.renderers = args.renderers or list(RENDERERS)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    layout = PanelLayout.load(args.layout) if args.layout else None
+
+    context = zmq.Context()
+    loop = EventLoop(context)
+    for name in args.renderers:
+        create(name, args.address, context, args.matrix, layout, args.trace_log, args.conflate, args.rcvhwm).start(loop)
+    signal.signal(signal.SIGTERM, lambda signum, frame: loop.stop())
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        pass  # the loop closed all listeners
+    context.term()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import os.path
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from pydub import AudioSegment
+
+import dsp
+from eies_protocol.emotions import Emotion
+from emotionsounds import EmotionSounds
+from pcmstore import PCMStore
+
+DEFAULT_BYTE_BUDGET = 64 * 1024 * 1024  # 64 MiB of rendered PCM
+
+DEFAULT_CACHE_DIR = os.path.join(EmotionSounds.SOUND_PATH, ".cache")
+
+
+class SoundCache:
+    """
+    Caches the emotion sounds in memory.
+    Every source file of the EmotionSounds is decoded, normalized and resampled only once,
+    rendered buffers are keyed by (emotion, duration, fade_time) and evicted
+    least recently used as soon as their size exceeds the byte budget.
+    With a cache directory the sources and rendered buffers are kept on disk as well and survive a restart,
+    see PCMStore.
+    """
+
+    def __init__(self, byte_budget: int = DEFAULT_BYTE_BUDGET, frame_rate: Optional[int] = None,
+                 cache_dir: Optional[str] = None):
+        """
+        :param byte_budget: maximum number of bytes held by rendered buffers
+        :param frame_rate: frame rate of the sound device the sources are resampled to, None keeps their rate
+        :param cache_dir: directory of the on-disk cache, None keeps the sounds in memory only
+        """
+        self.byte_budget = byte_budget
+        self.frame_rate = frame_rate
+        self.disk = PCMStore(cache_dir) if cache_dir is not None else None
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._sources: Dict[Emotion, AudioSegment] = {}
+        self._digests: Dict[Emotion, Optional[str]] = {}
+        self._rendered: OrderedDict[Tuple[Emotion, int, int], AudioSegment] = OrderedDict()
+        self._rendered_bytes = 0
+        self._lock = threading.Lock()
+
+    def preload(self, emotions: Optional[Iterable[Emotion]] = None):
+        """
+        Decode and normalize the source files up front.
+        :param emotions: emotions to load, defaults to all
+        """
+        for emotion in emotions if emotions is not None else Emotion:
+            self.source(emotion)
+
+    def source(self, emotion: Emotion) -> AudioSegment:
+        """
+        Return the decoded and peak normalized 16 bit sound of an emotion.
+        :param emotion: an Emotion
+        :return: AudioSegment
+        """
+        with self._lock:
+            sound = self._sources.get(emotion)
+        if sound is None:
+            sound = self._cached(emotion, (self.frame_rate or 0,), lambda: dsp.prepare(
+                AudioSegment.from_file(EmotionSounds.sound_provider(emotion)), self.frame_rate))
+            with self._lock:
+                self._sources[emotion] = sound
+        return sound
+
+    def render(self, emotion: Emotion, duration: int, fade_time: int) -> AudioSegment:
+        """
+        Return the sound of an emotion faded and looped to the given duration.
+        :param emotion: an Emotion
+        :param duration: duration in seconds
+        :param fade_time: fade in and fade out time in milliseconds
+        :return: AudioSegment
+        """
+        key = (emotion, duration, fade_time)
+        with self._lock:
+            rendered = self._rendered.get(key)
+            if rendered is not None:
+                self._rendered.move_to_end(key)
+                self.hits += 1
+                return rendered
+            self.misses += 1
+
+        rendered = self._cached(emotion, (self.frame_rate or 0, duration, fade_time),
+                                lambda: self._render(self.source(emotion), duration, fade_time))
+        self._store(key, rendered)
+        return rendered
+
+    def _cached(self, emotion: Emotion, params: Tuple[int, ...], make: Callable[[], AudioSegment]) -> AudioSegment:
+        """Load a sound from the disk cache, or make and store it there."""
+        digest = self._digest(emotion)
+        if digest is None:
+            return make()
+        sound = self.disk.load(emotion.value, digest, params)
+        if sound is not None:
+            with self._lock:
+                self.disk_hits += 1
+            return sound
+        sound = make()
+        self.disk.store(emotion.value, digest, params, sound)
+        return sound
+
+    def _digest(self, emotion: Emotion) -> Optional[str]:
+        """Hash the source file of an emotion once and drop its stale disk entries."""
+        if self.disk is None:
+            return None
+        with self._lock:
+            if emotion in self._digests:
+                return self._digests[emotion]
+        digest = self.disk.digest(EmotionSounds.sound_provider(emotion))
+        if digest is not None:
+            self.disk.prune(emotion.value, digest)
+        with self._lock:
+            self._digests[emotion] = digest
+        return digest
+
+    @staticmethod
+    def _render(sound: AudioSegment, duration: int, fade_time: int) -> AudioSegment:
+        # the source is tiled to the full duration, fading in at the start and out at the end like LoopingStream
+        return dsp.render(sound, duration * 1000, fade_time)
+
+    def _store(self, key: Tuple[Emotion, int, int], rendered: AudioSegment):
+        size = len(rendered.raw_data)
+        if size > self.byte_budget:
+            return  # would evict everything else and still not fit
+        with self._lock:
+            if key in self._rendered:
+                return
+            self._rendered[key] = rendered
+            self._rendered_bytes += size
+            while self._rendered_bytes > self.byte_budget:
+                _, evicted = self._rendered.popitem(last=False)
+                self._rendered_bytes -= len(evicted.raw_data)
+
+    def clear(self):
+        """Drop all rendered buffers, keeps the decoded sources."""
+        with self._lock:
+            self._rendered.clear()
+            self._rendered_bytes = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and memory usage of the cache."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "entries": len(self._rendered),
+                "bytes": self._rendered_bytes,
+                "byte_budget": self.byte_budget,
+            }
@@ -1,17 +1,24 @@
-import threading
-from typing import Dict, Any
+from functools import partial
+from typing import Callable, Dict, Any, Optional
 
-from emotions import Emotion
-from emotionsounds import EmotionSounds
+from eies_protocol import tracing
+
+from audiostream import LoopingStream
+from eies_protocol.emotions import Emotion
+from eventloop import EventLoop
+from playbackengine import PlaybackEngine, PlaybackPolicy, Sound
+from soundcache import DEFAULT_CACHE_DIR, SoundCache
 from zmq_server_controllers import BaseZMQListener
 
-from pydub import AudioSegment
-from pydub.playback import play
+import zmq
+from pydub.exceptions import CouldntDecodeError
 
 DEFAULT_FADE_TIME = 1000
 
 DEFAULT_DURATION = 10
 
+DEFAULT_STREAM_THRESHOLD = 60  # cues of at least this many seconds are streamed instead of rendered
+
 DEFAULT_ZMQ_ADDRESS = "tcp://localhost:5555"
 
 class SoundListenerController(BaseZMQListener):
@@ -19,45 +26,87 @@ class SoundListenerController(BaseZMQListener):
     Derived class for handling sound-related payloads via ZMQ server.
     """
 
-    def __init__(self, address: str = DEFAULT_ZMQ_ADDRESS):
-        super().__init__(address)
+    SUBSCRIPTIONS = ("sound.", "show.")
+
+    def __init__(self, address: str = DEFAULT_ZMQ_ADDRESS, sound_cache: SoundCache = None,
+                 playback: PlaybackEngine = None, policy: PlaybackPolicy = PlaybackPolicy.PREEMPT,
+                 stream_threshold: int = DEFAULT_STREAM_THRESHOLD, context: Optional[zmq.Context] = None,
+                 trace_log: Optional[str] = None, conflate: Optional[bool] = None, rcvhwm: Optional[int] = None):
+        super().__init__(address, trace_log=trace_log, context=context, conflate=conflate, rcvhwm=rcvhwm)
+        self.sound_cache = sound_cache if sound_cache is not None else SoundCache(cache_dir=DEFAULT_CACHE_DIR)
+        self.playback = playback if playback is not None else PlaybackEngine(policy=policy)
+        self.stream_threshold = stream_threshold
+
+    def start(self, loop: Optional[EventLoop] = None):
+        """
+        Decode all emotion sounds before listening, so the first cue does not wait for it.
+        :param loop: shared event loop of the listener, see BaseZMQListener.start
+        """
+        try:
+            self.sound_cache.preload()
+        except (OSError, CouldntDecodeError) as e:
+            self.logger.warning(f"Could not preload sounds, loading on first use: {e}")
+        self.playback.start()
+        super().start(loop)
+
+    def close(self):
+        self.playback.stop()
+        super().close()
 
     def process(self, message: Dict[str, Any]):
         """
         Process sound-related payloads.
         Expected payload format: {"action": "play", "emotion": "...", "duration": 10, "fade_time": 1000}
+        or {"action": "stop"} to fade out the sound that is playing.
         :param message: Incoming message
         :return: Response
         """
-        if message.get("action") == "play":
+        if message.get("action") == "stop":
+            self.logger.debug("Stopping current sound")
+            self.playback.stop_current()
+        elif message.get("action") == "play":
             try:
                 emotion = Emotion(message.get("emotion"))
                 duration = message.get("duration", DEFAULT_DURATION)
                 fade_time = message.get("fade_time", DEFAULT_FADE_TIME)
                 self.logger.info(f"Playing sound for emotion: {emotion}, for {duration}s with fade time {fade_time}ms")
-                filename = EmotionSounds.sound_provider(emotion)
-                threading.Thread(target=self._play_audio, args=(filename, duration, fade_time), daemon=True).start()
+                self._submit(partial(self._render_audio, emotion, duration, fade_time, trace=tracing.defer(message)))
             except ValueError as e:
                 self.logger.debug(f"Invalid emotion: {e}")
 
-    def _play_audio(self, filename: str, duration: int, fade_time: int):
-        self.logger.info(f"Playing audio file: {filename}")
-        sound = AudioSegment.from_file(filename)
-
-        # Normalize volume
-        sound = sound.apply_gain(-sound.max_dBFS)
-
-        # Apply fade-in and fade-out
-        sound = sound.fade_in(fade_time).fade_out(fade_time)
-
-        # Calculate how many loops are needed to fill 'duration' seconds
-        loops = max(1, duration * 1000 // len(sound))
-
-        # Repeat sound to fill full duration
-        full_sound = sound * loops
-        full_sound = full_sound[:duration * 1000]  # Trim if slightly over
-
-        play(full_sound)
+    def compile_cue(self, cue: Dict[str, Any]) -> Callable[[], None]:
+        """
+        Render the sound of a play cue of a timeline up front, so playing it is handing over the buffer.
+        Long cues are streamed like in process, only their source is decoded now.
+        """
+        if cue.get("action") != "play":
+            return super().compile_cue(cue)
+        emotion = Emotion(cue.get("emotion"))
+        duration = cue.get("duration", DEFAULT_DURATION)
+        fade_time = cue.get("fade_time", DEFAULT_FADE_TIME)
+        if duration >= self.stream_threshold:
+            self.sound_cache.source(emotion)
+            return partial(self._submit, partial(self._render_audio, emotion, duration, fade_time))
+        sound = self.sound_cache.render(emotion, duration, fade_time)
+        return partial(self._submit, lambda: sound)
+
+    def _submit(self, render: Callable[[], Sound]):
+        if not self.playback.submit(render):
+            self.logger.warning(f"Playback queue full, dropped sound: {self.playback.stats}")
+
+    def _render_audio(self, emotion: Emotion, duration: int, fade_time: int,
+                      trace: Optional[Dict[str, Any]] = None) -> Sound:
+        self.logger.info(f"Playing audio for: {emotion}")
+        if duration >= self.stream_threshold:
+            # long cues are streamed period by period instead of being rendered up front
+            sound = LoopingStream(self.sound_cache.source(emotion), duration * 1000, fade_time,
+                                  period=self.playback.chunk_length)
+        else:
+            sound = self.sound_cache.render(emotion, duration, fade_time)
+            self.logger.debug(f"Sound cache: {self.sound_cache.stats}, playback: {self.playback.stats}")
+        if trace is not None:
+            self.finish_trace(trace, "rendered")
+        return sound
 
     def _safeguard_non_negative_int(self, number: int):
         try:
@@ -88,7 +137,15 @@ class SoundListenerController(BaseZMQListener):
                 return ft
 
 if __name__ == "__main__":
-    sound_server = SoundListenerController()
+    import argparse
+    parser = argparse.ArgumentParser(description="Play the emotion sounds.")
+    parser.add_argument("--trace-log", help="file the traces of traced cues are appended to, see tracereport.py")
+    parser.add_argument("--conflate", action=argparse.BooleanOptionalAction,
+                        help="only process the newest pending cue (default: off)")
+    parser.add_argument("--rcvhwm", type=int, help="messages queued per publisher (default: ZMQ default)")
+    args = parser.parse_args()
+    sound_server = SoundListenerController(trace_log=args.trace_log, conflate=args.conflate, rcvhwm=args.rcvhwm)
     sound_server.start()
     # Keep the application running
     input("Press Enter to exit...\n")
+    sound_server.stop()
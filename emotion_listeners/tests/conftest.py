@@ -1,13 +1,79 @@
+import threading
+import time
 from unittest.mock import MagicMock
 
 import pytest
+import zmq
+from pydub.generators import Sine
 
 import ledpanelemotioncontroller
+from eies_protocol import wireprotocol
 from emotion_listeners.ledpanelemotioncontroller import LEDPanelEmotionController
+from eventloop import EventLoop
 from soundservercontroller import SoundListenerController
 from zmq_server_controllers import BaseZMQListener
 
 
+class RecordingListener(BaseZMQListener):
+    """Records the processed messages with the time.monotonic() they were processed at."""
+
+    def __init__(self, address="tcp://127.0.0.1:5999", subscriptions=None, **kwargs):
+        if subscriptions is not None:
+            self.SUBSCRIPTIONS = subscriptions
+        kwargs.setdefault("metrics_interval", 0)
+        super().__init__(address, **kwargs)
+        self.processed = []
+        self.done = threading.Event()
+        self.closed = False
+
+    @property
+    def messages(self):
+        return [message for _, message in self.processed]
+
+    def process(self, message):
+        self.processed.append((time.monotonic(), message))
+        self.done.set()
+
+    def close(self):
+        self.closed = True
+        super().close()
+
+
+def on_loop(listener, loop):
+    """Replace the socket of the listener by a mock and let it schedule on the (running) loop."""
+    listener.socket.close()
+    listener.socket = MagicMock()
+    listener.loop = loop
+    return listener
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def published(message, sequence=1):
+    """The parts of a message as the publisher sends them."""
+    data = wireprotocol.encode(message)
+    return [wireprotocol.topic(data), wireprotocol.SEQUENCE.pack(sequence), data]
+
+
+def tone(duration=1000, volume=-12.0, frame_rate=44100, sample_width=2):
+    return Sine(440, sample_rate=frame_rate).to_audio_segment(
+        duration=duration, volume=volume).set_sample_width(sample_width)
+
+
+@pytest.fixture
+def loop():
+    loop = EventLoop(zmq.Context())
+    loop.start()
+    yield loop
+    loop.stop(timeout=1.0)
+    loop.context.term()
+
+
 class CanvasStub(object):
     def __init__(self, width, height):
         self.width = width
@@ -0,0 +1,55 @@
+import pytest
+from pydub import AudioSegment
+
+from audiostream import LoopingStream
+from emotion_listeners.tests.conftest import tone
+
+
+@pytest.fixture
+def source():
+    return tone(duration=300)
+
+
+def test_stream_covers_duration(source):
+    chunks = list(LoopingStream(source, duration=1000, fade_time=200, period=50))
+
+    assert sum(len(chunk) for chunk in chunks) == 1000
+    assert max(len(chunk) for chunk in chunks) == 50
+
+
+def test_stream_loops_source(source):
+    stream = LoopingStream(source, duration=1000, fade_time=0, period=70)
+    streamed = sum(stream, AudioSegment.empty())
+
+    assert streamed.raw_data == (source * 4)[:1000].raw_data
+
+
+def test_fade_envelope(source):
+    chunks = list(LoopingStream(source, duration=1000, fade_time=200, period=50))
+
+    assert chunks[0].rms < chunks[2].rms < chunks[5].rms
+    assert chunks[5].rms == pytest.approx(chunks[10].rms, rel=0.05)
+    assert chunks[-1].rms < chunks[-3].rms < chunks[10].rms
+
+
+def test_fade_longer_than_half_duration(source):
+    stream = LoopingStream(source, duration=300, fade_time=1000, period=50)
+    gains = [stream._gain(position) for position in (0, 150, 300)]
+
+    assert gains == [0.0, 1.0, 0.0]
+
+
+def test_stop_mid_way(source):
+    stream = LoopingStream(source, duration=600000, fade_time=1000, period=50)
+    streamed = 0
+    for chunk in stream:
+        streamed += len(chunk)
+        if streamed >= 500:
+            stream.stop()
+
+    assert streamed == 500
+
+
+def test_empty_source():
+    with pytest.raises(ValueError):
+        LoopingStream(AudioSegment.empty(), duration=1000, fade_time=100)
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+import benchmark
+
+
+def test_steady_rate():
+    cues = list(benchmark.steady(rate=20, duration=2, renderers=["led"]))
+
+    assert len(cues) == 40
+    assert cues[1][0] == pytest.approx(0.05)
+    assert {message["action"] for _, message in cues} == {"draw"}
+
+
+def test_bursts_are_reproducible():
+    first = list(benchmark.bursts(rate=100, duration=2, burst_size=5, seed=3))
+    second = list(benchmark.bursts(rate=100, duration=2, burst_size=5, seed=3))
+
+    assert first == second
+    assert len(first) % 5 == 0
+    assert all(at < 2 + 0.005 for at, _ in first)
+    assert first[1][0] - first[0][0] == pytest.approx(0.001)
+
+
+def test_replay_recording():
+    lines = [json.dumps({"at": 0.5, "message": {"action": "stop"}}), "",
+             json.dumps({"at": 1, "message": {"action": "draw", "emotion": "fear"}})]
+
+    assert list(benchmark.replay(lines)) == [(0.5, {"action": "stop"}),
+                                             (1.0, {"action": "draw", "emotion": "fear"})]
+
+
+def results(throughput, latency, cpu):
+    return {"cpu_percent": cpu, "max_rss_kb": 1000,
+            "renderers": {"led": {"throughput_per_s": throughput, "latency_p50_ms": latency,
+                                  "latency_p95_ms": latency, "latency_p99_ms": None}}}
+
+
+def test_compare_flags_regressions_only():
+    rows = {row[0]: row for row in benchmark.compare(results(80, 12, 10), results(100, 10, 10), tolerance=10)}
+
+    assert rows["led.throughput_per_s"][-1]  # 20% less throughput
+    assert rows["led.latency_p50_ms"][-1]  # 20% more latency
+    assert not rows["cpu_percent"][-1]
+    assert "led.latency_p99_ms" not in rows
+
+    improved = benchmark.compare(results(120, 8, 5), results(100, 10, 10))
+    assert not any(row[-1] for row in improved)
+
+
+def test_led_benchmark_run():
+    cues = benchmark.steady(rate=50, duration=0.4, renderers=["led"])
+
+    results = benchmark.run(cues, renderers=["led"], settle=0.3)
+
+    led = results["renderers"]["led"]
+    assert results["published"] == 20
+    assert led["messages"] + led["counters"].get("conflated", 0) == 20
+    assert led["latency_p50_ms"] is not None
+    assert "process" in led["stages"]
@@ -0,0 +1,131 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+import zmq
+
+from eies_protocol import wireprotocol
+from eies_protocol.emotions import Emotion
+from emotioncolors import EmotionColors
+from ledpanelemotioncontroller import LEDPanelEmotionController
+from panellayout import PanelLayout
+
+
+@pytest.fixture
+def controller():
+    controller = LEDPanelEmotionController(matrix_backend="emulator")
+    controller.socket.close()
+    return controller
+
+
+def shown_color(controller, emotion, scale=100):
+    red, green, blue, brightness = EmotionColors.color_provider(emotion)
+    brightness = brightness * scale // 100
+    return [red * brightness // 100, green * brightness // 100, blue * brightness // 100]
+
+
+def test_margins_are_swapped_in(controller):
+    controller.process({"action": "draw", "emotion": "happiness"})
+    controller._render_frame(time.monotonic())
+    assert not controller.matrix.displayed.pixels[32, 32].any()
+
+    controller.process({"action": "configure", "margins": ["1px", "1px", "1px", "1px"]})
+    assert controller.canvas_dimensions["top"]["y_end"] == 16  # applied by the render thread only
+    controller._apply_pending_configs()
+
+    assert controller.canvas_dimensions["top"]["y_end"] == 1
+    assert controller.drawable_mask()[1, 1]
+    # the shown emotion is redrawn with the new margins
+    assert controller.matrix.displayed.pixels[1, 32].tolist() == shown_color(controller, Emotion.HAPPINESS)
+    assert not controller.matrix.displayed.pixels[32, 32].any()
+
+
+def test_brightness_and_pwm_bits(controller):
+    controller.process({"action": "configure", "brightness": 50, "pwm_bits": 7})
+    controller._apply_pending_configs()
+    controller.process({"action": "draw", "emotion": "anger"})
+    controller._render_frame(time.monotonic())
+
+    assert controller.matrix.pwmBits == 7
+    assert controller.matrix.displayed.pixels[0, 0].tolist() == shown_color(controller, Emotion.ANGER, 50)
+    assert controller.metrics.snapshot()["counters"]["configured"] == 1
+
+
+@pytest.mark.parametrize("message", [
+    {"pwm_bits": 0}, {"pwm_bits": 12}, {"pwm_bits": True}, {"brightness": 101}, {"brightness": "50"},
+    {"margins": ["10%", "10%"]}, {"margins": ["60%", "50%", "0px", "0px"]}, {"margins": ["10", "1%", "1%", "1%"]},
+])
+def test_invalid_configurations_are_ignored(controller, message):
+    controller.process({"action": "configure", **message})
+
+    assert controller._pending_configs.empty()
+
+
+def test_pending_configurations_are_merged(controller):
+    controller.process({"action": "configure", "margins": ["1px", "1px", "1px", "1px"]})
+    controller.process({"action": "configure", "brightness": 80})
+    controller.process({"action": "configure", "margins": ["2px", "2px", "2px", "2px"], "pwm_bits": 9})
+
+    with patch.object(controller, "build_frame_cache", wraps=controller.build_frame_cache) as build:
+        controller._apply_pending_configs()
+
+    assert build.call_count == 1
+    assert (controller.brightness_scale, controller.matrix.pwmBits) == (80, 9)
+    assert controller.canvas_dimensions["top"]["y_end"] == 2
+
+
+def test_zone_margins_of_a_layout():
+    layout = PanelLayout(rows=16, cols=16, chain_length=2)
+    controller = LEDPanelEmotionController(matrix_backend="emulator", layout=layout)
+    controller.socket.close()
+    controller.process({"action": "draw", "emotion": "fear", "transition": 0})
+    controller._render_frame(time.monotonic())
+
+    controller.process({"action": "configure", "margins": ["50%", "50%", "0px", "0px"], "zone": "panel_0_1"})
+    controller.process({"action": "configure", "margins": ["1px", "1px", "1px", "1px"], "zone": "panel_0_0"})
+    controller.process({"action": "configure", "margins": ["1px", "1px", "1px", "1px"], "zone": "panel_9_9"})
+    controller._apply_pending_configs()
+    assert not controller._is_idle(time.monotonic())
+    controller._render_frame(time.monotonic())
+
+    pixels = controller.matrix.displayed.pixels
+    assert pixels[8, 24].any()  # the right panel is drawn completely
+    assert not pixels[8, 8].any() and pixels[0, 8].any()
+    assert controller.layout.zone("panel_0_0").margins == ("1px", "1px", "1px", "1px")
+    assert layout.zone("panel_0_0").margins != controller.layout.zone("panel_0_0").margins
+
+
+def test_configure_messages_are_not_conflated(controller):
+    messages = []
+    for sequence, message in enumerate([{"action": "configure", "brightness": 50},
+                                        {"action": "draw", "emotion": "fear"},
+                                        {"action": "configure", "pwm_bits": 8},
+                                        {"action": "draw", "emotion": "anger"}], 1):
+        data = wireprotocol.encode(message)
+        messages.append([wireprotocol.topic(data), wireprotocol.SEQUENCE.pack(sequence), data])
+    controller.socket = MagicMock()
+    controller.socket.recv_multipart.side_effect = messages + [zmq.Again()]
+    controller.process = MagicMock()
+
+    controller.handle_message()
+
+    assert [call.args[0] for call in controller.process.call_args_list] == [
+        {"action": "configure", "brightness": 50}, {"action": "configure", "pwm_bits": 8},
+        {"action": "draw", "emotion": "anger"}]
+
+
+def test_render_loop_applies_configuration_while_idle(controller):
+    controller._rendering = True
+    thread = threading.Thread(target=controller._render_loop, daemon=True)
+    thread.start()
+    try:
+        controller.process({"action": "configure", "pwm_bits": 5})
+        deadline = time.monotonic() + 2
+        while controller.matrix.pwmBits != 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        controller.stop_rendering()
+        thread.join(2)
+
+    assert controller.matrix.pwmBits == 5
@@ -0,0 +1,86 @@
+from unittest.mock import MagicMock
+
+import zmq
+
+from emotion_listeners.tests.conftest import published
+from ledpanelemotioncontroller import LEDPanelEmotionController
+from soundservercontroller import SoundListenerController
+from zmq_server_controllers import BaseZMQListener
+
+
+def replace_socket(controller, messages):
+    socket = MagicMock()
+    socket.recv_multipart.side_effect = messages + [zmq.Again()]
+    controller.socket.close()
+    controller.socket = socket
+    controller.process = MagicMock()
+    return controller.process
+
+
+def test_conflation_keeps_newest_per_topic(controller_instance):
+    controller_instance.conflate = True
+    process = replace_socket(controller_instance, [
+        published({"action": "play", "emotion": "fear"}, 1),
+        published({"action": "stop"}, 1),
+        published({"action": "play", "emotion": "anger"}, 2),
+    ])
+
+    controller_instance.handle_message()
+
+    assert [call.args[0] for call in process.call_args_list] == [
+        {"action": "stop"}, {"action": "play", "emotion": "anger"}]
+    counters = controller_instance.metrics.snapshot()["counters"]
+    assert counters["conflated"] == 1
+    assert counters["messages"] == 2
+
+
+def test_without_conflation_every_message_is_processed(controller_instance):
+    process = replace_socket(controller_instance, [
+        published({"action": "play", "emotion": "fear"}, 1),
+        published({"action": "play", "emotion": "anger"}, 2),
+    ])
+
+    controller_instance.handle_message()
+    controller_instance.handle_message()
+
+    assert process.call_count == 2
+    assert "conflated" not in controller_instance.metrics.snapshot()["counters"]
+
+
+def test_sequence_gaps_are_counted_as_dropped(controller_instance):
+    replace_socket(controller_instance, [
+        published({"action": "play", "emotion": "fear"}, 1),
+        published({"action": "stop"}, 7),
+        published({"action": "play", "emotion": "fear"}, 4),
+    ])
+
+    for _ in range(3):
+        controller_instance.handle_message()
+
+    assert controller_instance.metrics.snapshot()["counters"]["dropped"] == 2
+
+
+class PlainListener(BaseZMQListener):
+    def process(self, message):
+        pass
+
+
+def test_high_water_mark_is_applied():
+    listener = PlainListener("tcp://127.0.0.1:5999", rcvhwm=5)
+
+    assert listener.socket.getsockopt(zmq.RCVHWM) == 5
+
+
+def test_led_panel_conflates_by_default():
+    assert LEDPanelEmotionController.CONFLATE
+    assert not SoundListenerController.CONFLATE
+
+
+def test_listeners_forward_conflation_and_high_water_mark():
+    led = LEDPanelEmotionController(matrix_backend="emulator", conflate=False, rcvhwm=5)
+    sound = SoundListenerController(conflate=True, rcvhwm=7)
+
+    assert not led.conflate and led.socket.getsockopt(zmq.RCVHWM) == 5
+    assert sound.conflate and sound.socket.getsockopt(zmq.RCVHWM) == 7
+    led.socket.close()
+    sound.socket.close()
@@ -1,3 +1,11 @@
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from eies_protocol.emotions import Emotion
+from ledanimation import EmotionAnimator
+
+
 def test_brightness_zero(panel, mock_canvas):
     panel._fill_canvas(255, 0, 0, brightness=0)
 
@@ -32,13 +40,27 @@ def test_normal_case(panel, mock_canvas):
             for y in range(region["y_start"], region["y_end"] + 1):
                 expected_pixels.add((x, y))
 
-    # Collect actual pixels drawn
-    actual_pixels = {(call[0][0], call[0][1]) for call in mock_canvas.SetPixel.call_args_list}
+    # Collect actual pixels drawn, the frame is written in one call
+    mock_canvas.SetImage.assert_called_once()
+    frame = np.asarray(mock_canvas.SetImage.call_args[0][0])
+    assert frame.shape == (64, 64, 3)
+    actual_pixels = {(x, y) for y, x in zip(*np.nonzero(frame.any(axis=2)))}
 
-    # Ensure Fill ist not called
+    # Ensure Fill ist not called and no pixel is set one by one
     mock_canvas.Fill.assert_not_called()
+    mock_canvas.SetPixel.assert_not_called()
     # Ensure all expected pixels were drawn
-    assert actual_pixels == expected_pixels
+    assert actual_pixels == {(x, y) for x, y in expected_pixels if x < 64 and y < 64}
+    assert (frame[frame.any(axis=2)] == (255, 255, 255)).all()
+
+def test_drawable_mask_is_reused(panel):
+    mask = panel.drawable_mask()
+    assert panel.drawable_mask() is mask
+
+    panel.canvas_dimensions["left"] = {"x_start": 0, "x_end": 25, "y_start": 20, "y_end": 30}
+    changed = panel.drawable_mask()
+    assert changed is not mask
+    assert changed[25, 25] and not mask[25, 25]
 
 def test_partial_top_full_bottom_fill(panel, mock_canvas):
     panel.canvas_dimensions.update({
@@ -63,3 +85,88 @@ def test_full_top_full_bottom_fill(panel, mock_canvas):
     # Ensure Fill was called for the full screen case
     mock_canvas.Fill.assert_called_once_with(255, 255, 255)
     mock_canvas.SetPixel.assert_not_called()
+
+class MatrixStub(object):
+    def __init__(self, canvas):
+        self.displayed = canvas
+        self.created = []
+        self.swaps = 0
+
+    def CreateFrameCanvas(self):
+        canvas = MagicMock(width=64, height=64)
+        self.created.append(canvas)
+        return canvas
+
+    def SwapOnVSync(self, canvas):
+        previous, self.displayed = self.displayed, canvas
+        self.swaps += 1
+        return previous
+
+def test_frame_cache_swaps_prerendered_canvases(panel, mock_canvas):
+    panel.matrix = MatrixStub(MagicMock(width=64, height=64))
+    panel.build_frame_cache()
+    assert len(panel.matrix.created) == len(Emotion)
+
+    panel._draw_on_led(Emotion.FEAR)
+    panel._draw_on_led(Emotion.FEAR)
+
+    fear_canvas = panel.matrix.displayed
+    assert fear_canvas is panel.matrix.created[list(Emotion).index(Emotion.FEAR)]
+    assert fear_canvas.brightness == 25
+    fear_canvas.SetImage.assert_called_once()
+    assert panel.matrix.swaps == 1
+    # the spare canvas is never drawn on while building the cache
+    mock_canvas.SetImage.assert_not_called()
+
+def test_frame_cache_rebuilt_on_dimension_change(panel, mock_canvas):
+    panel.matrix = MatrixStub(MagicMock(width=64, height=64))
+    panel.build_frame_cache()
+    panel._draw_on_led(Emotion.SADNESS)
+    sadness_canvas = panel.matrix.displayed
+
+    panel.canvas_dimensions["top"] = {"x_start": 0, "x_end": 63, "y_start": 0, "y_end": 63}
+    panel._draw_on_led(Emotion.SADNESS)
+
+    # no new canvases, the displayed one got redrawn offscreen and swapped in
+    assert len(panel.matrix.created) == len(Emotion)
+    assert panel.matrix.displayed is mock_canvas
+    mock_canvas.Fill.assert_called_once_with(104, 109, 145)
+    assert panel.canvas is sadness_canvas
+    sadness_canvas.Fill.assert_not_called()
+
+def test_process_only_sets_target(panel, mock_canvas):
+    panel.matrix = MatrixStub(MagicMock(width=64, height=64))
+    panel.animator = EmotionAnimator(transition_time=500)
+    panel._target_changed = MagicMock()
+
+    panel.process({"action": "draw", "emotion": "anger"})
+
+    assert panel.animator.target is Emotion.ANGER
+    panel._target_changed.set.assert_called_once()
+    assert panel.matrix.swaps == 0
+
+def test_animation_frames_use_spare_canvases(panel, mock_canvas):
+    initial_canvas = MagicMock(width=64, height=64)
+    panel.matrix = MatrixStub(initial_canvas)
+    panel.build_frame_cache()
+    panel.animator = EmotionAnimator(transition_time=1000, easing="linear")
+    panel.animator.set_target(Emotion.NEUTRAL, now=0.0)
+    panel._render_frame(0.0)
+    neutral_canvas = panel.matrix.displayed
+
+    panel.animator.set_target(Emotion.HAPPINESS, now=1.0)
+    panel._render_frame(1.5)
+    assert panel.matrix.displayed is mock_canvas
+    assert mock_canvas.brightness == 100
+    # the prerendered canvas coming back is not drawn on, the initial canvas of the matrix is used instead
+    assert panel.canvas is initial_canvas
+    assert neutral_canvas is panel._frames[Emotion.NEUTRAL]
+    panel._render_frame(1.6)
+    assert panel.matrix.displayed is initial_canvas
+    assert panel.canvas is mock_canvas
+
+    panel._render_frame(2.0)
+    assert panel.matrix.displayed is panel._frames[Emotion.HAPPINESS]
+    assert panel._displayed_emotion is Emotion.HAPPINESS
+    assert panel._back_canvas is initial_canvas
+    assert len(panel.matrix.created) == len(Emotion)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+import dsp
+from emotion_listeners.tests.conftest import tone
+
+
+def test_samples_are_frames_by_channels():
+    stereo = AudioSegment.silent(duration=100, frame_rate=8000).set_channels(2)
+
+    assert dsp.samples(stereo).shape == (800, 2)
+
+
+@pytest.mark.parametrize("sample_width", [1, 2, 3, 4])
+def test_prepare_normalizes_to_16_bit_full_scale(sample_width):
+    prepared = dsp.prepare(tone(sample_width=sample_width))
+
+    assert prepared.sample_width == 2
+    assert np.abs(dsp.samples(prepared)).max() == dsp.FULL_SCALE
+
+
+def test_prepare_keeps_silence():
+    prepared = dsp.prepare(AudioSegment.silent(duration=100))
+
+    assert not dsp.samples(prepared).any()
+
+
+def test_prepare_resamples_to_the_device_rate():
+    prepared = dsp.prepare(tone(frame_rate=22050), frame_rate=48000)
+
+    assert prepared.frame_rate == 48000
+    assert len(dsp.samples(prepared)) == 48000
+    assert len(prepared) == 1000
+
+
+def test_tile_loops_to_exact_length():
+    data = np.arange(6, dtype=np.int16).reshape(3, 2)
+
+    tiled = dsp.tile(data, 7)
+
+    assert tiled.shape == (7, 2)
+    assert tiled[:, 0].tolist() == [0, 2, 4, 0, 2, 4, 0]
+    with pytest.raises(ValueError):
+        dsp.tile(data[:0], 7)
+
+
+def test_fade_only_touches_the_ends():
+    data = np.full((100, 1), 1000, dtype=np.int16)
+
+    dsp.fade(data, 10)
+
+    assert data[0, 0] == 0
+    assert data[9, 0] == 900
+    assert (data[10:90] == 1000).all()
+    assert data[90, 0] == 900
+    assert data[-1, 0] == 0
+    assert (np.diff(data[:10, 0]) > 0).all()
+
+
+def test_fade_is_shortened_for_short_sounds():
+    data = np.full((10, 1), 1000, dtype=np.int16)
+
+    dsp.fade(data, 100)
+
+    assert data[0, 0] == data[-1, 0] == 0
+    assert data[4, 0] == data[5, 0] == 800
+
+
+def test_render_fills_the_duration():
+    sound = dsp.prepare(tone(duration=300))
+
+    rendered = dsp.render(sound, 1000, 100)
+
+    assert len(rendered) == 1000
+    samples = dsp.samples(rendered)
+    assert samples[0].max() == 0
+    assert np.abs(samples[4410:-4410]).max() > 30000
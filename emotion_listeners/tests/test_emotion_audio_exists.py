@@ -2,7 +2,7 @@ import os.path
 import wave
 import pytest
 from emotionsounds import EmotionSounds
-from emotions import Emotion
+from eies_protocol.emotions import Emotion
 
 @pytest.mark.integration
 def test_emotion_sounds_files_are_valid_wave():
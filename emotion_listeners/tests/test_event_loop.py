@@ -0,0 +1,62 @@
+import time
+
+import zmq
+
+from eies_protocol import wireprotocol
+from emotion_listeners.tests.conftest import RecordingListener, wait_until
+from eventloop import EventLoop
+
+
+def test_timers_run_in_order_and_can_be_cancelled():
+    context = zmq.Context()
+    loop = EventLoop(context)
+    calls = []
+    loop.call_later(0.05, calls.append, "late")
+    loop.call_later(0.01, calls.append, "early")
+    loop.call_later(0.02, calls.append, "cancelled").cancel()
+    loop.call_later(0.08, loop.stop)
+
+    loop.run()
+    context.term()
+
+    assert calls == ["early", "late"]
+
+
+def test_listeners_share_one_loop_and_context():
+    context = zmq.Context()
+    publisher = context.socket(zmq.PUB)
+    port = publisher.bind_to_random_port("tcp://127.0.0.1")
+    address = f"tcp://127.0.0.1:{port}"
+    loop = EventLoop(context)
+    led = RecordingListener(address, ("led.",), context=context)
+    sound = RecordingListener(address, ("sound.",), context=context)
+    led.start(loop)
+    sound.start(loop)
+    loop.start()
+    try:
+        time.sleep(0.2)  # let the subscriptions reach the publisher
+        for message in ({"action": "draw", "emotion": "fear"}, {"action": "stop"}):
+            data = wireprotocol.encode(message)
+            publisher.send_multipart([wireprotocol.topic(data), data])
+
+        assert wait_until(lambda: led.messages and sound.messages)
+    finally:
+        loop.stop(timeout=1.0)
+        publisher.close(linger=0)
+
+    assert led.messages == [{"action": "draw", "emotion": "fear"}]
+    assert sound.messages == [{"action": "stop"}]
+    assert led.closed and sound.closed
+    assert led.context is sound.context is context
+    context.term()  # returns as the loop closed all sockets
+
+
+def test_standalone_listener_stops_gracefully():
+    context = zmq.Context()
+    listener = RecordingListener(context=context)
+    listener.start()
+
+    listener.stop(timeout=1.0)
+
+    assert listener.closed
+    context.term()
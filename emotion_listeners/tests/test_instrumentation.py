@@ -0,0 +1,56 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from instrumentation import Instrumentation, LatencyHistogram
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for millis in range(1, 101):
+        histogram.record(millis / 1000)
+
+    summary = histogram.summary()
+    assert summary["count"] == 100
+    assert summary["max_ms"] == 100
+    assert summary["mean_ms"] == pytest.approx(50.5)
+    for percent in (50, 95, 99):
+        assert percent <= summary[f"p{percent}_ms"] <= percent * 1.25
+
+
+def test_empty_histogram():
+    assert LatencyHistogram().summary()["p99_ms"] == 0.0
+
+
+def test_snapshot_and_reset():
+    metrics = Instrumentation()
+    with metrics.measure("render"):
+        pass
+    metrics.record("swap", 0.002)
+    metrics.count("frames", 3)
+
+    snapshot = metrics.snapshot(reset=True)
+
+    assert set(snapshot["stages"]) == {"render", "swap"}
+    assert snapshot["stages"]["swap"]["count"] == 1
+    assert snapshot["counters"] == {"frames": 3}
+    assert snapshot["rates"]["frames"] > 0
+    assert metrics.snapshot()["counters"] == {}
+
+
+def test_listener_records_stages(controller_instance):
+    socket = MagicMock()
+    socket.recv_multipart.side_effect = [[b"unrouted", json.dumps({"action": "unknown"}).encode()],
+                                         [b"unrouted", b"no json"]]
+    controller_instance.socket.close()
+    controller_instance.socket = socket
+
+    controller_instance.handle_message()
+    controller_instance.handle_message()
+
+    snapshot = controller_instance.metrics.snapshot()
+    assert snapshot["stages"]["receive"]["count"] == 2
+    assert snapshot["stages"]["parse"]["count"] == 2
+    assert snapshot["stages"]["process"]["count"] == 1
+    assert snapshot["counters"] == {"messages": 1, "errors": 1}
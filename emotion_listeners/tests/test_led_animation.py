@@ -0,0 +1,75 @@
+import pytest
+
+from emotioncolors import EmotionColors
+from eies_protocol.emotions import Emotion
+from ledanimation import EmotionAnimator, ease_in_out, linear
+
+
+def test_easing_curves():
+    for curve in (linear, ease_in_out):
+        assert curve(0) == pytest.approx(0)
+        assert curve(0.5) == pytest.approx(0.5)
+        assert curve(1) == pytest.approx(1)
+    assert ease_in_out(0.1) < linear(0.1)
+
+
+def test_first_target_is_shown_at_once():
+    animator = EmotionAnimator(transition_time=500)
+    assert animator.frame(0.0) == (None, None)
+
+    animator.set_target(Emotion.HAPPINESS, now=10.0)
+
+    assert animator.frame(10.0) == (None, Emotion.HAPPINESS)
+
+
+def test_linear_transition():
+    animator = EmotionAnimator(transition_time=1000, easing="linear")
+    animator.set_target(Emotion.NEUTRAL, now=0.0)
+    animator.set_target(Emotion.HAPPINESS, now=1.0)
+
+    rgba, emotion = animator.frame(1.5)
+
+    assert emotion is None
+    assert rgba == (188, 190, 62, 100)  # halfway between grey and yellow
+    assert animator.frame(2.0) == (None, Emotion.HAPPINESS)
+
+
+def test_retarget_starts_from_current_state():
+    animator = EmotionAnimator(transition_time=1000, easing="linear")
+    animator.set_target(Emotion.NEUTRAL, now=0.0)
+    animator.set_target(Emotion.HAPPINESS, now=1.0)
+    halfway, _ = animator.frame(1.5)
+
+    animator.set_target(Emotion.ANGER, now=1.5, transition_time=200, easing="ease_in_out")
+
+    assert animator.frame(1.5) == (halfway, None)
+    assert animator.frame(2.0) == (None, Emotion.ANGER)
+
+
+def test_breathing_emotions_pulse():
+    animator = EmotionAnimator(transition_time=0, breathing_period=4.0, breathing_depth=0.5)
+    animator.set_target(Emotion.SADNESS, now=0.0)
+    *color, brightness = EmotionColors.color_provider(Emotion.SADNESS)
+
+    assert not animator.is_static(100.0)
+    assert animator.frame(0.0) == ((*color, brightness), None)
+    assert animator.frame(2.0) == ((*color, round(brightness / 2)), None)
+    assert animator.frame(4.0) == ((*color, brightness), None)
+
+
+def test_unknown_easing():
+    animator = EmotionAnimator()
+    with pytest.raises(KeyError):
+        animator.set_target(Emotion.FEAR, now=0.0, easing="bounce")
+
+
+@pytest.mark.parametrize("transition_time", ["500", -1, 0.5, True])
+def test_invalid_transition_time_keeps_the_target(transition_time):
+    animator = EmotionAnimator(transition_time=1000, easing="linear")
+    animator.set_target(Emotion.NEUTRAL, now=0.0)
+
+    with pytest.raises(ValueError):
+        animator.set_target(Emotion.HAPPINESS, now=1.0, transition_time=transition_time)
+
+    assert animator.target is Emotion.NEUTRAL
+    assert animator.frame(1.0) == (None, Emotion.NEUTRAL)
@@ -0,0 +1,73 @@
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from eies_protocol.emotions import Emotion
+from emotioncolors import EmotionColors
+from ledpanelemotioncontroller import LEDPanelEmotionController
+from matrixbackends import EmulatedCanvas, EmulatedMatrix, create_matrix
+
+
+def test_canvas_drawing_respects_brightness():
+    canvas = EmulatedCanvas(4, 3)
+    canvas.Fill(200, 100, 50)
+    assert canvas.pixels[2, 3].tolist() == [200, 100, 50]
+
+    canvas.brightness = 50
+    canvas.SetPixel(1, 0, 200, 100, 50)
+    canvas.SetPixel(10, 10, 255, 255, 255)  # outside, ignored
+    assert canvas.pixels[0, 1].tolist() == [100, 50, 25]
+
+    canvas.Clear()
+    assert not canvas.pixels.any()
+
+
+def test_set_image_is_clipped_at_the_offset():
+    canvas = EmulatedCanvas(4, 4)
+    image = Image.fromarray(np.full((3, 3, 3), 255, dtype=np.uint8), "RGB")
+
+    canvas.SetImage(image, 2, -1)
+
+    assert canvas.pixels[:, :, 0].tolist() == [[0, 0, 255, 255], [0, 0, 255, 255], [0, 0, 0, 0], [0, 0, 0, 0]]
+
+
+def test_swap_returns_previous_canvas_and_records(tmp_path):
+    matrix = EmulatedMatrix(rows=8, cols=8, record=True, max_frames=2)
+    initial = matrix.displayed
+    canvases = [matrix.CreateFrameCanvas() for _ in range(3)]
+    for value, canvas in enumerate(canvases):
+        canvas.Fill(value, value, value)
+
+    assert matrix.SwapOnVSync(canvases[0]) is initial
+    assert matrix.SwapOnVSync(canvases[1]) is canvases[0]
+    matrix.SwapOnVSync(canvases[2])
+
+    assert [frame[0, 0, 0] for frame in matrix.frames] == [1, 2]
+    paths = matrix.save_png_sequence(str(tmp_path / "frames"))
+    assert len(paths) == 2
+    with Image.open(paths[1]) as png:
+        assert png.getpixel((0, 0)) == (2, 2, 2)
+    matrix.save_gif(str(tmp_path / "frames.gif"))
+    with Image.open(tmp_path / "frames.gif") as gif:
+        assert gif.n_frames == 2
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_matrix("projector", 64, 64, 100)
+
+
+def test_controller_renders_on_emulator():
+    controller = LEDPanelEmotionController(matrix_backend="emulator")
+    try:
+        controller.process({"action": "draw", "emotion": "happiness"})
+        controller._render_frame(time.monotonic())
+    finally:
+        controller.socket.close()
+
+    pixels = controller.matrix.displayed.pixels
+    red, green, blue, _ = EmotionColors.color_provider(Emotion.HAPPINESS)
+    assert pixels[0, 0].tolist() == [red, green, blue]
+    assert not pixels[32, 32].any()  # the center is not drawn on
@@ -0,0 +1,128 @@
+import time
+from unittest.mock import patch
+
+import pytest
+
+from eies_protocol.emotions import Emotion
+from emotioncolors import EmotionColors
+from ledpanelemotioncontroller import LEDPanelEmotionController
+from panellayout import DEFAULT_MARGINS, PanelLayout, Zone
+
+
+def test_zone_mask_draws_border_only():
+    mask = Zone("z", 0, 0, 10, 10, ("20%", "10%", "1px", "2px")).mask()
+
+    # like the single panel, the top and left border include the row and column they end on
+    assert mask[:3].all() and mask[9].all()
+    assert mask[:, :2].all() and mask[:, 8:].all()
+    assert not mask[3:9, 2:8].any()
+
+
+def test_full_panel_zone_matches_single_panel(ledpanel_controller_bare):
+    ledpanel_controller_bare.canvas.width = ledpanel_controller_bare.canvas.height = 64
+    ledpanel_controller_bare.canvas_dimensions = ledpanel_controller_bare.calculate_drawable_area(*DEFAULT_MARGINS)
+    layout = PanelLayout(rows=64, cols=64, zones=[Zone("panel", 0, 0, 64, 64)])
+
+    assert ((layout.labels() == 1) == ledpanel_controller_bare.drawable_mask()).all()
+
+
+def test_zone_margins_exceeding_zone():
+    with pytest.raises(ValueError):
+        Zone("z", 0, 0, 10, 10, ("60%", "50%", "0px", "0px")).mask()
+
+
+def test_default_layout_has_one_zone_per_panel():
+    layout = PanelLayout(rows=8, cols=16, chain_length=2, parallel=2)
+
+    assert (layout.width, layout.height) == (32, 16)
+    assert [zone.name for zone in layout.zones] == ["panel_0_0", "panel_0_1", "panel_1_0", "panel_1_1"]
+    assert (layout.zone("panel_1_1").x, layout.zone("panel_1_1").y) == (16, 8)
+    with pytest.raises(KeyError):
+        layout.zone("panel_2_0")
+
+
+def test_labels_and_compose():
+    layout = PanelLayout(rows=8, cols=8, chain_length=2)
+    labels = layout.labels()
+
+    assert labels[0, 0] == 1 and labels[0, 15] == 2
+    assert labels[4, 4] == 0  # inside the margins of the first panel
+
+    frame = layout.compose([(255, 0, 0), (0, 0, 255)])
+    assert frame.shape == (8, 16, 3)
+    assert frame[0, 0].tolist() == [255, 0, 0]
+    assert frame[7, 8].tolist() == [0, 0, 255]
+    assert not frame[4, 4].any()
+
+
+def test_zone_outside_of_canvas():
+    layout = PanelLayout(rows=8, cols=8, zones=[Zone("wide", 0, 0, 16, 8)])
+    with pytest.raises(ValueError):
+        layout.labels()
+
+
+def test_from_config():
+    layout = PanelLayout.from_config({"rows": 32, "cols": 32, "chain_length": 3,
+                                      "zones": [{"name": "left", "x": 0, "y": 0, "width": 48, "height": 32},
+                                                {"name": "right", "x": 48, "y": 0, "width": 48, "height": 32,
+                                                 "margins": ["50%", "50%", "0px", "0px"]}]})
+
+    assert (layout.width, layout.height) == (96, 32)
+    assert layout.labels()[16, 60] == 2  # the border fills the whole zone
+    assert layout.labels()[16, 24] == 0
+
+
+@pytest.fixture
+def wall():
+    layout = PanelLayout(rows=16, cols=16, chain_length=2, parallel=2)
+    controller = LEDPanelEmotionController(matrix_backend="emulator", layout=layout)
+    controller.socket.close()
+    return controller
+
+
+def color_of(emotion):
+    red, green, blue, brightness = EmotionColors.color_provider(emotion)
+    return [red * brightness // 100, green * brightness // 100, blue * brightness // 100]
+
+
+def test_wall_draws_emotion_per_zone(wall):
+    assert (wall.matrix.width, wall.matrix.height) == (32, 32)
+
+    wall.process({"action": "draw", "emotion": "anger", "transition": 0})
+    wall.process({"action": "draw", "emotion": "happiness", "zone": "panel_1_1", "transition": 0})
+    with patch.object(wall.canvas, "SetImage", wraps=wall.canvas.SetImage) as set_image:
+        wall._render_frame(time.monotonic())
+
+    assert set_image.call_count == 1  # all zones in one write
+    pixels = wall.matrix.displayed.pixels
+    assert pixels[0, 0].tolist() == color_of(Emotion.ANGER)
+    assert pixels[0, 16].tolist() == color_of(Emotion.ANGER)
+    assert pixels[31, 31].tolist() == color_of(Emotion.HAPPINESS)
+    assert not pixels[8, 8].any()
+    assert wall._is_idle(time.monotonic())
+
+
+def test_wall_ignores_unknown_zone(wall):
+    wall.process({"action": "draw", "emotion": "anger", "zone": "panel_5_5"})
+
+    assert all(animator.target is None for animator in wall._zone_animators.values())
+    assert wall._pending_trace is None
+
+
+def test_single_panel_rejects_zone():
+    controller = LEDPanelEmotionController(matrix_backend="emulator")
+    controller.socket.close()
+
+    controller.process({"action": "draw", "emotion": "anger", "zone": "panel_0_0"})
+
+    assert controller.animator.target is None
+
+
+def test_wall_rejects_invalid_transition_before_any_zone_changes(wall):
+    wall.process({"action": "draw", "emotion": "anger", "transition": 0})
+
+    wall.process({"action": "draw", "emotion": "happiness", "transition": "500"})
+
+    assert all(animator.target is Emotion.ANGER for animator in wall._zone_animators.values())
+    with pytest.raises(ValueError):
+        wall.compile_cue({"action": "draw", "emotion": "happiness", "transition": -1})
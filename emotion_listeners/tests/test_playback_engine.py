@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+from pydub import AudioSegment
+
+from emotion_listeners.tests.conftest import tone
+from playbackengine import PlaybackEngine, PlaybackPolicy
+
+
+class SinkStub(object):
+    """Records the written chunks, optionally blocks until released."""
+    def __init__(self, block=False):
+        self.chunks = []
+        self.closed = False
+        self.release = threading.Event()
+        self.writing = threading.Event()
+        if not block:
+            self.release.set()
+
+    def write(self, chunk):
+        self.writing.set()
+        self.release.wait(5)
+        self.chunks.append(chunk)
+
+    def close(self):
+        self.closed = True
+
+
+def render(duration):
+    return lambda: tone(duration)
+
+
+def broken_render():
+    raise ValueError("broken")
+
+
+def wait_for_played(engine, played):
+    for _ in range(500):
+        if engine.stats["played"] >= played:
+            return
+        threading.Event().wait(0.01)
+    pytest.fail(f"Playback did not finish: {engine.stats}")
+
+
+@pytest.mark.parametrize("policy, expected_pending, expected_dropped", [
+    (PlaybackPolicy.QUEUE, 2, 1),
+    (PlaybackPolicy.DROP_NEWEST, 2, 1),
+    (PlaybackPolicy.PREEMPT, 1, 2),
+])
+def test_submit_policies(policy, expected_pending, expected_dropped):
+    engine = PlaybackEngine(sink=SinkStub(), policy=policy, max_queue=2)
+    accepted = [engine.submit(render(100)) for _ in range(3)]
+
+    assert engine.queue_depth == expected_pending
+    assert engine.stats["dropped"] == expected_dropped
+    assert accepted[-1] == (policy is not PlaybackPolicy.DROP_NEWEST)
+
+
+def test_queue_drops_oldest():
+    engine = PlaybackEngine(sink=SinkStub(), policy=PlaybackPolicy.QUEUE, max_queue=2)
+    first, second, third = render(100), render(200), render(300)
+    for pending in (first, second, third):
+        engine.submit(pending)
+
+    assert list(engine._pending) == [second, third]
+
+
+def test_plays_in_chunks():
+    sink = SinkStub()
+    engine = PlaybackEngine(sink=sink, policy=PlaybackPolicy.QUEUE, chunk_length=50)
+    engine.submit(render(120))
+    engine.submit(render(100))
+    engine.start()
+    engine.submit(broken_render)  # rendering errors do not stop the worker
+    engine.submit(render(10))
+
+    wait_for_played(engine, 3)
+    engine.stop()
+
+    assert [len(chunk) for chunk in sink.chunks] == [50, 50, 20, 50, 50, 10]
+    assert engine.stats["errors"] == 1  # the broken render is not counted as played
+    assert sink.closed
+
+
+def test_preempt_crossfades_into_new_sound():
+    sink = SinkStub(block=True)
+    engine = PlaybackEngine(sink=sink, policy=PlaybackPolicy.PREEMPT, crossfade=100, chunk_length=50)
+    engine.start()
+    engine.submit(render(10000))
+    sink.writing.wait(5)
+    engine.submit(render(300))
+    sink.release.set()
+
+    wait_for_played(engine, 1)
+    engine.stop()
+
+    # first chunk of the old sound, crossfade of 100ms, remaining 200ms of the new sound
+    assert sum(len(chunk) for chunk in sink.chunks) == 50 + 300
+    assert engine.stats["preempted"] == 1
+    assert engine.stats["dropped"] == 0
+
+
+def test_plays_streams_and_stops_current():
+    sink = SinkStub(block=True)
+    engine = PlaybackEngine(sink=sink, policy=PlaybackPolicy.QUEUE, crossfade=100, chunk_length=50)
+    engine.start()
+    engine.submit(lambda: (AudioSegment.silent(duration=50) for _ in range(1000)))
+    sink.writing.wait(5)
+    engine.stop_current()
+    sink.release.set()
+
+    wait_for_played(engine, 1)
+    engine.stop()
+
+    # first chunk of the stream, then a fade out over 100ms
+    assert sum(len(chunk) for chunk in sink.chunks) == 50 + 100
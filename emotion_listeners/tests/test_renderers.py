@@ -0,0 +1,28 @@
+import pytest
+
+import renderers
+
+
+def test_all_renderers_run_by_default():
+    assert renderers.parse_args([]).renderers == ["led", "sound"]
+
+
+def test_renderers_can_be_selected():
+    assert renderers.parse_args(["sound"]).renderers == ["sound"]
+
+
+def test_trace_log_is_optional():
+    assert renderers.parse_args([]).trace_log is None
+    assert renderers.parse_args(["--trace-log", "traces.jsonl"]).trace_log == "traces.jsonl"
+
+
+def test_conflation_and_high_water_mark_default_to_the_renderers():
+    assert renderers.parse_args([]).conflate is None
+    assert renderers.parse_args([]).rcvhwm is None
+    args = renderers.parse_args(["--no-conflate", "--rcvhwm", "10"])
+    assert args.conflate is False and args.rcvhwm == 10
+
+
+def test_unknown_renderer_is_rejected():
+    with pytest.raises(SystemExit):
+        renderers.parse_args(["led", "video"])
@@ -0,0 +1,103 @@
+import json
+import time
+from unittest.mock import MagicMock
+
+import pytest
+import zmq
+
+from eies_protocol import wireprotocol
+from emotion_listeners.tests.conftest import RecordingListener, on_loop, published, wait_until
+from ledpanelemotioncontroller import LEDPanelEmotionController
+from zmq_server_controllers import execution_time
+
+
+@pytest.fixture
+def listener(loop):
+    return on_loop(RecordingListener(), loop)
+
+
+def test_execution_time():
+    now = time.monotonic()
+    assert execution_time({"action": "draw"}) is None
+    assert execution_time({"delay": 250}) == pytest.approx(now + 0.25, abs=0.01)
+    assert execution_time({"at": time.time() + 1}) == pytest.approx(now + 1, abs=0.01)
+    with pytest.raises(ValueError):
+        execution_time({"at": "soon"})
+
+
+def test_scheduled_messages_have_own_topic():
+    assert wireprotocol.topic(json.dumps({"action": "draw", "delay": 10}).encode()) == b"led.draw.scheduled"
+    assert wireprotocol.topic(json.dumps({"action": "play", "at": 1.5}).encode()) == b"sound.play.scheduled"
+    assert wireprotocol.topic(json.dumps({"action": "draw", "at": 1.5, "zone": "left"}).encode()) == \
+        b"led.draw.scheduled.left"
+
+
+def test_cue_fires_at_its_time(listener):
+    listener.socket.recv_multipart.return_value = published({"action": "draw", "emotion": "fear", "delay": 100})
+
+    received = time.monotonic()
+    listener.handle_message()
+    assert not listener.processed
+
+    assert listener.done.wait(2.0)
+    fired, message = listener.processed[0]
+    assert fired - received >= 0.1
+    assert message["emotion"] == "fear"
+    snapshot = listener.metrics.snapshot()
+    assert snapshot["counters"]["scheduled"] == 1
+    assert snapshot["counters"]["messages"] == 1
+    assert snapshot["stages"]["lateness"]["count"] == 1
+    assert snapshot["stages"]["lateness"]["p50_ms"] < 50
+
+
+def test_cues_fire_in_order_of_their_time(listener):
+    at = time.time() + 0.1
+    listener.socket.recv_multipart.side_effect = [
+        published({"action": "play", "emotion": "fear", "at": at + 0.05}, 1),
+        published({"action": "play", "emotion": "anger", "at": at}, 2),
+        published({"action": "stop"}, 3),
+    ]
+    for _ in range(3):
+        listener.handle_message()
+
+    assert wait_until(lambda: len(listener.processed) == 3)
+    assert [message.get("emotion") for _, message in listener.processed] == [None, "anger", "fear"]
+
+
+def test_overdue_cue_is_counted_late(listener):
+    listener.socket.recv_multipart.return_value = published({"action": "stop", "at": time.time() - 1})
+
+    listener.handle_message()
+
+    assert listener.done.wait(2.0)
+    assert listener.metrics.snapshot()["counters"]["late"] == 1
+
+
+def test_without_loop_messages_run_right_away():
+    listener = RecordingListener()
+    listener.socket.close()
+    listener.socket = MagicMock()
+    listener.socket.recv_multipart.return_value = published({"action": "stop", "delay": 1000})
+
+    listener.handle_message()
+
+    assert len(listener.processed) == 1
+
+
+def test_scheduled_draws_are_not_conflated():
+    controller = LEDPanelEmotionController(matrix_backend="emulator")
+    controller.socket.close()
+    controller.socket = MagicMock()
+    controller.socket.recv_multipart.side_effect = [
+        published({"action": "draw", "emotion": "fear", "delay": 100}, 1),
+        published({"action": "draw", "emotion": "anger", "delay": 200}, 2),
+        published({"action": "draw", "emotion": "sadness"}, 1),
+        published({"action": "draw", "emotion": "happiness"}, 2),
+        zmq.Again(),
+    ]
+    controller.process = MagicMock()
+
+    controller.handle_message()
+
+    assert [call.args[0]["emotion"] for call in controller.process.call_args_list] == [
+        "fear", "anger", "happiness"]
@@ -0,0 +1,131 @@
+import mmap
+from unittest.mock import patch
+
+import pytest
+from pydub import AudioSegment
+
+from eies_protocol.emotions import Emotion
+from emotion_listeners.tests.conftest import tone
+from pcmstore import MAGIC
+from soundcache import SoundCache
+
+
+@pytest.fixture
+def silent_sources():
+    """Replace decoding of the sound files by a two second silence."""
+    with patch("soundcache.AudioSegment.from_file", return_value=AudioSegment.silent(duration=2000)) as mock_from_file, \
+            patch("soundcache.EmotionSounds.sound_provider", side_effect=lambda emotion: f"{emotion.value}.wav"):
+        yield mock_from_file
+
+
+def test_source_decoded_once(silent_sources):
+    cache = SoundCache()
+    cache.source(Emotion.ANGER)
+    cache.source(Emotion.ANGER)
+    cache.render(Emotion.ANGER, 5, 100)
+
+    silent_sources.assert_called_once_with("anger.wav")
+
+
+def test_preload_decodes_every_emotion(silent_sources):
+    cache = SoundCache()
+    cache.preload()
+
+    assert silent_sources.call_count == len(Emotion)
+
+
+def test_render_length_and_counters(silent_sources):
+    cache = SoundCache()
+    first = cache.render(Emotion.SADNESS, 5, 100)
+    second = cache.render(Emotion.SADNESS, 5, 100)
+    cache.render(Emotion.SADNESS, 5, 200)
+
+    assert first is second
+    assert len(first) == 5000  # the two second source is looped to the full duration
+    assert cache.stats["hits"] == 1
+    assert cache.stats["misses"] == 2
+    assert cache.stats["entries"] == 2
+
+
+def test_lru_eviction_within_byte_budget(silent_sources):
+    size = len(SoundCache._render(AudioSegment.silent(duration=2000), 2, 100).raw_data)
+    cache = SoundCache(byte_budget=2 * size)
+
+    cache.render(Emotion.FEAR, 2, 100)
+    cache.render(Emotion.ANGER, 2, 100)
+    cache.render(Emotion.FEAR, 2, 100)  # FEAR is now the most recently used
+    cache.render(Emotion.DISGUST, 2, 100)
+
+    assert cache.stats["bytes"] <= cache.byte_budget
+    assert cache.stats["entries"] == 2
+    cache.render(Emotion.FEAR, 2, 100)
+    assert cache.stats["hits"] == 2
+    cache.render(Emotion.ANGER, 2, 100)
+    assert cache.stats["misses"] == 4
+
+
+def test_oversized_render_is_not_cached(silent_sources):
+    cache = SoundCache(byte_budget=10)
+    cache.render(Emotion.NEUTRAL, 2, 100)
+
+    assert cache.stats["entries"] == 0
+    assert cache.stats["bytes"] == 0
+
+
+@pytest.fixture
+def source_files(tmp_path):
+    """Sound files in a temporary directory, decoded to a two second tone."""
+    for emotion in Emotion:
+        (tmp_path / f"{emotion.value}.wav").write_bytes(emotion.value.encode())
+    with patch("soundcache.AudioSegment.from_file", return_value=tone(duration=2000, volume=-6.0)) as mock_from_file, \
+            patch("soundcache.EmotionSounds.sound_provider", side_effect=lambda emotion: str(tmp_path / f"{emotion.value}.wav")):
+        yield mock_from_file
+
+
+def test_disk_cache_survives_a_restart(source_files, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    rendered = SoundCache(cache_dir=cache_dir).render(Emotion.FEAR, 3, 100)
+    assert source_files.call_count == 1
+
+    restarted = SoundCache(cache_dir=cache_dir)
+    mapped = restarted.render(Emotion.FEAR, 3, 100)
+
+    assert source_files.call_count == 1
+    assert isinstance(mapped.raw_data, mmap.mmap)
+    assert mapped.raw_data[:] == rendered.raw_data
+    assert (mapped.frame_rate, mapped.channels, mapped.sample_width) == (44100, 1, 2)
+    assert restarted.stats["disk_hits"] == 1
+
+
+def test_changed_source_invalidates_disk_entries(source_files, tmp_path):
+    cache_dir = tmp_path / "cache"
+    SoundCache(cache_dir=str(cache_dir)).render(Emotion.FEAR, 3, 100)
+    SoundCache(cache_dir=str(cache_dir)).render(Emotion.ANGER, 3, 100)
+    (tmp_path / "fear.wav").write_bytes(b"re-recorded")
+
+    restarted = SoundCache(cache_dir=str(cache_dir))
+    restarted.render(Emotion.FEAR, 3, 100)
+
+    assert source_files.call_count == 3
+    assert restarted.stats["disk_hits"] == 0
+    entries = sorted(entry.name.split("-")[0] for entry in cache_dir.iterdir())
+    assert entries == ["anger", "anger", "fear", "fear"]  # the source and one rendered cue of each
+
+
+def test_broken_disk_entry_is_rendered_again(source_files, tmp_path):
+    cache_dir = tmp_path / "cache"
+    SoundCache(cache_dir=str(cache_dir)).source(Emotion.FEAR)
+    entry, = cache_dir.iterdir()
+    entry.write_bytes(b"garbage")
+
+    SoundCache(cache_dir=str(cache_dir)).source(Emotion.FEAR)
+
+    assert source_files.call_count == 2
+    assert entry.read_bytes().startswith(MAGIC)
+
+
+def test_unreadable_source_is_not_cached_on_disk(silent_sources, tmp_path):
+    cache = SoundCache(cache_dir=str(tmp_path))
+
+    assert len(cache.render(Emotion.FEAR, 2, 100)) == 2000
+    assert not list(tmp_path.iterdir())
@@ -1,8 +1,12 @@
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 
 import pytest
+from pydub import AudioSegment
 
 import soundservercontroller
+from audiostream import LoopingStream
+from eies_protocol.emotions import Emotion
+from emotion_listeners.tests.conftest import tone
 
 
 def test_process_valid_payload(controller_instance):
@@ -15,8 +19,7 @@ def test_process_valid_payload(controller_instance):
     }
 
     with patch("soundservercontroller.Emotion") as MockEmotion, \
-            patch("soundservercontroller.EmotionSounds.sound_provider", return_value="test_sound.mp3") as mock_provider, \
-            patch("soundservercontroller.threading.Thread") as MockThread:
+            patch.object(controller_instance.playback, "submit") as mock_submit:
         MockEmotion.return_value = "happy"
 
         # Call method
@@ -25,13 +28,11 @@ def test_process_valid_payload(controller_instance):
         # Check if Emotion was instantiated correctly
         MockEmotion.assert_called_once_with("happy")
 
-        # Check if sound_provider was called
-        mock_provider.assert_called_once_with("happy")
-
-        # Check if threading.Thread was started
-        MockThread.assert_called_once()
-        _, kwargs = MockThread.call_args
-        assert kwargs["target"] == controller_instance._play_audio
+        # Check if the rendering was handed over to the playback
+        mock_submit.assert_called_once()
+        render = mock_submit.call_args[0][0]
+        assert render.func == controller_instance._render_audio
+        assert render.args == ("happy", 10, 1000)
 
 def test_process_invalid_emotion(controller_instance):
     """Test invalid emotion handling."""
@@ -66,32 +67,52 @@ def test_process_non_play_action(controller_instance):
         mock_info_logger.assert_not_called()
 
 
-def test_play_audio(controller_instance):
-    """Test private '_play_audio' method."""
-    with patch("soundservercontroller.AudioSegment.from_file") as mock_from_file, \
-            patch("soundservercontroller.play") as mock_play:
-        # Mock an AudioSegment object
-        mock_sound = MagicMock()
-        mock_sound.apply_gain.return_value = mock_sound
-        mock_sound.fade_in.return_value = mock_sound
-        mock_sound.fade_out.return_value = mock_sound
-        mock_sound.__len__.return_value = 5000  # 5 seconds
-
-        mock_from_file.return_value = mock_sound
-
+def test_render_audio(controller_instance):
+    """Test private '_render_audio' method."""
+    quiet_tone = tone(duration=5000, volume=-20.0)
+    with patch("soundcache.AudioSegment.from_file", return_value=quiet_tone) as mock_from_file, \
+            patch("soundcache.EmotionSounds.sound_provider", return_value="test_sound.mp3"):
         # Call the private method directly
-        controller_instance._play_audio("test_sound.mp3", duration=10, fade_time=1000)
+        sound = controller_instance._render_audio(Emotion.HAPPINESS, duration=10, fade_time=1000)
 
         # Verify file loading
         mock_from_file.assert_called_once_with("test_sound.mp3")
 
-        # Verify sound manipulations
-        mock_sound.apply_gain.assert_called_once()
-        mock_sound.fade_in.assert_called_once_with(1000)
-        mock_sound.fade_out.assert_called_once_with(1000)
+        # Verify the sound is normalized, looped to the full duration and faded in
+        assert len(sound) == 10000
+        assert sound.max_dBFS == pytest.approx(0, abs=0.1)
+        assert sound[:10].max_dBFS < sound[5000:5010].max_dBFS - 20
+
+
+def test_render_audio_uses_cache(controller_instance):
+    """Test that repeated cues are rendered only once."""
+    with patch("soundcache.AudioSegment.from_file", return_value=AudioSegment.silent(duration=2000)) as mock_from_file, \
+            patch("soundcache.EmotionSounds.sound_provider", return_value="test_sound.mp3"):
+        first = controller_instance._render_audio(Emotion.FEAR, duration=4, fade_time=500)
+        second = controller_instance._render_audio(Emotion.FEAR, duration=4, fade_time=500)
+
+        mock_from_file.assert_called_once_with("test_sound.mp3")
+        assert first is second
+        assert controller_instance.sound_cache.stats["hits"] == 1
+        assert controller_instance.sound_cache.stats["misses"] == 1
+
+def test_render_audio_streams_long_cues(controller_instance):
+    """Test that long cues are streamed instead of rendered."""
+    with patch("soundcache.AudioSegment.from_file", return_value=AudioSegment.silent(duration=2000)), \
+            patch("soundcache.EmotionSounds.sound_provider", return_value="test_sound.mp3"):
+        sound = controller_instance._render_audio(Emotion.NEUTRAL, duration=600, fade_time=1000)
+
+        assert isinstance(sound, LoopingStream)
+        assert sound.duration == 600000
+        assert controller_instance.sound_cache.stats["misses"] == 0
+
+
+def test_process_stop(controller_instance):
+    """Test 'stop' action fades out the current sound."""
+    with patch.object(controller_instance.playback, "stop_current") as mock_stop_current:
+        controller_instance.process({"action": "stop"})
 
-        # Verify the playback
-        mock_play.assert_called_once()
+        mock_stop_current.assert_called_once()
 
 @pytest.mark.parametrize("input_duration, expected", [
     (15, 15),
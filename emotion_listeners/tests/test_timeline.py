@@ -0,0 +1,161 @@
+import json
+import time
+from unittest.mock import MagicMock
+
+import pytest
+import zmq
+
+from eies_protocol import timeline, wireprotocol
+from eies_protocol.emotions import Emotion
+from emotion_listeners.tests.conftest import RecordingListener, on_loop, wait_until
+from ledpanelemotioncontroller import LEDPanelEmotionController
+from soundservercontroller import SoundListenerController
+
+SHOW = {"action": "timeline", "name": "show", "cues": [
+    {"offset": 100, "action": "draw", "emotion": "anger"},
+    {"offset": 0, "action": "draw", "emotion": "fear"},
+    {"offset": 50, "action": "play", "emotion": "fear", "duration": 1},
+]}
+SUBSCRIPTIONS = ("led.", "show.")  # the cues of the LED panel
+
+
+def receive(listener, *messages):
+    for message in messages:
+        listener.socket.recv_multipart.side_effect = [[json.dumps(message).encode()], zmq.Again()]
+        listener.handle_message()
+
+
+@pytest.fixture
+def listener(loop):
+    return on_loop(RecordingListener(subscriptions=SUBSCRIPTIONS), loop)
+
+
+def test_parse_sorts_cues_by_offset():
+    cues = timeline.parse(SHOW)
+
+    assert [offset for offset, _ in cues] == [0, 0.05, 0.1]
+    assert cues[0][1] == {"action": "draw", "emotion": "fear"}
+
+
+@pytest.mark.parametrize("message", [
+    {"cues": []},
+    {"name": "show", "cues": "draw"},
+    {"name": "show", "cues": [{"action": "draw", "emotion": "fear"}]},
+    {"name": "show", "cues": [{"offset": -1, "action": "draw"}]},
+    {"name": "show", "cues": [{"offset": 0, "action": "start", "name": "show"}]},
+    {"name": "show", "cues": [{"offset": 0, "action": "draw", "delay": 10}]},
+])
+def test_parse_rejects_invalid_timelines(message):
+    with pytest.raises(ValueError):
+        timeline.parse(message)
+
+
+def test_show_actions_are_routed_to_all_devices():
+    assert wireprotocol.topic(json.dumps(SHOW).encode()) == b"show.timeline"
+    assert wireprotocol.topic(json.dumps({"action": "start", "name": "show", "delay": 10}).encode()) == \
+        b"show.start.scheduled"
+
+
+def test_timeline_plays_cues_of_the_device_from_the_start(listener):
+    receive(listener, SHOW)
+    assert wait_until(lambda: "show" in listener._timelines)
+    assert len(listener._timelines["show"]) == 2  # the play cue is for the sound listener
+    assert not listener.processed
+
+    started = time.monotonic()
+    receive(listener, {"action": "start", "name": "show", "delay": 50})
+
+    assert wait_until(lambda: len(listener.processed) == 2)
+    (fear_at, fear), (anger_at, anger) = listener.processed
+    assert (fear["emotion"], anger["emotion"]) == ("fear", "anger")
+    assert fear_at - started >= 0.05
+    assert anger_at - started >= 0.15
+    assert listener.metrics.snapshot()["stages"]["lateness"]["count"] == 2
+
+
+def test_cancel_stops_the_show(listener):
+    receive(listener, SHOW)
+    assert wait_until(lambda: "show" in listener._timelines)
+
+    receive(listener, {"action": "start", "name": "show", "delay": 100}, {"action": "cancel"})
+    time.sleep(0.3)
+
+    assert not listener.processed
+
+
+class SlowCompilingListener(RecordingListener):
+    def compile_cue(self, cue):
+        time.sleep(0.05)
+        if cue.get("emotion") == "invalid":
+            raise ValueError("Invalid emotion")
+        return super().compile_cue(cue)
+
+
+def test_start_right_after_upload_waits_for_the_timeline(loop):
+    listener = on_loop(SlowCompilingListener(subscriptions=SUBSCRIPTIONS), loop)
+
+    receive(listener, SHOW, {"action": "start", "name": "show"})
+
+    assert wait_until(lambda: len(listener.processed) == 2)
+    assert [message["emotion"] for _, message in listener.processed] == ["fear", "anger"]
+    assert "errors" not in listener.metrics.snapshot()["counters"]
+
+
+def test_cancel_while_compiling_drops_the_start(loop):
+    listener = on_loop(SlowCompilingListener(subscriptions=SUBSCRIPTIONS), loop)
+
+    receive(listener, SHOW, {"action": "start", "name": "show"}, {"action": "cancel"})
+    assert wait_until(lambda: "show" in listener._timelines)
+    time.sleep(0.2)
+
+    assert not listener.processed
+
+
+def test_show_of_failed_timeline_does_not_start(loop):
+    listener = on_loop(SlowCompilingListener(subscriptions=SUBSCRIPTIONS), loop)
+    receive(listener, SHOW)
+    assert wait_until(lambda: "show" in listener._timelines)
+    invalid = {"action": "timeline", "name": "show", "cues": [{"offset": 0, "action": "draw", "emotion": "invalid"}]}
+
+    receive(listener, invalid, {"action": "start", "name": "show"})
+
+    assert wait_until(lambda: listener.metrics.snapshot()["counters"].get("errors") == 2)
+    time.sleep(0.2)
+    assert not listener.processed
+
+
+def test_start_of_unknown_timeline_fails(listener):
+    receive(listener, {"action": "start", "name": "other"})
+
+    assert listener.metrics.snapshot()["counters"]["errors"] == 1
+
+
+def test_led_compiles_draw_cues(loop):
+    controller = on_loop(LEDPanelEmotionController(matrix_backend="emulator"), loop)
+    receive(controller, {"action": "timeline", "name": "invalid", "cues": [
+        {"offset": 0, "action": "draw", "emotion": "fear", "zone": "left"}]})
+    receive(controller, SHOW)
+    assert wait_until(lambda: "show" in controller._timelines)
+    assert "invalid" not in controller._timelines
+
+    for _, play in controller._timelines["show"]:
+        play()
+
+    assert controller.animator.target is Emotion.ANGER
+    assert controller._target_changed.is_set()
+
+
+def test_sound_prerenders_play_cues(loop):
+    playback = MagicMock()
+    sound_cache = MagicMock()
+    controller = on_loop(SoundListenerController(sound_cache=sound_cache, playback=playback), loop)
+    receive(controller, SHOW)
+    assert wait_until(lambda: "show" in controller._timelines)
+
+    sound_cache.render.assert_called_once_with(Emotion.FEAR, 1, 1000)
+    assert not playback.submit.called
+    (_, play), = controller._timelines["show"]
+    play()
+
+    render = playback.submit.call_args.args[0]
+    assert render() is sound_cache.render.return_value
@@ -0,0 +1,45 @@
+import json
+import time
+
+import zmq
+
+from eies_protocol import wireprotocol
+from ledpanelemotioncontroller import LEDPanelEmotionController
+from soundservercontroller import SoundListenerController
+
+
+def receive_all(socket, timeout_ms=200):
+    received = []
+    while socket.poll(timeout_ms):
+        received.append(socket.recv_multipart())
+    return received
+
+
+def test_listeners_declare_their_devices():
+    assert LEDPanelEmotionController.SUBSCRIPTIONS == ("led.", "show.")
+    assert SoundListenerController.SUBSCRIPTIONS == ("sound.", "show.")
+
+
+def test_publisher_filters_by_topic():
+    context = zmq.Context()
+    publisher = context.socket(zmq.PUB)
+    port = publisher.bind_to_random_port("tcp://127.0.0.1")
+    subscriber = context.socket(zmq.SUB)
+    subscriber.connect(f"tcp://127.0.0.1:{port}")
+    for subscription in SoundListenerController.SUBSCRIPTIONS:
+        subscriber.setsockopt_string(zmq.SUBSCRIBE, subscription)
+    try:
+        time.sleep(0.2)  # let the subscription reach the publisher
+        messages = [{"action": "draw", "emotion": "fear"}, {"action": "play", "emotion": "fear"},
+                    {"action": "stop"}]
+        for message in messages:
+            data = json.dumps(message).encode()
+            publisher.send_multipart([wireprotocol.topic(data), data])
+
+        received = receive_all(subscriber)
+    finally:
+        subscriber.close(linger=0)
+        publisher.close(linger=0)
+        context.term()
+
+    assert [topic for topic, _ in received] == [b"sound.play", b"sound.stop"]
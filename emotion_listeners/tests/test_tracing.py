@@ -0,0 +1,67 @@
+import json
+from unittest.mock import MagicMock
+
+import tracereport
+from eies_protocol import tracing
+from soundservercontroller import SoundListenerController
+
+
+def test_untraced_data_is_not_touched():
+    data = b'{"action": "draw", "emotion": "fear"}'
+    assert tracing.stamp_json(data, "bt_receive") is data
+    assert tracing.stamp_json("no json but \"trace\"", "bt_receive") == "no json but \"trace\""
+
+
+def test_trace_hops_are_appended():
+    message = tracing.start({"action": "draw", "emotion": "fear"}, "abc")
+    data = tracing.stamp_json(json.dumps(message).encode(), "bt_receive")
+
+    trace = json.loads(data)["trace"]
+    assert trace["id"] == "abc"
+    assert [hop for hop, _ in trace["hops"]] == ["rest", "bt_receive"]
+
+
+def test_hop_latencies():
+    trace = {"id": "abc", "hops": [["rest", 1.0], ["bt_send", 1.5], ["rendered", 3.0]]}
+
+    assert tracing.hop_latencies(trace) == [("rest->bt_send", 0.5), ("bt_send->rendered", 1.5), ("total", 2.0)]
+    assert tracing.hop_latencies({"hops": [["rest", 1.0]]}) == []
+
+
+def test_listener_finishes_trace(tmp_path):
+    trace_log = tmp_path / "trace.jsonl"
+    controller_instance = SoundListenerController(trace_log=str(trace_log))
+    message = tracing.start({"action": "unknown"}, "abc")
+    socket = MagicMock()
+    socket.recv_multipart.return_value = [b"unrouted", json.dumps(message).encode()]
+    controller_instance.socket.close()
+    controller_instance.socket = socket
+
+    controller_instance.handle_message()
+
+    trace = json.loads(trace_log.read_text())
+    assert [hop for hop, _ in trace["hops"]] == ["rest", "zmq_receive", "processed"]
+    assert "hop zmq_receive->processed" in controller_instance.metrics.snapshot()["stages"]
+
+
+def test_deferred_trace_is_left_to_the_renderer():
+    message = tracing.start({"action": "play"})
+    trace = tracing.defer(message)
+
+    assert trace["deferred"]
+    assert tracing.defer({"action": "play"}) is None
+
+
+def test_report(tmp_path, capsys):
+    trace_log = tmp_path / "trace.jsonl"
+    trace_log.write_text("\n".join([
+        json.dumps({"id": "1", "hops": [["rest", 0.0], ["bt_send", 0.001], ["zmq_receive", 0.011]]}),
+        "garbage",
+        json.dumps({"id": "2", "hops": [["rest", 0.0], ["bt_send", 0.003], ["zmq_receive", 0.033]]}),
+    ]))
+
+    assert tracereport.main([str(trace_log)]) == 0
+
+    rows = capsys.readouterr().out.splitlines()
+    assert [row.split()[0] for row in rows] == ["hop", "rest->bt_send", "bt_send->zmq_receive", "total"]
+    assert rows[2].split()[1:] == ["2", "20.00", "10.00", "30.00", "30.00", "30.00"]
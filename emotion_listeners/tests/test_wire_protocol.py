@@ -0,0 +1,95 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from eies_protocol import wireprotocol
+from eies_protocol.emotions import Emotion
+
+
+@pytest.mark.parametrize("message", [
+    {"action": "play", "emotion": "happiness", "duration": 10, "fade_time": 1000},
+    {"action": "draw", "emotion": "fear", "transition": 300, "easing": "linear", "brightness": 80},
+    {"action": "draw", "emotion": "contempt"},
+    {"action": "stop"},
+])
+def test_binary_roundtrip(message):
+    data = wireprotocol.encode(message)
+
+    assert len(data) == wireprotocol.RECORD.size
+    assert wireprotocol.decode(data) == message
+
+
+def test_every_emotion_has_a_code():
+    assert set(wireprotocol.EMOTIONS) == set(Emotion)
+    assert len(set(wireprotocol.EMOTIONS.values())) == len(Emotion)
+
+
+@pytest.mark.parametrize("message", [
+    {"action": "play", "emotion": "happiness", "trace": {"id": "abc", "hops": []}},
+    {"action": "play", "emotion": "happiness", "duration": 2.5},
+    {"action": "play", "emotion": "happiness", "duration": 70000},
+    {"action": "draw", "emotion": "joy"},
+    {"action": "draw", "emotion": "fear", "easing": "bounce"},
+    {"action": "dance"},
+])
+def test_falls_back_to_json(message):
+    data = wireprotocol.encode(message)
+
+    assert data.startswith(b"{")
+    assert wireprotocol.decode(data) == message
+
+
+def test_compact_is_much_smaller():
+    text = json.dumps({"action": "play", "emotion": "happiness", "duration": 10, "fade_time": 1000})
+
+    data = wireprotocol.compact(text)
+
+    assert len(data) * 5 < len(text)
+    assert wireprotocol.decode(data) == json.loads(text)
+    assert wireprotocol.compact("not json") == b"not json"
+
+
+def test_rejects_unknown_version():
+    data = bytearray(wireprotocol.encode({"action": "stop"}))
+    data[0] = 2
+
+    with pytest.raises(ValueError):
+        wireprotocol.decode(bytes(data))
+
+
+def test_listener_accepts_both_encodings(controller_instance):
+    socket = MagicMock()
+    socket.recv_multipart.side_effect = [[b"sound.stop", wireprotocol.encode({"action": "stop"})],
+                                         [b"sound.stop", json.dumps({"action": "stop"}).encode()]]
+    controller_instance.socket.close()
+    controller_instance.socket = socket
+    controller_instance.playback = MagicMock()
+
+    controller_instance.handle_message()
+    controller_instance.handle_message()
+
+    assert controller_instance.playback.stop_current.call_count == 2
+    assert controller_instance.metrics.snapshot()["counters"] == {"messages": 2}
+
+
+@pytest.mark.parametrize("message, expected", [
+    ({"action": "draw", "emotion": "fear"}, b"led.draw"),
+    ({"action": "play", "emotion": "fear", "duration": 3}, b"sound.play"),
+    ({"action": "stop"}, b"sound.stop"),
+    ({"action": "dance"}, b"unrouted"),
+])
+def test_topic_of_both_encodings(message, expected):
+    assert wireprotocol.topic(wireprotocol.encode(message)) == expected
+    assert wireprotocol.topic(json.dumps(message).encode()) == expected
+
+
+def test_topic_of_garbage_is_unrouted():
+    assert wireprotocol.topic(b"no json") == b"unrouted"
+    assert wireprotocol.topic(b"[1, 2]") == b"unrouted"
+
+
+def test_topic_per_zone():
+    data = json.dumps({"action": "draw", "emotion": "fear", "zone": "left"}).encode()
+    assert wireprotocol.topic(data) == b"led.draw.left"
+    assert wireprotocol.topic(json.dumps({"action": "foo", "zone": "left"}).encode()) == b"unrouted"
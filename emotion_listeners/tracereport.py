@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import math
+import sys
+from typing import Dict, Iterable, List
+
+from eies_protocol import tracing
+
+
+def collect(lines: Iterable[str]) -> Dict[str, List[float]]:
+    """
+    Gather the hop latencies of all traces, lines that are no trace are skipped.
+    :param lines: JSON lines as written by tracing.TraceLog
+    :return: {hop: [latency in seconds, ...]}
+    """
+    latencies: Dict[str, List[float]] = {}
+    for line in lines:
+        try:
+            trace = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(trace, dict):
+            continue
+        for hop, latency in tracing.hop_latencies(trace):
+            latencies.setdefault(hop, []).append(latency)
+    return latencies
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Nearest rank percentile of sorted values."""
+    rank = max(0, min(len(values) - 1, math.ceil(percent / 100 * len(values)) - 1))
+    return values[rank]
+
+
+def report(latencies: Dict[str, List[float]]) -> str:
+    """Format the latency breakdown as table in milliseconds, hops in pipeline order."""
+    def order(hop: str):
+        names = hop.split("->")
+        return [tracing.HOPS.index(name) if name in tracing.HOPS else len(tracing.HOPS) for name in names]
+
+    rows = [f"{'hop':<28}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}"]
+    for hop in sorted(latencies, key=lambda name: (name == "total", order(name))):
+        values = sorted(latencies[hop])
+        millis = [sum(values) / len(values)] + [percentile(values, percent) for percent in (50, 95, 99)] + [values[-1]]
+        rows.append(f"{hop:<28}{len(values):>7}" + "".join(f"{value * 1000:>10.2f}" for value in millis))
+    return "\n".join(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latency breakdown of traced cues (times in ms).")
+    parser.add_argument("trace_logs", nargs="+", help="trace logs written by the listeners (trace_log)")
+    args = parser.parse_args(argv)
+
+    latencies: Dict[str, List[float]] = {}
+    for path in args.trace_logs:
+        with open(path, encoding="utf-8") as trace_file:
+            for hop, values in collect(trace_file).items():
+                latencies.setdefault(hop, []).extend(values)
+    if not latencies:
+        print("No traces found.", file=sys.stderr)
+        return 1
+    print(report(latencies))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
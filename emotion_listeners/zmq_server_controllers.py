@@ -1,8 +1,38 @@
 # -*- coding: utf-8 -*-
-import zmq
+import json
 import threading
+import time
+from functools import partial
+
+import zmq
 import logging
 from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from eies_protocol import timeline, tracing, wireprotocol
+from eventloop import EventLoop, Timer
+from instrumentation import Instrumentation
+
+DEFAULT_METRICS_INTERVAL = 60  # seconds between two metrics log lines, 0 disables them
+MAX_CONFLATE_BATCH = 1000  # pending messages read at once when conflating
+MAX_LATENESS = 0.010  # seconds a scheduled cue may fire after its time before it is counted as late
+
+
+def execution_time(message: Dict[str, Any]) -> Optional[float]:
+    """
+    Return the time.monotonic() timestamp a message is scheduled for (see wireprotocol.SCHEDULE_KEYS),
+    None for messages to process right away.
+    :raises ValueError: if "at" or "delay" is not a number
+    """
+    at, delay = message.get("at"), message.get("delay")
+    for key, value in (("at", at), ("delay", delay)):
+        if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool)):
+            raise ValueError(f"{key} {value!r} is not a number")
+    if at is not None:
+        return time.monotonic() + at - time.time()
+    if delay is not None:
+        return time.monotonic() + delay / 1000
+    return None
 
 
 class BaseZMQListener(ABC):
@@ -12,22 +42,57 @@ class BaseZMQListener(ABC):
     """
 
     LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"  # Log format
+    # topic prefixes the listener receives (see wireprotocol.TOPICS), the empty prefix receives everything
+    SUBSCRIPTIONS: Tuple[str, ...] = ("",)
+    # only process the newest pending message per topic, for listeners that show a state
+    CONFLATE: bool = False
+    # topic prefixes of commands that are never conflated, each of their messages is processed
+    UNCONFLATED: Tuple[str, ...] = ()
+    # receive high-water mark (messages queued per publisher), None keeps the ZMQ default
+    RCVHWM: Optional[int] = None
 
-    def __init__(self, address: str, loglevel: int = logging.INFO):
+    # timelines compiled for this listener by name, and the timers of the running one
+    _timelines: Optional[Dict[str, List[Tuple[float, Callable[[], None]]]]] = None
+    _show_timers: Optional[List[Timer]] = None
+    # uploads of timelines still compiling by name, and the (name, start time) of a show waiting for one of them
+    _compiling: Optional[Dict[str, int]] = None
+    _pending_show: Optional[Tuple[str, float]] = None
+
+    def __init__(self, address: str, loglevel: int = logging.INFO,
+                 metrics_interval: float = DEFAULT_METRICS_INTERVAL, trace_log: Optional[str] = None,
+                 context: Optional[zmq.Context] = None, conflate: Optional[bool] = None,
+                 rcvhwm: Optional[int] = None):
         """
         Initialize the ZMQ listener.
         :param address: ZMQ listen address
         :param loglevel: Logging level
+        :param metrics_interval: seconds between two structured metrics log lines, 0 disables them
+        :param trace_log: file the traces of traced messages are appended to, see tracereport.py
+        :param context: ZMQ context shared with other listeners (see EventLoop), an own one if not given
+        :param conflate: override CONFLATE
+        :param rcvhwm: override RCVHWM
         """
         self.address = address
-        self.context = zmq.Context()
+        self.conflate = self.CONFLATE if conflate is None else conflate
+        self.rcvhwm = self.RCVHWM if rcvhwm is None else rcvhwm
+        self._sequences: Dict[bytes, int] = {}
+        self._owns_context = context is None
+        self.context = zmq.Context() if context is None else context
+        self.loop: Optional[EventLoop] = None
         self.socket = self._initialize_socket()
         self.logger = self._setup_logger(loglevel)
+        self.metrics = Instrumentation()
+        self.metrics_interval = metrics_interval
+        self.trace_log = tracing.TraceLog(trace_log) if trace_log else None
+        self._timelines = {}
+        self._timelines_lock = threading.Lock()
+        self._show_timers = []
+        self._compiling = {}
 
     def __del__(self):
         if self.socket:
             self.socket.close()
-        if self.context:
+        if self.context and getattr(self, "_owns_context", True):
             self.context.term()
 
     def _setup_logger(self, loglevel: int) -> logging.Logger:
@@ -43,28 +108,251 @@ class BaseZMQListener(ABC):
         Set up and return a ZMQ subscription socket.
         """
         socket = self.context.socket(zmq.SUB)
+        if self.rcvhwm is not None:
+            socket.setsockopt(zmq.RCVHWM, self.rcvhwm)
         socket.connect(self.address)
-        socket.setsockopt_string(zmq.SUBSCRIBE, "")
+        for subscription in self.SUBSCRIPTIONS:
+            socket.setsockopt_string(zmq.SUBSCRIBE, subscription)
         return socket
 
-    def start(self):
+    def start(self, loop: Optional[EventLoop] = None):
         """
-        Start the ZMQ listener in a separate thread.
+        Start the ZMQ listener on the given event loop, which runs several listeners on one thread,
+        or on an own event loop in a separate thread.
+        :param loop: shared event loop, run by the caller
         """
         self.logger.info(f"ZMQ Client started at {self.address}")
-        threading.Thread(target=self._listen_for_messages, daemon=True).start()
+        if loop is None:
+            self.loop = EventLoop(self.context)
+            self.loop.add(self)
+            self.loop.start()
+        else:
+            self.loop = loop
+            loop.add(self)
+        if self.metrics_interval > 0:
+            self.metrics.snapshot(reset=True)
+            self.loop.call_later(self.metrics_interval, self._report_metrics)
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Stop the event loop of the listener, which closes all listeners on it.
+        """
+        if self.loop is not None:
+            self.loop.stop(timeout)
+
+    def close(self):
+        """
+        Release the socket, called by the event loop when it stops.
+        Subclasses extend this to stop their own threads.
+        """
+        self.logger.info(f"ZMQ Client at {self.address} closed")
+        self.socket.close(linger=0)
+
+    def _report_metrics(self):
+        """
+        Log the metrics of the last interval as one structured (JSON) line, repeated every metrics_interval.
+        """
+        snapshot = self.metrics.snapshot(reset=True)
+        self.logger.info(f"Metrics: {json.dumps(snapshot, sort_keys=True)}")
+        self.loop.call_later(self.metrics_interval, self._report_metrics)
+
+    def handle_message(self):
+        """
+        Receive and process the pending messages, called by the event loop when the socket is readable.
+        """
+        try:
+            with self.metrics.measure("receive"):
+                pending = self._receive_pending()
+        except Exception as error:
+            self.metrics.count("errors")
+            self.logger.error(f"Error receiving message: {error}")
+            return
+        for data in pending:
+            self._handle(data)
+
+    def _receive_pending(self) -> List[bytes]:
+        """
+        Receive the next message, when conflating all pending ones of which only the newest per topic are kept
+        (except for UNCONFLATED topics).
+        :return: the messages to process in the order they arrived
+        """
+        unconflated = tuple(prefix.encode("utf-8") for prefix in self.UNCONFLATED)
+        received = [self.socket.recv_multipart()]
+        while self.conflate and len(received) < MAX_CONFLATE_BATCH:
+            try:
+                received.append(self.socket.recv_multipart(zmq.NOBLOCK))
+            except zmq.Again:
+                break
+        newest: Dict[Any, bytes] = {}
+        for index, parts in enumerate(received):
+            # [topic, sequence, message] from the publisher, a bare message is accepted as well
+            topic = parts[0] if len(parts) > 1 else b""
+            if len(parts) == 3:
+                self._check_sequence(topic, parts[1])
+            key = (topic, index) if unconflated and topic.startswith(unconflated) else topic
+            newest.pop(key, None)  # keep the position of the newest message
+            newest[key] = parts[-1]
+        if len(received) > len(newest):
+            self.metrics.count("conflated", len(received) - len(newest))
+        return list(newest.values()) if self.conflate else [parts[-1] for parts in received]
+
+    def _check_sequence(self, topic: bytes, sequence: bytes):
+        """Count the messages of the topic the publisher dropped (e.g. at its high-water mark)."""
+        number, = wireprotocol.SEQUENCE.unpack(sequence)
+        last = self._sequences.get(topic)
+        if last is not None and number > last + 1:
+            self.metrics.count("dropped", number - last - 1)
+        self._sequences[topic] = number
+
+    def _handle(self, data: bytes):
+        try:
+            with self.metrics.measure("parse"):
+                message = wireprotocol.decode(data)
+            tracing.stamp(message, "zmq_receive")
+            self.logger.info(f"Received message: {message}")
+            when = execution_time(message)
+            if message.get("action") in timeline.SHOW_ACTIONS:
+                self._handle_show(message, when)
+            elif when is not None and self.loop is not None:
+                self.loop.call_at(when, self._run_scheduled, when, self._execute, message)
+                self.metrics.count("scheduled")
+            else:
+                self._execute(message)
+        except Exception as error:
+            self.metrics.count("errors")
+            self.logger.error(f"Error handling message: {error}")
+
+    def _run_scheduled(self, when: float, callback: Callable[..., None], *args):
+        """Run a scheduled callback, called by the event loop at its time, and record how late it fired."""
+        lateness = max(0.0, time.monotonic() - when)
+        self.metrics.record("lateness", lateness)
+        if lateness > MAX_LATENESS:
+            self.metrics.count("late")
+            self.logger.warning(f"Scheduled cue fired {lateness * 1000:.1f}ms late: {args}")
+        try:
+            callback(*args)
+        except Exception as error:
+            self.metrics.count("errors")
+            self.logger.error(f"Error handling message: {error}")
+
+    def _execute(self, message: Dict[str, Any]):
+        with self.metrics.measure("process"):
+            self.process(message)
+        self.metrics.count("messages")
+        trace = message.get(tracing.TRACE_KEY)
+        if isinstance(trace, dict) and not trace.get("deferred"):
+            self.finish_trace(trace, "processed")
+
+    def _handle_show(self, message: Dict[str, Any], when: Optional[float]):
+        """
+        Compile an uploaded timeline in the background, or start or cancel a show, see timeline.py.
+        A show started while its timeline is still compiling starts once it is compiled.
+        :param when: time.monotonic() timestamp the show starts at, None to start right away
+        """
+        action = message["action"]
+        if action == "timeline":
+            cues = timeline.parse(message)
+            with self._timelines_lock:
+                self._compiling[message["name"]] = self._compiling.get(message["name"], 0) + 1
+            threading.Thread(target=self._compile_timeline, args=(message["name"], cues), daemon=True).start()
+        elif action == "start":
+            name = message.get("name")
+            with self._timelines_lock:
+                compiled = self._timelines.get(name)
+                compiling = name in self._compiling
+            if compiled is None and not compiling:
+                raise ValueError(f"No compiled timeline {name!r}")
+            if self.loop is None:
+                raise ValueError("Shows can only be played on an event loop")
+            self._cancel_show()
+            start = when if when is not None else time.monotonic()
+            if compiling:
+                # the timeline was just uploaded, the show starts as soon as it is compiled
+                self._pending_show = (name, start)
+                self.logger.info(f"Starting show {name} once its timeline is compiled")
+            else:
+                self._play_show(name, compiled, start)
+        else:
+            self._cancel_show()
+        self.metrics.count("messages")
+
+    def _compile_timeline(self, name: str, cues: List[Tuple[float, Dict[str, Any]]]):
+        """Compile the cues of this listener's device, replacing an earlier timeline of the same name."""
+        try:
+            with self.metrics.measure("compile"):
+                compiled = [(offset, self.compile_cue(cue)) for offset, cue in cues
+                            if self._subscribed(wireprotocol.TOPICS[cue["action"]])]
+        except Exception as error:
+            self.metrics.count("errors")
+            self.logger.error(f"Error compiling timeline {name}: {error}")
+            compiled = None
+        with self._timelines_lock:
+            if compiled is not None:
+                self._timelines[name] = compiled
+            self._compiling[name] -= 1
+            if not self._compiling[name]:
+                del self._compiling[name]
+        if compiled is not None:
+            self.logger.info(f"Compiled timeline {name} with {len(compiled)} cues")
+        if self.loop is not None:
+            self.loop.call_later(0, self._timeline_compiled, name, compiled is not None)
+
+    def _timeline_compiled(self, name: str, success: bool):
+        """Start the show waiting for the timeline, called on the loop thread once it is compiled."""
+        if self._pending_show is None or self._pending_show[0] != name:
+            return
+        with self._timelines_lock:
+            if name in self._compiling:
+                return  # a newer upload of the timeline is still compiling, the show waits for that one
+            compiled = self._timelines.get(name)
+        _, start = self._pending_show
+        self._pending_show = None
+        if not success:
+            self.metrics.count("errors")
+            self.logger.error(f"Not starting show {name}, its timeline failed to compile")
+            return
+        self._play_show(name, compiled, start)
+
+    def _play_show(self, name: str, compiled: List[Tuple[float, Callable[[], None]]], start: float):
+        """Schedule the cues of a compiled timeline, cues whose time already passed fire right away."""
+        self._show_timers = [self.loop.call_at(start + offset, self._run_scheduled, start + offset, play)
+                             for offset, play in compiled]
+        self.logger.info(f"Starting show {name} with {len(compiled)} cues")
+
+    def _cancel_show(self):
+        for timer in self._show_timers:
+            timer.cancel()
+        self._show_timers = []
+        self._pending_show = None
+
+    def _subscribed(self, topic: str) -> bool:
+        return any(topic.startswith(prefix) for prefix in self.SUBSCRIPTIONS)
+
+    def compile_cue(self, cue: Dict[str, Any]) -> Callable[[], None]:
+        """
+        Prepare a cue of a timeline for playing, called once when the timeline arrives (on a separate thread).
+        Subclasses validate and render what they can up front, by default the cue is processed when played.
+        :raises ValueError: for invalid cues, the timeline is rejected then
+        :return: plays the cue, called by the event loop at the time of the cue
+        """
+        return partial(self.process, cue)
 
-    def _listen_for_messages(self):
+    def finish_trace(self, trace: Dict[str, Any], hop: str):
         """
-        Main loop to listen for messages and handle them.
+        Stamp the last hop of a trace, record its hop latencies and write it to the trace log.
+        Subclasses that render asynchronously defer the trace in process (tracing.defer) and finish it here.
+        :param trace: the trace of a message
+        :param hop: name of the last hop
         """
-        while True:
+        trace.pop("deferred", None)
+        tracing.stamp({tracing.TRACE_KEY: trace}, hop)
+        for name, latency in tracing.hop_latencies(trace):
+            self.metrics.record(f"hop {name}", latency)
+        if self.trace_log:
             try:
-                message = self.socket.recv_json()
-                self.logger.info(f"Received message: {message}")
-                self.process(message)
-            except Exception as error:
-                self.logger.error(f"Error handling message: {error}")
+                self.trace_log.write(trace)
+            except OSError as error:
+                self.logger.error(f"Error writing trace: {error}")
 
     @abstractmethod
     def process(self, message: dict):
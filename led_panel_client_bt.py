@@ -2,25 +2,39 @@
 # -*- coding: utf-8 -*-
 import logging
 import zmq
+from eies_protocol import tracing, wireprotocol
 from bt_client import Listener
 
+DEFAULT_SNDHWM = 100
+
 
 class LedPanelClient(Listener):
     """
     Gets Data over Bluetooth and retransmits them via zmq (locally)
     """
 
-    def __init__(self, loglevel=logging.DEBUG):
+    def __init__(self, loglevel=logging.DEBUG, sndhwm=DEFAULT_SNDHWM):
+        """
+        :param sndhwm: messages queued per listener before further ones are dropped
+        """
         super().__init__(loglevel=loglevel)
         self.zmq_socket = None
+        self.sndhwm = sndhwm
+        self._sequences = {}
 
     def payload(self, data):
         super().payload(data)
-        self.zmq_socket.send_string(data)
+        data = tracing.stamp_json(data, "zmq_publish")
+        # the topic lets ZMQ deliver each message only to the listeners subscribed to its device,
+        # the sequence per topic lets them count dropped messages
+        topic = wireprotocol.topic(data)
+        sequence = self._sequences[topic] = self._sequences.get(topic, 0) + 1
+        self.zmq_socket.send_multipart([topic, wireprotocol.SEQUENCE.pack(sequence), data])
 
     def payload_setup(self):
         context = zmq.Context()
         self.zmq_socket = context.socket(zmq.PUB)
+        self.zmq_socket.setsockopt(zmq.SNDHWM, self.sndhwm)
         self.zmq_socket.bind("tcp://127.0.0.1:5555")
 
         self.logger.info("ZMQ Server: established")
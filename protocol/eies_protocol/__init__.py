@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+Messages shared by the Bluetooth server, the Bluetooth client and the emotion listeners:
+the emotions, the wire format and topics of the cues, timelines of shows and the traces of cues.
+"""
+
+__version__ = "0.1.1"
+__author__ = "Volker Göhler volker.goehler@informatik.tu-freiberg.de"
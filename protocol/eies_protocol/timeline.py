@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Timelines of a whole show, uploaded once and played locally by the listeners from a start trigger.
+
+    {"action": "timeline", "name": "show", "cues": [{"offset": 0, "action": "draw", "emotion": "fear"},
+                                                    {"offset": 0, "action": "play", "emotion": "fear", "duration": 5},
+                                                    {"offset": 5000, "action": "draw", "emotion": "happiness"}]}
+    {"action": "start", "name": "show", "at": 1767225600.0}
+    {"action": "cancel"}
+
+offsets are milliseconds after the start, the start is scheduled like any cue ("at" or "delay").
+Every listener compiles the cues for its device when the timeline arrives, so playing them needs no parsing,
+validating or rendering anymore.
+"""
+from typing import Any, Dict, List, Tuple
+
+from eies_protocol import wireprotocol
+
+SHOW_ACTIONS = ("timeline", "start", "cancel")
+MAX_CUES = 10000
+
+
+def parse(message: Dict[str, Any]) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    Validate the cues of a timeline message.
+    :return: (seconds after the start, cue without its offset) sorted by their offset
+    :raises ValueError: for a timeline without name, too many cues or malformed cues
+    """
+    if not isinstance(message.get("name"), str):
+        raise ValueError("A timeline needs a name")
+    cues = message.get("cues")
+    if not isinstance(cues, list) or len(cues) > MAX_CUES:
+        raise ValueError(f"A timeline needs a list of at most {MAX_CUES} cues")
+    parsed = []
+    for cue in cues:
+        if not isinstance(cue, dict):
+            raise ValueError(f"Cue {cue!r} is not an object")
+        offset = cue.get("offset")
+        if not isinstance(offset, (int, float)) or isinstance(offset, bool) or offset < 0:
+            raise ValueError(f"Cue {cue} needs a non-negative offset in milliseconds")
+        if cue.get("action") not in wireprotocol.TOPICS or cue.get("action") in SHOW_ACTIONS:
+            raise ValueError(f"Cue {cue} has no playable action")
+        if any(key in cue for key in wireprotocol.SCHEDULE_KEYS):
+            raise ValueError(f"Cue {cue} is scheduled by its offset, not by {wireprotocol.SCHEDULE_KEYS}")
+        parsed.append((offset / 1000, {key: value for key, value in cue.items() if key != "offset"}))
+    parsed.sort(key=lambda item: item[0])
+    return parsed
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end tracing of cues through REST -> Bluetooth -> ZMQ -> renderer.
+A traced message carries {"trace": {"id": "...", "hops": [["rest", 1712345678.123], ...]}},
+every component appends its hop with a wall clock timestamp.
+Hops on different machines are only comparable if their clocks are synchronized (e.g. NTP).
+"""
+import json
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+TRACE_KEY = "trace"
+_TRACE_MARKER = f'"{TRACE_KEY}"'
+
+# the hops in the order a cue passes them
+HOPS = ("rest", "bt_send", "bt_receive", "zmq_publish", "zmq_receive", "processed", "rendered")
+
+
+def start(message: Dict[str, Any], trace_id: Optional[str] = None, hop: str = "rest") -> Dict[str, Any]:
+    """
+    Attach a new trace to the message and stamp the first hop.
+    :param message: the message to trace
+    :param trace_id: id of the trace, a random one is generated if not given
+    :param hop: name of the first hop
+    """
+    message[TRACE_KEY] = {"id": trace_id or uuid.uuid4().hex[:16], "hops": []}
+    return stamp(message, hop)
+
+
+def stamp(message: Dict[str, Any], hop: str) -> Dict[str, Any]:
+    """Append the hop to the trace of the message, untraced messages are left alone."""
+    trace = message.get(TRACE_KEY)
+    if isinstance(trace, dict):
+        trace.setdefault("hops", []).append([hop, time.time()])
+    return message
+
+
+def stamp_json(data: Union[str, bytes], hop: str) -> Union[str, bytes]:
+    """
+    Stamp the hop into a JSON encoded message.
+    Only traced messages are decoded, everything else (including non JSON data) is returned as is.
+    """
+    marker = _TRACE_MARKER.encode() if isinstance(data, bytes) else _TRACE_MARKER
+    if marker not in data:
+        return data
+    try:
+        message = json.loads(data)
+    except ValueError:
+        return data
+    if not isinstance(message, dict):
+        return data
+    stamped = json.dumps(stamp(message, hop))
+    return stamped.encode("utf-8") if isinstance(data, bytes) else stamped
+
+
+def defer(message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Mark the trace of the message to be finished later by the renderer.
+    :return: the trace or None if the message is not traced
+    """
+    trace = message.get(TRACE_KEY)
+    if not isinstance(trace, dict):
+        return None
+    trace["deferred"] = True
+    return trace
+
+
+def hop_latencies(trace: Dict[str, Any]) -> List[Tuple[str, float]]:
+    """
+    Return the latency between consecutive hops and from the first to the last one in seconds.
+    :return: [("rest->bt_send", 0.001), ..., ("total", 0.05)]
+    """
+    hops = trace.get("hops", [])
+    latencies = [(f"{previous[0]}->{current[0]}", current[1] - previous[1])
+                 for previous, current in zip(hops, hops[1:])]
+    if len(hops) > 1:
+        latencies.append(("total", hops[-1][1] - hops[0][1]))
+    return latencies
+
+
+class TraceLog:
+    """
+    Appends finished traces as JSON lines to a file, which tracereport.py evaluates.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, trace: Dict[str, Any]):
+        line = json.dumps(trace) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as trace_file:
+                trace_file.write(line)
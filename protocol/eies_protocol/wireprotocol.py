@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary encoding of cues, the alternative to JSON text on the Bluetooth link and ZMQ.
+
+A binary cue is a fixed 12 byte record:
+
+    version (1) | flags (1) | action (1) | emotion (1) | duration (2) | fade_time (2) |
+    transition (2) | brightness (1) | easing (1)
+
+integers are unsigned big endian, flags mark which of the optional fields are present.
+JSON messages start with "{", so the first byte tells the two encodings apart.
+Messages that do not fit the record (unknown actions or keys, traced messages, out of range values)
+are sent as JSON.
+"""
+import json
+import struct
+from typing import Any, Dict, Union
+
+from eies_protocol.emotions import Emotion
+
+VERSION = 1
+RECORD = struct.Struct(">BBBBHHHBB")
+
+ACTIONS = {"draw": 1, "play": 2, "stop": 3}
+# codes are part of the protocol, new emotions get new codes
+EMOTIONS = {
+    Emotion.FEAR: 1,
+    Emotion.HAPPINESS: 2,
+    Emotion.DISGUST: 3,
+    Emotion.ANGER: 4,
+    Emotion.SURPRISE: 5,
+    Emotion.NEUTRAL: 6,
+    Emotion.SADNESS: 7,
+    Emotion.CONTEMPT: 8,
+}
+EASINGS = {"linear": 1, "ease_in_out": 2}
+
+# ZMQ topic of each action, listeners subscribe to the prefix of their device (e.g. "led.")
+TOPICS = {"draw": "led.draw", "configure": "led.configure", "play": "sound.play", "stop": "sound.stop",
+          "timeline": "show.timeline", "start": "show.start", "cancel": "show.cancel"}
+UNROUTED_TOPIC = "unrouted"
+# cues scheduled with "at" (unix time in seconds, the clocks of the devices are synchronized) or "delay"
+# (milliseconds after reception) get an own topic, so they are never conflated with the cues to run right away
+SCHEDULE_KEYS = ("at", "delay")
+SCHEDULED_TOPIC = "scheduled"
+# ZMQ messages are [topic, sequence, message], the sequence counts per topic so listeners can detect drops
+SEQUENCE = struct.Struct(">Q")
+
+# optional fields in record order: (key, flag, maximum value)
+_FIELDS = (
+    ("duration", 0x01, 0xFFFF),
+    ("fade_time", 0x02, 0xFFFF),
+    ("transition", 0x04, 0xFFFF),
+    ("brightness", 0x08, 0xFF),
+)
+_EASING_FLAG = 0x10
+_EMOTION_FLAG = 0x20
+_KEYS = {"action", "emotion", "easing"} | {key for key, _, _ in _FIELDS}
+
+_ACTION_NAMES = {code: name for name, code in ACTIONS.items()}
+_EMOTION_NAMES = {code: emotion.value for emotion, code in EMOTIONS.items()}
+_EASING_NAMES = {code: name for name, code in EASINGS.items()}
+_EMOTION_CODES = {emotion.value: code for emotion, code in EMOTIONS.items()}
+
+
+def _fits(value: Any, maximum: int) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= maximum
+
+
+def encode_binary(message: Dict[str, Any]) -> bytes:
+    """
+    Encode the message as binary record.
+    :raises ValueError: if the message can not be represented, see encode for a fallback to JSON
+    """
+    if not set(message) <= _KEYS:
+        raise ValueError(f"Keys {sorted(set(message) - _KEYS)} have no binary encoding")
+    if message.get("action") not in ACTIONS:
+        raise ValueError(f"Action {message.get('action')!r} has no binary encoding")
+    flags = 0
+    values = []
+    for key, flag, maximum in _FIELDS:
+        value = message.get(key)
+        if key in message:
+            if not _fits(value, maximum):
+                raise ValueError(f"{key} {value!r} does not fit into the binary record")
+            flags |= flag
+        values.append(value or 0)
+    emotion = 0
+    if "emotion" in message:
+        if message["emotion"] not in _EMOTION_CODES:
+            raise ValueError(f"Emotion {message['emotion']!r} has no binary encoding")
+        emotion = _EMOTION_CODES[message["emotion"]]
+        flags |= _EMOTION_FLAG
+    easing = 0
+    if "easing" in message:
+        if message["easing"] not in EASINGS:
+            raise ValueError(f"Easing {message['easing']!r} has no binary encoding")
+        easing = EASINGS[message["easing"]]
+        flags |= _EASING_FLAG
+    duration, fade_time, transition, brightness = values
+    return RECORD.pack(VERSION, flags, ACTIONS[message["action"]], emotion,
+                       duration, fade_time, transition, brightness, easing)
+
+
+def decode_binary(data: bytes) -> Dict[str, Any]:
+    """
+    Decode a binary record into the message dict it was encoded from.
+    :raises ValueError: on an unknown version, a wrong length or unknown codes
+    """
+    if len(data) != RECORD.size:
+        raise ValueError(f"Binary cue has {len(data)} bytes, expected {RECORD.size}")
+    version, flags, action, emotion, duration, fade_time, transition, brightness, easing = RECORD.unpack(data)
+    if version != VERSION:
+        raise ValueError(f"Unsupported wire protocol version {version}")
+    if action not in _ACTION_NAMES:
+        raise ValueError(f"Unknown action code {action}")
+    message: Dict[str, Any] = {"action": _ACTION_NAMES[action]}
+    if flags & _EMOTION_FLAG:
+        if emotion not in _EMOTION_NAMES:
+            raise ValueError(f"Unknown emotion code {emotion}")
+        message["emotion"] = _EMOTION_NAMES[emotion]
+    for (key, flag, _), value in zip(_FIELDS, (duration, fade_time, transition, brightness)):
+        if flags & flag:
+            message[key] = value
+    if flags & _EASING_FLAG:
+        if easing not in _EASING_NAMES:
+            raise ValueError(f"Unknown easing code {easing}")
+        message["easing"] = _EASING_NAMES[easing]
+    return message
+
+
+def encode(message: Dict[str, Any]) -> bytes:
+    """Encode the message as binary record if possible, as JSON otherwise."""
+    try:
+        return encode_binary(message)
+    except ValueError:
+        return json.dumps(message).encode("utf-8")
+
+
+def decode(data: Union[str, bytes]) -> Dict[str, Any]:
+    """
+    Decode a message in either encoding.
+    :raises ValueError: if the data is neither a binary cue nor a JSON object
+    """
+    if isinstance(data, bytes) and data[:1] == bytes([VERSION]):
+        return decode_binary(data)
+    message = json.loads(data)
+    if not isinstance(message, dict):
+        raise ValueError(f"Expected a JSON object, got {type(message).__name__}")
+    return message
+
+
+def topic(data: Union[str, bytes]) -> bytes:
+    """
+    Return the ZMQ topic of an encoded message, binary cues are routed without decoding them.
+    Messages without a known action get UNROUTED_TOPIC. Messages addressing a zone of a panel wall get
+    a topic per zone (e.g. "led.draw.left"), so conflating listeners keep the newest message of every zone.
+    Scheduled messages get the SCHEDULED_TOPIC suffix (e.g. "led.draw.scheduled.left").
+    """
+    zone = None
+    scheduled = False
+    if isinstance(data, bytes) and data[:1] == bytes([VERSION]) and len(data) == RECORD.size:
+        action = _ACTION_NAMES.get(data[2])
+    else:
+        try:
+            message = json.loads(data)
+        except ValueError:
+            message = None
+        action = message.get("action") if isinstance(message, dict) else None
+        if action in TOPICS:
+            zone = message.get("zone")
+            scheduled = any(key in message for key in SCHEDULE_KEYS)
+    name = TOPICS.get(action, UNROUTED_TOPIC)
+    if scheduled:
+        name = f"{name}.{SCHEDULED_TOPIC}"
+    return (f"{name}.{zone}" if isinstance(zone, str) else name).encode("utf-8")
+
+
+def compact(data: Union[str, bytes]) -> bytes:
+    """
+    Re-encode a JSON encoded message as binary record if it fits, everything else is returned as is.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if data[:1] != b"{":
+        return data
+    try:
+        message = json.loads(data)
+        return encode_binary(message) if isinstance(message, dict) else data
+    except ValueError:
+        return data